@@ -0,0 +1,138 @@
+import re
+from dataclasses import asdict, dataclass
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple
+
+_TOKEN_RE = re.compile(r"\S+")
+# Uma sentença termina em pontuação final seguida de espaço, ou em uma quebra de linha dupla.
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+|\n\s*\n")
+
+
+@dataclass
+class Chunk:
+    """Um trecho de um documento, com a origem e os offsets (em caracteres) no arquivo."""
+    text: str
+    source: str
+    start: int
+    end: int
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+def _token_spans(text: str) -> List[Tuple[int, int]]:
+    return [m.span() for m in _TOKEN_RE.finditer(text)]
+
+
+def _sentence_spans(text: str) -> List[Tuple[int, int]]:
+    """Divide o texto em sentenças, devolvendo os spans sem o espaço em branco das bordas."""
+    spans = []
+    start = 0
+    for match in _SENTENCE_END_RE.finditer(text):
+        spans.append((start, match.start()))
+        start = match.end()
+    spans.append((start, len(text)))
+    return [(s, e) for s, e in spans if text[s:e].strip()]
+
+
+def chunk_by_tokens(text: str, source: str, chunk_size: int, overlap: int) -> Iterator[Chunk]:
+    """Janelas deslizantes de `chunk_size` tokens (palavras), com `overlap` tokens repetidos."""
+    spans = _token_spans(text)
+    step = max(1, chunk_size - overlap)
+    for first in range(0, len(spans), step):
+        window = spans[first:first + chunk_size]
+        start, end = window[0][0], window[-1][1]
+        yield Chunk(text[start:end], source, start, end)
+        if first + chunk_size >= len(spans):
+            break
+
+
+def _split_long_sentences(text: str, spans: List[Tuple[int, int]], chunk_size: int) -> List[Tuple[int, int, int]]:
+    """(início, fim, tokens) de cada sentença; as com mais de `chunk_size` tokens viram pedaços de até `chunk_size`."""
+    pieces = []
+    for start, end in spans:
+        tokens = [(start + s, start + e) for s, e in _token_spans(text[start:end])]
+        for first in range(0, len(tokens), chunk_size):
+            window = tokens[first:first + chunk_size]
+            pieces.append((window[0][0], window[-1][1], len(window)))
+    return pieces
+
+
+def chunk_by_sentences(text: str, source: str, chunk_size: int, overlap: int) -> Iterator[Chunk]:
+    """
+    Agrupa sentenças inteiras até `chunk_size` tokens. Cada chunk seguinte repete as
+    últimas sentenças do anterior que somam até `overlap` tokens. Uma sentença maior
+    que `chunk_size` é cortada em pedaços de até `chunk_size` tokens.
+    """
+    sentences = _split_long_sentences(text, _sentence_spans(text), chunk_size)
+    first = 0
+    while first < len(sentences):
+        last = first
+        tokens = sentences[first][2]
+        while last + 1 < len(sentences) and tokens + sentences[last + 1][2] <= chunk_size:
+            last += 1
+            tokens += sentences[last][2]
+
+        start, end = sentences[first][0], sentences[last][1]
+        yield Chunk(text[start:end], source, start, end)
+        if last + 1 >= len(sentences):
+            break
+
+        # Recua a partir do fim da janela enquanto o overlap couber, sem voltar ao início.
+        next_first = last + 1
+        repeated = 0
+        while next_first - 1 > first and repeated + sentences[next_first - 1][2] <= overlap:
+            next_first -= 1
+            repeated += sentences[next_first][2]
+        first = next_first
+
+
+def fit_chunk(chunk: Chunk, count_tokens: Callable[[str], int], max_tokens: int) -> Iterator[Chunk]:
+    """
+    Divide o chunk ao meio (por palavras) até cada parte ter no máximo `max_tokens`
+    tokens do modelo, segundo `count_tokens`. Uma única palavra maior que o limite
+    não é cortada.
+    """
+    spans = _token_spans(chunk.text)
+    if len(spans) <= 1 or count_tokens(chunk.text) <= max_tokens:
+        yield chunk
+        return
+    middle = spans[len(spans) // 2][0]
+    for start, end in ((0, spans[len(spans) // 2 - 1][1]), (middle, len(chunk.text))):
+        yield from fit_chunk(Chunk(chunk.text[start:end], chunk.source, chunk.start + start, chunk.start + end), count_tokens, max_tokens)
+
+
+def chunk_text(
+    text: str,
+    source: str,
+    chunk_size: int,
+    overlap: int,
+    strategy: str = "tokens",
+    count_tokens: Optional[Callable[[str], int]] = None,
+    max_tokens: Optional[int] = None,
+) -> Iterator[Chunk]:
+    """
+    Divide o texto com a estratégia dada. `chunk_size` e `overlap` contam palavras; com
+    `count_tokens` e `max_tokens` (o tokenizador e o limite do modelo de embeddings), os
+    chunks que passariam do limite do modelo são divididos, em vez de truncados por ele.
+    """
+    if strategy == "tokens":
+        chunks = chunk_by_tokens(text, source, chunk_size, overlap)
+    elif strategy == "sentences":
+        chunks = chunk_by_sentences(text, source, chunk_size, overlap)
+    else:
+        raise ValueError(f"Estratégia de chunking desconhecida: '{strategy}'. Use 'tokens' ou 'sentences'.")
+    if count_tokens is None or max_tokens is None:
+        return chunks
+    return (piece for chunk in chunks for piece in fit_chunk(chunk, count_tokens, max_tokens))
+
+
+def batched(items: Iterable, batch_size: int) -> Iterator[list]:
+    """Agrupa um iterável em listas de até `batch_size` itens, sem materializá-lo inteiro."""
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
@@ -12,5 +12,125 @@ LLM_MODEL_NAME = os.getenv("LLM_MODEL_NAME", "CodeActAgent-Mistral-7b-v0.1")
 # URL para o executor de código (serviço 'code-executor' no docker-compose)
 JUPYTER_GATEWAY_URL = os.getenv("JUPYTER_GATEWAY_URL", "http://code-executor:8888")
 
+# Prazo total (em segundos) de uma execução de código antes de o kernel ser interrompido.
+JUPYTER_EXECUTION_TIMEOUT = float(os.getenv("JUPYTER_EXECUTION_TIMEOUT", "600"))
+# Tempo máximo (em segundos) sem nenhuma mensagem do kernel durante uma execução.
+JUPYTER_IDLE_TIMEOUT = float(os.getenv("JUPYTER_IDLE_TIMEOUT", "120"))
+
+# Limites da saída (por stream) de uma execução que é devolvida ao agente como observação.
+OUTPUT_MAX_BYTES = int(os.getenv("OUTPUT_MAX_BYTES", "8000"))
+OUTPUT_MAX_LINES = int(os.getenv("OUTPUT_MAX_LINES", "200"))
+# Diretório (no host) onde saídas que estouram os limites são salvas por completo.
+# O workspace do host é montado em /home/jovyan/work no code-executor, por isso o
+# mesmo arquivo é informado ao agente pelo caminho visto de dentro do kernel.
+OUTPUT_SPILL_DIR = os.getenv("OUTPUT_SPILL_DIR", "./workspace/.outputs")
+OUTPUT_SPILL_KERNEL_DIR = os.getenv("OUTPUT_SPILL_KERNEL_DIR", "/home/jovyan/work/.outputs")
+
+# Índice (no host) do diretório de cada sessão no workspace montado no kernel: após cada
+# execução, os arquivos criados, alterados ou apagados são resumidos na observação.
+WORKSPACE_INDEX = os.getenv("WORKSPACE_INDEX", "true").lower() in ("1", "true", "yes")
+WORKSPACE_DIR = os.getenv("WORKSPACE_DIR", "./workspace")
+# O mesmo diretório visto de dentro do kernel. Cada sessão do SessionManager trabalha
+# em um subdiretório próprio (`<sessão>`) dele, nos dois lados.
+WORKSPACE_KERNEL_DIR = os.getenv("WORKSPACE_KERNEL_DIR", "/home/jovyan/work")
+# Arquivos de texto até este tamanho (em bytes) têm o diff mostrado; acima, só o tamanho.
+WORKSPACE_DIFF_MAX_BYTES = int(os.getenv("WORKSPACE_DIFF_MAX_BYTES", "4096"))
+# Linhas máximas do resumo de mudanças, arquivos indexados e bytes lidos por `read_range`.
+WORKSPACE_SUMMARY_MAX_LINES = int(os.getenv("WORKSPACE_SUMMARY_MAX_LINES", "40"))
+WORKSPACE_MAX_FILES = int(os.getenv("WORKSPACE_MAX_FILES", "10000"))
+WORKSPACE_READ_MAX_BYTES = int(os.getenv("WORKSPACE_READ_MAX_BYTES", "8000"))
+
 # Chave de API (pode ser um valor fictício, pois estamos em um ambiente local)
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY", "dummy-key")
+
+# Conexões HTTP simultâneas (e mantidas abertas) com o servidor LLM, compartilhadas pelos agentes.
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+# Tempo máximo (em segundos) de leitura de uma resposta do servidor LLM.
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "300"))
+# Requisições simultâneas ao servidor LLM (somando todas as sessões); as demais aguardam na fila.
+LLM_MAX_INFLIGHT = int(os.getenv("LLM_MAX_INFLIGHT", "16"))
+
+# Sessões de agente simultâneas (SessionManager): total em execução, por usuário e na fila.
+SESSION_MAX_CONCURRENT = int(os.getenv("SESSION_MAX_CONCURRENT", "8"))
+SESSION_MAX_PER_USER = int(os.getenv("SESSION_MAX_PER_USER", "2"))
+SESSION_MAX_QUEUED = int(os.getenv("SESSION_MAX_QUEUED", "32"))
+# Intervalo mínimo (em segundos) entre atualizações do log de uma sessão na interface Gradio.
+UI_UPDATE_INTERVAL = float(os.getenv("UI_UPDATE_INTERVAL", "0.25"))
+
+# Orçamento de tokens do prompt enviado ao LLM. Deve deixar folga para a resposta
+# dentro do `--max-model-len` do vLLM (4096 no docker-compose).
+LLM_CONTEXT_BUDGET = int(os.getenv("LLM_CONTEXT_BUDGET", "3072"))
+# Diretório com o tokenizador do modelo, usado para contar tokens (o mesmo servido pelo vLLM).
+LLM_TOKENIZER_PATH = os.getenv("LLM_TOKENIZER_PATH", "./model")
+# Ciclos (código + observação) mais recentes enviados na íntegra; os anteriores são resumidos.
+CONTEXT_KEEP_LAST_TURNS = int(os.getenv("CONTEXT_KEEP_LAST_TURNS", "4"))
+
+# Cache de gravação/reprodução de chamadas ao LLM e ao kernel (ReplayCache).
+# "passthrough" (desligado), "record" (grava as chamadas reais) ou "replay" (só responde do cache).
+REPLAY_MODE = os.getenv("REPLAY_MODE", "passthrough")
+REPLAY_CACHE_PATH = os.getenv("REPLAY_CACHE_PATH", "./.replay/cache.sqlite")
+# Tamanho máximo (em bytes) do cache; as entradas usadas há mais tempo são removidas primeiro.
+REPLAY_CACHE_MAX_BYTES = int(os.getenv("REPLAY_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+# Observabilidade (agent_src/telemetry.py).
+# Nível dos logs do agente (DEBUG, INFO, WARNING...).
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+# Arquivo JSONL onde cada span (fase do agente) é gravado; vazio desliga o exportador.
+TRACE_FILE = os.getenv("TRACE_FILE", "")
+# Porta do endpoint `/metrics` no formato do Prometheus; 0 desliga o servidor.
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+
+# Pool de kernels pré-aquecidos (KernelPool)
+# Quantidade de kernels ociosos mantidos prontos para uso.
+KERNEL_POOL_MIN_IDLE = int(os.getenv("KERNEL_POOL_MIN_IDLE", "2"))
+# Número máximo de kernels (ociosos + emprestados) que o pool pode manter no gateway.
+KERNEL_POOL_MAX_SIZE = int(os.getenv("KERNEL_POOL_MAX_SIZE", "8"))
+# Tempo (em segundos) após o qual kernels ociosos excedentes são desligados.
+KERNEL_POOL_IDLE_TTL = float(os.getenv("KERNEL_POOL_IDLE_TTL", "600"))
+# Código executado em cada kernel novo (e após cada reset) para pré-carregar bibliotecas pesadas.
+KERNEL_POOL_PRELOAD = os.getenv("KERNEL_POOL_PRELOAD", "import pandas as pd\nimport numpy as np")
+
+# Ingestão da base de conhecimento (KnowledgeBase)
+# Tamanho de cada chunk e sobreposição entre chunks consecutivos, em tokens (palavras).
+# Chunks que passam do limite do modelo (256 wordpieces no all-MiniLM-L6-v2, ~1,5 por
+# palavra em português) são divididos, por isso o padrão fica abaixo dele.
+KB_CHUNK_SIZE = int(os.getenv("KB_CHUNK_SIZE", "100"))
+KB_CHUNK_OVERLAP = int(os.getenv("KB_CHUNK_OVERLAP", "20"))
+# "tokens" (janela deslizante de palavras) ou "sentences" (agrupa sentenças inteiras).
+KB_CHUNK_STRATEGY = os.getenv("KB_CHUNK_STRATEGY", "tokens")
+# Quantidade de chunks codificados e adicionados ao índice por vez.
+KB_ENCODE_BATCH_SIZE = int(os.getenv("KB_ENCODE_BATCH_SIZE", "64"))
+
+# Tipo de índice vetorial: "flat" (exato), "ivf_flat", "ivf_pq" ou "hnsw".
+KB_INDEX_TYPE = os.getenv("KB_INDEX_TYPE", "flat")
+# "l2" (distância euclidiana) ou "ip" (produto interno sobre vetores normalizados).
+KB_INDEX_METRIC = os.getenv("KB_INDEX_METRIC", "l2")
+# Parâmetros dos índices IVF: número de listas, listas visitadas por busca e subquantizadores do PQ.
+KB_INDEX_NLIST = int(os.getenv("KB_INDEX_NLIST", "1024"))
+KB_INDEX_NPROBE = int(os.getenv("KB_INDEX_NPROBE", "16"))
+KB_INDEX_PQ_M = int(os.getenv("KB_INDEX_PQ_M", "16"))
+# Parâmetros do HNSW: vizinhos por nó e largura da busca.
+KB_INDEX_HNSW_M = int(os.getenv("KB_INDEX_HNSW_M", "32"))
+KB_INDEX_EF_SEARCH = int(os.getenv("KB_INDEX_EF_SEARCH", "64"))
+# Quantidade de vetores usada para treinar índices IVF.
+KB_INDEX_TRAIN_SAMPLE = int(os.getenv("KB_INDEX_TRAIN_SAMPLE", "50000"))
+
+# Cache (LRU com TTL, em segundos) de embeddings de consultas e de resultados de busca.
+KB_QUERY_CACHE_SIZE = int(os.getenv("KB_QUERY_CACHE_SIZE", "1024"))
+KB_QUERY_CACHE_TTL = float(os.getenv("KB_QUERY_CACHE_TTL", "3600"))
+
+# Recuperação: "vector" (só FAISS), "lexical" (só BM25) ou "hybrid" (os dois, combinados por RRF).
+KB_RETRIEVAL = os.getenv("KB_RETRIEVAL", "hybrid")
+# Constante da fusão por posição recíproca (reciprocal-rank fusion) e candidatos de cada busca antes da fusão.
+KB_RRF_K = int(os.getenv("KB_RRF_K", "60"))
+KB_RETRIEVAL_CANDIDATES = int(os.getenv("KB_RETRIEVAL_CANDIDATES", "20"))
+# Se > 0, a busca vetorial fica restrita aos N melhores chunks do BM25 (sem resultado lexical, busca em todos).
+KB_LEXICAL_PREFILTER = int(os.getenv("KB_LEXICAL_PREFILTER", "0"))
+
+# Intervalo (em segundos) entre verificações do diretório de conhecimento por `start_watching()`.
+KB_WATCH_INTERVAL = float(os.getenv("KB_WATCH_INTERVAL", "5"))
+
+# A KnowledgeBase carrega índice e modelo de embeddings na primeira busca. Com KB_WARMUP,
+# a interface já começa a carregá-los em uma thread de fundo ao iniciar.
+KB_WARMUP = os.getenv("KB_WARMUP", "true").lower() in ("1", "true", "yes")
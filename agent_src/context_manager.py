@@ -0,0 +1,270 @@
+import logging
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from .config import CONTEXT_KEEP_LAST_TURNS, LLM_CONTEXT_BUDGET, LLM_TOKENIZER_PATH
+from .lru_cache import LRUCache
+from .workspace_index import CHANGES_HEADER
+
+logger = logging.getLogger(__name__)
+
+# Tokens extras por mensagem gastos pelo template de chat (marcadores de papel, separadores).
+MESSAGE_OVERHEAD = 4
+# Caracteres por token usados quando não há tokenizador local disponível (estimativa conservadora).
+CHARS_PER_TOKEN = 3.0
+SUMMARY_HEADER = "[RESUMO DOS CICLOS ANTERIORES]"
+SUMMARY_FOOTER = "[FIM DO RESUMO]"
+
+
+class TokenCounter:
+    """
+    Conta tokens com o tokenizador local do modelo (o mesmo diretório servido pelo vLLM).
+    Sem tokenizador disponível, recorre a uma estimativa por número de caracteres.
+    O tokenizador (e o transformers) só é carregado na primeira contagem.
+    """
+    def __init__(self, tokenizer_path: Optional[str] = LLM_TOKENIZER_PATH):
+        self.tokenizer_path = tokenizer_path
+        self._tokenizer = None
+        self._tokenizer_loaded = False
+        self._load_lock = threading.Lock()
+        self._cache = LRUCache(max_entries=4096, name="token_counts")
+
+    @property
+    def tokenizer(self):
+        if not self._tokenizer_loaded:
+            with self._load_lock:
+                if not self._tokenizer_loaded:
+                    self._tokenizer = self._load_tokenizer()
+                    self._tokenizer_loaded = True
+        return self._tokenizer
+
+    def _load_tokenizer(self):
+        if self.tokenizer_path and os.path.isdir(self.tokenizer_path):
+            try:
+                from transformers import AutoTokenizer
+                return AutoTokenizer.from_pretrained(self.tokenizer_path)
+            except Exception as e:
+                logger.warning("Não foi possível carregar o tokenizador de '%s': %s", self.tokenizer_path, e)
+        logger.info("Tokenizador local indisponível. Usando estimativa de tokens por caracteres.")
+        return None
+
+    def count(self, text: str) -> int:
+        cached = self._cache.get(text)
+        if cached is not None:
+            return cached
+        tokenizer = self.tokenizer
+        if tokenizer is not None:
+            tokens = len(tokenizer.encode(text, add_special_tokens=False))
+        else:
+            tokens = int(len(text) / CHARS_PER_TOKEN) + 1
+        self._cache.put(text, tokens)
+        return tokens
+
+    def count_messages(self, messages: List[Dict[str, str]]) -> int:
+        return sum(self.count(message["content"]) + MESSAGE_OVERHEAD for message in messages)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Reduz o texto a ~`max_tokens` tokens mantendo o início e o final."""
+        tokens = self.count(text)
+        if tokens <= max_tokens:
+            return text
+        keep = max(0, int(len(text) * max_tokens / tokens) - 40)
+        head, tail = text[:keep // 2], text[len(text) - keep // 2:]
+        return f"{head}\n[... {tokens - max_tokens} tokens omitidos ...]\n{tail}"
+
+
+def _first_line(text: str, limit: int = 120) -> str:
+    line = next((l.strip() for l in text.strip().splitlines() if l.strip()), "")
+    return line if len(line) <= limit else line[:limit] + "..."
+
+
+def _last_line(text: str, limit: int = 160) -> str:
+    lines = [l.strip() for l in text.strip().splitlines() if l.strip()]
+    line = lines[-1] if lines else ""
+    return line if len(line) <= limit else line[:limit] + "..."
+
+
+def _split_observation(observation: str) -> Tuple[str, str]:
+    """Separa o STDOUT e o STDERR de uma observação no formato usado pelo Agent."""
+    _, _, rest = observation.partition("STDOUT:\n")
+    stdout, _, stderr = rest.partition("\n\nSTDERR:\n")
+    stderr, _, _ = stderr.partition(f"\n\n{CHANGES_HEADER}")
+    return stdout, stderr
+
+
+class ContextManager:
+    """
+    Mantém as mensagens enviadas ao LLM dentro de um orçamento de tokens.
+
+    O prefixo (prompt do sistema, contexto da base de conhecimento e a mensagem com a
+    tarefa) e os últimos `keep_last_turns` ciclos (código + observação) são enviados
+    sem alteração. Ciclos mais antigos são dobrados em um resumo compacto — uma linha
+    por ciclo, com erros repetidos deduplicados e o estado atual do `todo.md` — anexado
+    à mensagem da tarefa, o que preserva a alternância user/assistant do template.
+
+    O número de ciclos resumidos só aumenta quando o orçamento estoura, e nesse caso
+    de uma vez até `low_watermark` do orçamento: entre essas ocasiões o prompt enviado
+    ao servidor só cresce no final.
+    """
+    def __init__(
+        self,
+        budget: int = LLM_CONTEXT_BUDGET,
+        keep_last_turns: int = CONTEXT_KEEP_LAST_TURNS,
+        counter: Optional[TokenCounter] = None,
+        low_watermark: float = 0.6,
+    ):
+        self.budget = budget
+        self.keep_last_turns = keep_last_turns
+        self.counter = counter or TokenCounter()
+        self.low_watermark = low_watermark
+        self.todo: Optional[str] = None
+        self.folded_turns = 0
+        self._summary: Optional[str] = None
+
+    @staticmethod
+    def _split(messages: List[Dict[str, str]]) -> Tuple[List[Dict[str, str]], List[List[Dict[str, str]]]]:
+        """Separa o prefixo fixo (até a primeira mensagem do usuário) dos ciclos seguintes."""
+        first_user = next((i for i, m in enumerate(messages) if m["role"] == "user"), len(messages) - 1)
+        prefix = messages[:first_user + 1]
+        rest = messages[first_user + 1:]
+        turns = [rest[i:i + 2] for i in range(0, len(rest), 2)]
+        return prefix, turns
+
+    def needs_refold(self, messages: List[Dict[str, str]]) -> bool:
+        """Indica se a próxima chamada a `compact` terá de resumir mais ciclos (e se vale atualizar `todo`)."""
+        return self.counter.count_messages(self._render(messages, self.folded_turns)) > self.budget
+
+    def compact(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Devolve as mensagens a enviar ao LLM, dentro do orçamento de tokens."""
+        rendered = self._render(messages, self.folded_turns)
+        if self.counter.count_messages(rendered) <= self.budget:
+            return rendered
+
+        _, turns = self._split(messages)
+        target = int(self.budget * self.low_watermark)
+        max_fold = max(self.folded_turns, len(turns) - 1)
+        fold = min(max_fold, max(self.folded_turns, len(turns) - self.keep_last_turns))
+        # Resume os ciclos mantidos até caber abaixo da marca inferior (sempre mantendo o último).
+        while fold < max_fold and self.counter.count_messages(self._render(messages, fold, rebuild=True)) > target:
+            fold += 1
+        self._set_fold(messages, fold)
+        rendered = self._render(messages, fold)
+        if self.counter.count_messages(rendered) <= self.budget:
+            return rendered
+        return self._shrink(rendered)
+
+    def _set_fold(self, messages: List[Dict[str, str]], fold: int):
+        if fold != self.folded_turns or self._summary is None:
+            _, turns = self._split(messages)
+            self.folded_turns = fold
+            self._summary = self._summarize(turns[:fold])
+            logger.debug("Contexto compactado: %d ciclos antigos resumidos.", fold)
+
+    def _render(self, messages: List[Dict[str, str]], fold: int, rebuild: bool = False) -> List[Dict[str, str]]:
+        if fold == 0:
+            return list(messages)
+        prefix, turns = self._split(messages)
+        summary = self._summarize(turns[:fold]) if rebuild or self._summary is None else self._summary
+        task = prefix[-1]
+        rendered = prefix[:-1] + [{"role": task["role"], "content": f"{task['content']}\n\n{summary}"}]
+        for turn in turns[fold:]:
+            rendered.extend(turn)
+        return rendered
+
+    def _summarize(self, turns: List[List[Dict[str, str]]]) -> str:
+        """Uma linha por ciclo resumido; ciclos consecutivos com o mesmo erro viram uma só linha."""
+        lines = []
+        previous_error = None
+        for number, turn in enumerate(turns, start=1):
+            code = turn[0]["content"].replace("```python", "").replace("```", "")
+            stdout, stderr = _split_observation(turn[1]["content"]) if len(turn) > 1 else ("", "")
+            error = _last_line(stderr) if stderr.strip() else None
+            if error is not None and error == previous_error:
+                first, count, _ = lines[-1]
+                lines[-1] = (first, count + 1, lines[-1][2])
+                continue
+            outcome = f"ERRO: {error}" if error else f"ok: {_first_line(stdout) or '(sem saída)'}"
+            lines.append((number, 1, f"`{_first_line(code, 80)}` -> {outcome}"))
+            previous_error = error
+
+        body = []
+        for first, count, text in lines:
+            label = f"Ciclo {first}" if count == 1 else f"Ciclos {first}-{first + count - 1} (mesmo erro {count}x)"
+            body.append(f"- {label}: {text}")
+
+        # O resumo também tem um teto, para não crescer indefinidamente em execuções longas.
+        max_summary_tokens = self.budget // 4
+        while len(body) > 1 and self.counter.count("\n".join(body)) > max_summary_tokens:
+            body.pop(0)
+        omitted = len(lines) - len(body)
+        if omitted:
+            body.insert(0, f"- ({omitted} entradas mais antigas omitidas)")
+
+        summary = [SUMMARY_HEADER, *body]
+        if self.todo:
+            summary += ["Estado atual de todo.md:", self.counter.truncate(self.todo.strip(), self.budget // 8)]
+        summary.append(SUMMARY_FOOTER)
+        return "\n".join(summary)
+
+    def _shrink(self, rendered: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Último recurso: trunca as maiores mensagens (exceto o prompt do sistema) até caber."""
+        rendered = [dict(message) for message in rendered]
+        while self.counter.count_messages(rendered) > self.budget:
+            candidates = [i for i in range(1, len(rendered))]
+            if not candidates:
+                break
+            largest = max(candidates, key=lambda i: self.counter.count(rendered[i]["content"]))
+            tokens = self.counter.count(rendered[largest]["content"])
+            excess = self.counter.count_messages(rendered) - self.budget
+            new_limit = max(16, tokens - excess - 16)
+            if new_limit >= tokens:
+                break
+            rendered[largest]["content"] = self.counter.truncate(rendered[largest]["content"], new_limit)
+        return rendered
+
+
+def render_prompt(messages: List[Dict[str, str]]) -> str:
+    """Serialização determinística das mensagens, usada para comparar prompts consecutivos."""
+    return "".join(f"<{message['role']}>\n{message['content']}\n" for message in messages)
+
+
+class PrefixTracker:
+    """
+    Mede quanto de cada prompt é prefixo do prompt anterior.
+
+    O cache automático de prefixos do vLLM só reaproveita os blocos de KV de um prefixo
+    idêntico byte a byte; esta métrica é o limite superior do que pode ser reaproveitado
+    a cada turno (o acerto real aparece em `vllm:gpu_prefix_cache_hit_rate`, no /metrics).
+    """
+    def __init__(self, counter: Optional[TokenCounter] = None):
+        self.counter = counter or TokenCounter()
+        self.requests = 0
+        self.shared_tokens = 0
+        self.total_tokens = 0
+        self._previous: Optional[str] = None
+
+    def observe(self, messages: List[Dict[str, str]]) -> dict:
+        prompt = render_prompt(messages)
+        shared = os.path.commonprefix([self._previous, prompt]) if self._previous is not None else ""
+        self._previous = prompt
+
+        shared_tokens = self.counter.count(shared) if shared else 0
+        total_tokens = self.counter.count(prompt)
+        self.requests += 1
+        self.shared_tokens += shared_tokens
+        self.total_tokens += total_tokens
+        return {
+            "shared_chars": len(shared),
+            "shared_tokens": shared_tokens,
+            "total_tokens": total_tokens,
+            "shared_ratio": shared_tokens / total_tokens if total_tokens else 0.0,
+        }
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "shared_tokens": self.shared_tokens,
+            "total_tokens": self.total_tokens,
+            "shared_ratio": self.shared_tokens / self.total_tokens if self.total_tokens else 0.0,
+        }
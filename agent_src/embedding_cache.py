@@ -0,0 +1,169 @@
+import hashlib
+import json
+import logging
+import os
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+
+from .telemetry import metrics
+
+logger = logging.getLogger(__name__)
+_requests = metrics.counter("agent_cache_requests_total", "Consultas aos caches em memória, por cache e resultado (hit/miss).")
+
+
+def content_hash(text: str) -> str:
+    """Hash estável do conteúdo de um trecho de texto, usado como chave do cache."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def atomic_write_bytes(path: str, data: bytes):
+    """Escreve em um arquivo temporário e o renomeia, para nunca deixar um arquivo pela metade."""
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def atomic_write_json(path: str, obj):
+    atomic_write_bytes(path, json.dumps(obj, ensure_ascii=False).encode("utf-8"))
+
+
+class EmbeddingCache:
+    """
+    Cache persistente de embeddings indexado pelo hash do conteúdo do texto.
+
+    Os vetores ficam em uma matriz `.npy` (carregada com memory-map) e as chaves,
+    na mesma ordem das linhas, em um `.json` ao lado. Entradas novas ficam em memória
+    só até `flush()`, que as acrescenta a um arquivo pendente no disco (também lido com
+    memory-map); a ingestão chama `flush()` a cada lote, de modo que a memória usada
+    depende do tamanho do lote e não do corpus. `save()` grava a nova matriz em blocos
+    e descarta as chaves não usadas desde o carregamento.
+    """
+    def __init__(self, cache_dir: str, name: str = "embeddings"):
+        self.cache_dir = cache_dir
+        self.vectors_path = os.path.join(cache_dir, f"{name}.npy")
+        self.keys_path = os.path.join(cache_dir, f"{name}.keys.json")
+        self.pending_path = os.path.join(cache_dir, f"{name}.pending-{os.getpid()}.f32")
+        self._rows: Dict[str, int] = {}
+        self._matrix: Optional[np.ndarray] = None
+        self._new: Dict[str, np.ndarray] = {}
+        # Vetores já descarregados no arquivo pendente (ainda fora da matriz salva).
+        self._pending_rows: Dict[str, int] = {}
+        self._pending: Optional[np.ndarray] = None
+        self._pending_file = None
+        self._used: set = set()
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not (os.path.exists(self.vectors_path) and os.path.exists(self.keys_path)):
+            return
+        try:
+            with open(self.keys_path, "r", encoding="utf-8") as f:
+                keys = json.load(f)
+            matrix = np.load(self.vectors_path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            logger.warning("Cache de embeddings corrompido em '%s', ignorando: %s", self.cache_dir, e)
+            return
+        if len(keys) != matrix.shape[0]:
+            logger.warning("Cache de embeddings inconsistente em '%s', ignorando.", self.cache_dir)
+            return
+        self._matrix = matrix
+        self._rows = {key: i for i, key in enumerate(keys)}
+
+    def __len__(self) -> int:
+        return len(self._rows.keys() | self._pending_rows.keys() | self._new.keys())
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._new or key in self._pending_rows or key in self._rows
+
+    def _vector(self, key: str) -> np.ndarray:
+        if key in self._new:
+            return self._new[key]
+        if key in self._pending_rows:
+            return self._pending[self._pending_rows[key]]
+        return self._matrix[self._rows[key]]
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        if key not in self:
+            self.misses += 1
+            _requests.inc(cache="kb_embeddings", result="miss")
+            return None
+        self.hits += 1
+        _requests.inc(cache="kb_embeddings", result="hit")
+        self._used.add(key)
+        return self._vector(key)
+
+    def put(self, key: str, vector: np.ndarray):
+        self._new[key] = np.asarray(vector, dtype="float32")
+        self._used.add(key)
+
+    def missing(self, keys: Iterable[str]) -> List[str]:
+        return [key for key in keys if key not in self]
+
+    def flush(self):
+        """Acrescenta os vetores novos ao arquivo pendente e os libera da memória."""
+        if not self._new:
+            return
+        if self._pending_file is None:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            self._pending_file = open(self.pending_path, "wb")
+        count = len(self._pending_rows)
+        for key, vector in self._new.items():
+            self._pending_file.write(vector.tobytes())
+            self._pending_rows[key] = count
+            count += 1
+        self._pending_file.flush()
+        dimension = next(iter(self._new.values())).shape[0]
+        self._pending = np.memmap(self.pending_path, dtype="float32", mode="r", shape=(count, dimension))
+        self._new = {}
+
+    def _dimension(self) -> int:
+        for matrix in (self._pending, self._matrix):
+            if matrix is not None and matrix.shape[0]:
+                return matrix.shape[1]
+        return 0
+
+    def save(self, keep: Optional[Iterable[str]] = None, block_size: int = 4096):
+        """
+        Persiste o cache. Mantém apenas as chaves em `keep` (por padrão, as usadas
+        desde o carregamento), o que remove embeddings de arquivos apagados. A matriz
+        é escrita direto no arquivo, `block_size` linhas por vez.
+        """
+        self.flush()
+        keep = set(self._used if keep is None else keep)
+        keys = [key for key in list(self._rows) + list(self._pending_rows) if key in keep]
+        keys = list(dict.fromkeys(keys))
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.vectors_path}.tmp-{os.getpid()}.npy"
+        if keys:
+            matrix = np.lib.format.open_memmap(tmp_path, mode="w+", dtype="float32", shape=(len(keys), self._dimension()))
+            for start in range(0, len(keys), block_size):
+                block = keys[start:start + block_size]
+                matrix[start:start + len(block)] = np.stack([self._vector(key) for key in block])
+            matrix.flush()
+            del matrix
+        else:
+            np.save(tmp_path, np.zeros((0, 0), dtype="float32"))
+        os.replace(tmp_path, self.vectors_path)
+        atomic_write_json(self.keys_path, keys)
+
+        # Recarrega a partir do disco (memory-map) e descarta o arquivo pendente.
+        self._discard_pending()
+        self._matrix = None
+        self._rows = {}
+        self._load()
+
+    def _discard_pending(self):
+        if self._pending_file is not None:
+            self._pending_file.close()
+            self._pending_file = None
+        self._pending = None
+        self._pending_rows = {}
+        try:
+            os.remove(self.pending_path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,106 @@
+import asyncio
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict, List
+
+# Tipos de evento emitidos durante uma sessão.
+EVENT_TYPES = (
+    "status",        # ciclo de vida da sessão: queued, running, done, failed, cancelled
+    "log",           # mensagem informativa
+    "plan",          # plano gerado
+    "code",          # código prestes a ser executado
+    "observation",   # resultado de uma execução
+    "llm_token",     # trecho da resposta do LLM, assim que chega
+    "llm_response",  # resposta completa do LLM
+    "complete",      # o agente sinalizou TASK_COMPLETE
+)
+
+
+@dataclass
+class AgentEvent:
+    """Um evento estruturado de uma sessão do agente."""
+    type: str
+    text: str = ""
+    data: Dict[str, Any] = field(default_factory=dict)
+    timestamp: float = field(default_factory=time.time)
+
+
+class EventChannel:
+    """
+    Fila assíncrona de eventos de uma única sessão.
+
+    O agente publica com `emit` (sem nunca bloquear) e um consumidor lê com
+    `async for event in channel` ou, agrupando por intervalo, com `batches()`.
+    Depois de `close()`, o consumidor recebe os eventos restantes e a iteração termina.
+    Deve ser usado a partir de um único event loop.
+    """
+    _CLOSED = object()
+
+    def __init__(self):
+        self._queue: "asyncio.Queue" = asyncio.Queue()
+        self.closed = False
+
+    def emit(self, type: str, text: str = "", **data):
+        if self.closed:
+            return
+        self._queue.put_nowait(AgentEvent(type, text, data))
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            self._queue.put_nowait(self._CLOSED)
+
+    def __aiter__(self) -> AsyncIterator[AgentEvent]:
+        return self._iterate()
+
+    async def _iterate(self) -> AsyncIterator[AgentEvent]:
+        while True:
+            item = await self._queue.get()
+            if item is self._CLOSED:
+                return
+            yield item
+
+    async def batches(self, interval: float) -> AsyncIterator[List[AgentEvent]]:
+        """
+        Agrupa os eventos em lotes entregues no máximo a cada `interval` segundos, para
+        que a interface seja atualizada em ritmo fixo, e não a cada token do LLM.
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            item = await self._queue.get()
+            if item is self._CLOSED:
+                return
+            batch = [item]
+            deadline = loop.time() + interval
+            finished = False
+            while (remaining := deadline - loop.time()) > 0:
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), remaining)
+                except asyncio.TimeoutError:
+                    break
+                if item is self._CLOSED:
+                    finished = True
+                    break
+                batch.append(item)
+            yield batch
+            if finished:
+                return
+
+
+def format_event(event: AgentEvent) -> str:
+    """Texto de um evento no log legível da sessão (o mesmo formato do console)."""
+    if event.type == "llm_token":
+        return event.text
+    if event.type == "status":
+        error = event.data.get("error")
+        return f"[sessão: {event.text}: {error}]\n" if error else f"[sessão: {event.text}]\n"
+    if event.type == "plan":
+        return f"Plano gerado:\n---\n{event.text}\n---\n"
+    if event.type == "code":
+        return f"\n==================== NOVO CICLO ====================\nExecutando código:\n---\n{event.text}\n---\n"
+    if event.type == "observation":
+        return f"Observação da Execução:\n---\n{event.text}\n---\n"
+    if event.type == "llm_response":
+        # O texto já chegou token a token; só fecha o bloco da resposta.
+        return "\n---\n"
+    return f"{event.text}\n"
@@ -0,0 +1,217 @@
+import logging
+import numpy as np
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Iterable, List, Optional, Tuple
+
+from .config import (
+    KB_INDEX_EF_SEARCH,
+    KB_INDEX_HNSW_M,
+    KB_INDEX_METRIC,
+    KB_INDEX_NLIST,
+    KB_INDEX_NPROBE,
+    KB_INDEX_PQ_M,
+    KB_INDEX_TRAIN_SAMPLE,
+    KB_INDEX_TYPE,
+)
+
+# O faiss é importado dentro das funções que o usam: IndexConfig não depende dele.
+if TYPE_CHECKING:
+    import faiss
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+METRICS = ("l2", "ip")
+# Parâmetros que só afetam a busca e podem mudar sem reconstruir o índice.
+SEARCH_PARAMS = ("nprobe", "ef_search")
+# O k-means do FAISS recomenda pelo menos ~39 pontos de treino por centróide.
+MIN_POINTS_PER_CENTROID = 39
+
+
+@dataclass
+class IndexConfig:
+    """
+    Configuração do índice vetorial da KnowledgeBase.
+
+    `kind` é um de "flat" (busca exata), "ivf_flat", "ivf_pq" ou "hnsw". Com
+    `metric="ip"` os vetores são normalizados e o score é o produto interno
+    (similaridade de cosseno, maior é melhor); com "l2", é a distância (menor é melhor).
+    """
+    kind: str = KB_INDEX_TYPE
+    metric: str = KB_INDEX_METRIC
+    nlist: int = KB_INDEX_NLIST
+    nprobe: int = KB_INDEX_NPROBE
+    pq_m: int = KB_INDEX_PQ_M
+    pq_nbits: int = 8
+    hnsw_m: int = KB_INDEX_HNSW_M
+    ef_construction: int = 200
+    ef_search: int = KB_INDEX_EF_SEARCH
+    train_sample: int = KB_INDEX_TRAIN_SAMPLE
+
+    def __post_init__(self):
+        if self.kind not in INDEX_TYPES:
+            raise ValueError(f"Tipo de índice desconhecido: '{self.kind}'. Use um de {INDEX_TYPES}.")
+        if self.metric not in METRICS:
+            raise ValueError(f"Métrica desconhecida: '{self.metric}'. Use um de {METRICS}.")
+
+    @property
+    def needs_training(self) -> bool:
+        return self.kind in ("ivf_flat", "ivf_pq")
+
+    @property
+    def supports_removal(self) -> bool:
+        """O HNSW do FAISS não permite remover vetores; os demais tipos sim."""
+        return self.kind != "hnsw"
+
+    def build_settings(self) -> dict:
+        """Parâmetros que definem o conteúdo do índice (os de busca ficam de fora)."""
+        return {key: value for key, value in asdict(self).items() if key not in SEARCH_PARAMS}
+
+    def prepare(self, vectors: np.ndarray) -> np.ndarray:
+        """Converte para float32 contíguo e normaliza, se a métrica for produto interno."""
+        vectors = np.ascontiguousarray(vectors, dtype="float32")
+        if self.metric == "ip":
+            import faiss
+            vectors = vectors.copy()
+            faiss.normalize_L2(vectors)
+        return vectors
+
+
+def _faiss_metric(config: IndexConfig) -> int:
+    import faiss
+    return faiss.METRIC_INNER_PRODUCT if config.metric == "ip" else faiss.METRIC_L2
+
+
+def _pq_subquantizers(dimension: int, requested: int) -> int:
+    """Maior número de subquantizadores <= `requested` que divide a dimensão."""
+    for m in range(min(requested, dimension), 0, -1):
+        if dimension % m == 0:
+            return m
+    return 1
+
+
+def create_index(config: IndexConfig, sample: np.ndarray) -> "faiss.Index":
+    """
+    Cria (e treina, se necessário) um índice para vetores com a dimensão de `sample`.
+    Os vetores de `sample` não são adicionados ao índice.
+
+    O número de listas IVF é reduzido se a amostra for pequena demais para treiná-lo, e
+    o IVF-PQ recai para IVF-Flat se não houver pontos suficientes para os codebooks.
+    """
+    import faiss
+    dimension = sample.shape[1]
+    metric = _faiss_metric(config)
+    n = sample.shape[0]
+
+    if config.kind == "flat":
+        return faiss.IndexFlatIP(dimension) if config.metric == "ip" else faiss.IndexFlatL2(dimension)
+
+    if config.kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dimension, config.hnsw_m, metric)
+        index.hnsw.efConstruction = config.ef_construction
+        configure_search(index, config)
+        return index
+
+    nlist = max(1, min(config.nlist, n // MIN_POINTS_PER_CENTROID))
+    if nlist < config.nlist:
+        logger.warning("Amostra de treino com %s vetores: usando %s listas IVF em vez de %s.", n, nlist, config.nlist)
+    description = f"IVF{nlist},Flat"
+    if config.kind == "ivf_pq":
+        if n < 2 ** config.pq_nbits:
+            logger.warning("Vetores insuficientes (%s) para treinar o PQ. Usando IVF-Flat.", n)
+        else:
+            description = f"IVF{nlist},PQ{_pq_subquantizers(dimension, config.pq_m)}x{config.pq_nbits}"
+
+    index = faiss.index_factory(dimension, description, metric)
+    index.train(sample)
+    configure_search(index, config)
+    return index
+
+
+def configure_search(index: "faiss.Index", config: IndexConfig):
+    """Aplica os parâmetros de busca (nprobe / efSearch); também deve ser chamado após carregar do disco."""
+    import faiss
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        index = faiss.downcast_index(index.index)
+    if hasattr(index, "nprobe"):
+        index.nprobe = config.nprobe
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = config.ef_search
+
+
+def search_subset(index: "faiss.Index", config: IndexConfig, queries: np.ndarray, k: int, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Busca restrita aos vetores com os ids dados. Os parâmetros de busca passados ao FAISS
+    substituem os do índice, por isso nprobe / efSearch são repetidos aqui.
+    """
+    import faiss
+    selector = faiss.IDSelectorBatch(np.ascontiguousarray(ids, dtype="int64"))
+    if config.needs_training:
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=config.nprobe)
+    elif config.kind == "hnsw":
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=config.ef_search)
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    return index.search(queries, k, params=params)
+
+
+class IndexBuilder:
+    """
+    Constrói um índice a partir de lotes de vetores que chegam em streaming.
+
+    O índice produzido é um `IndexIDMap2`: cada vetor é guardado com um id int64
+    estável (por padrão, sequencial), o que permite removê-lo ou substituí-lo depois.
+    Índices que não precisam de treino recebem cada lote imediatamente. Para os IVF,
+    os primeiros `train_sample` vetores ficam em um buffer, o índice é treinado com
+    eles e, a partir daí, os lotes seguintes são adicionados diretamente.
+    """
+    def __init__(self, config: IndexConfig):
+        self.config = config
+        self.index: Optional["faiss.Index"] = None
+        self._pending: List[np.ndarray] = []
+        self._pending_ids: List[np.ndarray] = []
+        self._pending_count = 0
+        self._next_id = 0
+
+    def add(self, vectors: np.ndarray, ids: Optional[np.ndarray] = None):
+        vectors = self.config.prepare(vectors)
+        if ids is None:
+            ids = np.arange(self._next_id, self._next_id + vectors.shape[0], dtype="int64")
+        ids = np.asarray(ids, dtype="int64")
+        self._next_id = max(self._next_id, int(ids.max()) + 1) if len(ids) else self._next_id
+
+        if self.index is not None:
+            self.index.add_with_ids(vectors, ids)
+            return
+        if not self.config.needs_training:
+            import faiss
+            self.index = faiss.IndexIDMap2(create_index(self.config, vectors))
+            self.index.add_with_ids(vectors, ids)
+            return
+        self._pending.append(vectors)
+        self._pending_ids.append(ids)
+        self._pending_count += vectors.shape[0]
+        if self._pending_count >= self.config.train_sample:
+            self._train_and_flush()
+
+    def _train_and_flush(self):
+        import faiss
+        sample = np.vstack(self._pending)
+        ids = np.concatenate(self._pending_ids)
+        self._pending = []
+        self._pending_ids = []
+        self._pending_count = 0
+        self.index = faiss.IndexIDMap2(create_index(self.config, sample))
+        self.index.add_with_ids(sample, ids)
+
+    def finish(self) -> Optional["faiss.Index"]:
+        if self.index is None and self._pending:
+            self._train_and_flush()
+        return self.index
+
+
+def build_index(config: IndexConfig, batches: Iterable[np.ndarray]) -> Optional["faiss.Index"]:
+    builder = IndexBuilder(config)
+    for batch in batches:
+        builder.add(batch)
+    return builder.finish()
@@ -1,114 +1,442 @@
 import requests
 import json
+import logging
 import uuid
 import asyncio
-import websockets
-from typing import Tuple
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from .config import (
+    JUPYTER_EXECUTION_TIMEOUT,
+    JUPYTER_GATEWAY_URL,
+    JUPYTER_IDLE_TIMEOUT,
+    OUTPUT_MAX_BYTES,
+    OUTPUT_MAX_LINES,
+    OUTPUT_SPILL_DIR,
+    OUTPUT_SPILL_KERNEL_DIR,
+)
+from .output_capture import BoundedOutput
+from .telemetry import metrics, tracer
+
+# O cliente `websockets` só é importado quando o canal do kernel é aberto.
+logger = logging.getLogger(__name__)
+_executions = metrics.counter("agent_kernel_executions_total", "Execuções de código no kernel, por resultado (ok, error, timeout, failed).")
+
+# Tempo (em segundos) aguardado pelo kernel após um pedido de interrupção.
+INTERRUPT_GRACE_PERIOD = 5.0
+
+
+@dataclass
+class ExecutionEvent:
+    """
+    Um evento produzido pelo kernel durante a execução de uma célula.
+
+    `type` é um de: "stdout", "stderr", "execute_result", "display_data", "error",
+    "status" ou "timeout". `text` traz o trecho de texto (ou o estado, para "status")
+    e `data` o conteúdo bruto (mime bundle ou detalhes do erro), quando houver.
+    """
+    type: str
+    text: str = ""
+    data: Dict[str, Any] = field(default_factory=dict)
 
-from .config import JUPYTER_GATEWAY_URL
 
 class JupyterClient:
     """
     Um cliente assíncrono para interagir com um Jupyter Kernel Gateway usando WebSockets.
+
+    Mantém um único canal WebSocket de longa duração por kernel. Uma tarefa de
+    leitura em segundo plano encaminha cada mensagem recebida para a requisição
+    em andamento correspondente (via `parent_header.msg_id`), o que permite
+    enfileirar várias `execute_request` no mesmo socket. `execute_many` usa isso
+    para enviar várias células de uma vez, pagando uma única ida e volta.
     """
-    def __init__(self, gateway_url: str = JUPYTER_GATEWAY_URL):
+    def __init__(
+        self,
+        gateway_url: str = JUPYTER_GATEWAY_URL,
+        max_output_bytes: int = OUTPUT_MAX_BYTES,
+        max_output_lines: int = OUTPUT_MAX_LINES,
+        spill_dir: Optional[str] = OUTPUT_SPILL_DIR,
+        spill_kernel_dir: Optional[str] = OUTPUT_SPILL_KERNEL_DIR,
+    ):
         self.gateway_url = gateway_url
         self.http_url = gateway_url
         self.ws_url = "ws://" + gateway_url.split("://")[1]
         self.kernel_id = None
         self.session = requests.Session()
+        self.max_output_bytes = max_output_bytes
+        self.max_output_lines = max_output_lines
+        self.spill_dir = spill_dir
+        self.spill_kernel_dir = spill_kernel_dir
+        # Um único session id por cliente permite que o servidor reenvie as
+        # mensagens armazenadas quando o canal é reconectado.
+        self.session_id = uuid.uuid4().hex
+        self._websocket = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._connect_lock: Optional[asyncio.Lock] = None
+        self._pending: Dict[str, asyncio.Queue] = {}
+        self._closing = False
 
     def start_kernel(self) -> str:
         """Inicia um novo kernel via REST API e armazena seu ID."""
         if self.kernel_id:
-            print(f"Kernel {self.kernel_id} já está em execução.")
+            logger.info("Kernel %s já está em execução.", self.kernel_id)
             return self.kernel_id
 
         url = f"{self.http_url}/api/kernels"
-        response = self.session.post(url, json={})
-        response.raise_for_status()
-        kernel_data = response.json()
+        with tracer.span("kernel.start"):
+            response = self.session.post(url, json={})
+            response.raise_for_status()
+            kernel_data = response.json()
         self.kernel_id = kernel_data['id']
-        print(f"Jupyter Kernel iniciado com ID: {self.kernel_id}")
+        logger.info("Jupyter Kernel iniciado com ID: %s", self.kernel_id)
         return self.kernel_id
 
-    async def execute_code(self, code: str) -> Tuple[str, str]:
+    def _channel_url(self) -> str:
+        return f"{self.ws_url}/api/kernels/{self.kernel_id}/channels?session_id={self.session_id}"
+
+    def _build_message(self, msg_type: str, content: Dict[str, Any], channel: str = "shell") -> Dict[str, Any]:
+        """Monta uma mensagem no formato do protocolo de mensagens do Jupyter."""
+        return {
+            "header": {
+                "msg_id": uuid.uuid4().hex,
+                "username": "agent",
+                "session": self.session_id,
+                "msg_type": msg_type,
+                "date": datetime.now(timezone.utc).isoformat(),
+                "version": "5.3",
+            },
+            "metadata": {},
+            "content": content,
+            "buffers": [],
+            "parent_header": {},
+            "channel": channel,
+        }
+
+    async def _ensure_channel(self):
+        """Abre o canal WebSocket (e a tarefa de leitura) se ainda não estiver aberto."""
+        import websockets
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # O canal anterior pertence a outro event loop (ex: outro asyncio.run) e não pode ser reaproveitado.
+            self._websocket = None
+            self._reader_task = None
+            self._connect_lock = asyncio.Lock()
+            self._loop = loop
+
+        async with self._connect_lock:
+            self._closing = False
+            if self._websocket is None:
+                self._websocket = await websockets.connect(self._channel_url())
+            if self._reader_task is None or self._reader_task.done():
+                self._reader_task = loop.create_task(self._reader_loop())
+
+    async def _reconnect(self, stale, attempts: int = 5, delay: float = 0.5):
+        """Reabre o canal após uma queda, com espera exponencial entre as tentativas."""
+        import websockets
+        async with self._connect_lock:
+            if self._websocket is not stale:
+                # Outra corrotina já reconectou o canal.
+                return
+            for attempt in range(attempts):
+                try:
+                    self._websocket = await websockets.connect(self._channel_url())
+                    logger.info("Canal WebSocket do kernel reconectado.")
+                    return
+                except (OSError, websockets.exceptions.WebSocketException) as e:
+                    logger.warning("Falha ao reconectar ao kernel (tentativa %s/%s): %s", attempt + 1, attempts, e)
+                    await asyncio.sleep(delay * (2 ** attempt))
+            raise ConnectionError(f"Não foi possível reconectar ao kernel {self.kernel_id}.")
+
+    async def _reader_loop(self):
+        """Lê continuamente o canal e encaminha cada mensagem à fila da requisição de origem."""
+        import websockets
+        while True:
+            websocket = self._websocket
+            try:
+                async for message_str in websocket:
+                    message = json.loads(message_str)
+                    parent_id = message.get("parent_header", {}).get("msg_id")
+                    queue = self._pending.get(parent_id)
+                    if queue is not None:
+                        queue.put_nowait(message)
+            except websockets.exceptions.ConnectionClosed:
+                pass
+
+            if self._closing or not self.kernel_id:
+                # Canal fechado intencionalmente (close/shutdown).
+                return
+            logger.warning("Canal WebSocket do kernel caiu. Reconectando...")
+            try:
+                await self._reconnect(websocket)
+            except ConnectionError as e:
+                logger.error(str(e))
+                self._fail_pending(e)
+                return
+
+    def _fail_pending(self, error: Exception):
+        """Entrega o erro a todas as requisições em andamento, que deixam de esperar pelo kernel."""
+        for queue in list(self._pending.values()):
+            queue.put_nowait(error)
+
+    async def _send(self, msg: Dict[str, Any]):
+        """Envia uma mensagem pelo canal persistente, reconectando uma vez se necessário."""
+        import websockets
+        await self._ensure_channel()
+        websocket = self._websocket
+        try:
+            await websocket.send(json.dumps(msg))
+        except websockets.exceptions.ConnectionClosed:
+            await self._reconnect(websocket)
+            await self._websocket.send(json.dumps(msg))
+
+    def _to_event(self, message: Dict[str, Any]) -> Optional[ExecutionEvent]:
+        """Converte uma mensagem do kernel em um ExecutionEvent (ou None, se não for relevante)."""
+        msg_type = message["header"]["msg_type"]
+        content = message["content"]
+
+        if msg_type == "stream":
+            if content["name"] in ("stdout", "stderr"):
+                return ExecutionEvent(content["name"], content["text"])
+        elif msg_type in ("execute_result", "display_data"):
+            data = content.get("data", {})
+            return ExecutionEvent(msg_type, data.get("text/plain", ""), data)
+        elif msg_type == "error":
+            return ExecutionEvent("error", f"{content['ename']}: {content['evalue']}", content)
+        elif msg_type == "status":
+            return ExecutionEvent("status", content["execution_state"])
+        return None
+
+    async def execute_stream(
+        self,
+        code: str,
+        timeout: Optional[float] = JUPYTER_EXECUTION_TIMEOUT,
+        idle_timeout: Optional[float] = JUPYTER_IDLE_TIMEOUT,
+    ) -> AsyncIterator[ExecutionEvent]:
         """
-        Executa um bloco de código no kernel ativo usando WebSockets.
-        Retorna uma tupla contendo (stdout, stderr).
+        Executa um bloco de código e produz os eventos do kernel à medida que chegam.
+
+        `timeout` é o prazo total da execução e `idle_timeout` o tempo máximo sem
+        nenhuma mensagem do kernel (None desativa cada um). Quando um deles estoura,
+        é produzido um evento "timeout", o kernel é interrompido e os eventos restantes
+        (tipicamente o KeyboardInterrupt) são repassados até o kernel ficar ocioso.
+        O último evento é sempre o status "idle", salvo se o kernel parar de responder.
+        """
+        msg = self._execute_message(code, stop_on_error=False)
+        msg_id = msg["header"]["msg_id"]
+        # A fila é registrada antes do envio para não perder nenhuma resposta.
+        queue: asyncio.Queue = asyncio.Queue()
+        self._pending[msg_id] = queue
+        try:
+            await self._send(msg)
+            async for event in self._events(queue, timeout, idle_timeout):
+                yield event
+        finally:
+            self._pending.pop(msg_id, None)
+
+    def _execute_message(self, code: str, stop_on_error: bool) -> Dict[str, Any]:
+        """
+        Monta uma `execute_request`. Com `stop_on_error`, um erro nesta célula faz o
+        kernel abortar as requisições que já estiverem na fila atrás dela.
         """
         if not self.kernel_id:
             raise Exception("Kernel não iniciado. Chame start_kernel() primeiro.")
+        return self._build_message("execute_request", {
+            "code": code,
+            "silent": False,
+            "store_history": True,
+            "user_expressions": {},
+            "allow_stdin": False,
+            "stop_on_error": stop_on_error,
+        })
 
-        ws_connection_url = f"{self.ws_url}/api/kernels/{self.kernel_id}/channels"
-
-        stdout_parts = []
-        stderr_parts = []
-
-        async with websockets.connect(ws_connection_url) as websocket:
-            # Construir a mensagem de execução de código padrão do Jupyter
-            msg_id = uuid.uuid4().hex
-            msg = {
-                "header": {
-                    "msg_id": msg_id,
-                    "username": "agent",
-                    "session": uuid.uuid4().hex,
-                    "msg_type": "execute_request",
-                    "version": "5.3",
-                },
-                "metadata": {},
-                "content": {
-                    "code": code,
-                    "silent": False,
-                    "store_history": True,
-                    "user_expressions": {},
-                    "allow_stdin": False,
-                },
-                "buffers": [],
-                "parent_header": {},
-                "channel": "shell",
-            }
+    async def _events(
+        self,
+        queue: asyncio.Queue,
+        timeout: Optional[float],
+        idle_timeout: Optional[float],
+    ) -> AsyncIterator[ExecutionEvent]:
+        """Eventos de uma execução já enviada, lidos da sua fila, até o kernel ficar ocioso (ver `execute_stream`)."""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout if timeout is not None else None
+        interrupted = False
+        while True:
+            if interrupted:
+                wait = INTERRUPT_GRACE_PERIOD
+            else:
+                wait = idle_timeout
+                if deadline is not None:
+                    remaining = max(0.0, deadline - loop.time())
+                    wait = remaining if wait is None else min(wait, remaining)
 
-            await websocket.send(json.dumps(msg))
+            try:
+                message = await asyncio.wait_for(queue.get(), timeout=wait)
+            except asyncio.TimeoutError:
+                if interrupted:
+                    logger.error("O kernel não respondeu à interrupção. Abandonando a execução.")
+                    return
+                if deadline is not None and loop.time() >= deadline:
+                    reason = f"a execução excedeu o prazo de {timeout}s"
+                else:
+                    reason = f"o kernel ficou {idle_timeout}s sem produzir saída"
+                logger.warning("Timeout: %s. Interrompendo o kernel.", reason)
+                yield ExecutionEvent("timeout", f"TimeoutError: {reason} e foi interrompida.")
+                interrupted = True
+                await asyncio.to_thread(self.interrupt_kernel)
+                continue
+
+            if isinstance(message, Exception):
+                # O canal caiu e não pôde ser reaberto (ver `_reader_loop`).
+                raise message
+            event = self._to_event(message)
+            if event is None:
+                continue
+            yield event
+            if event.type == "status" and event.text == "idle":
+                # A execução terminou
+                return
+
+    def _new_capture(self, name: str) -> BoundedOutput:
+        return BoundedOutput(
+            name,
+            max_bytes=self.max_output_bytes,
+            max_lines=self.max_output_lines,
+            spill_dir=self.spill_dir,
+            spill_kernel_dir=self.spill_kernel_dir,
+        )
+
+    async def execute_code(self, code: str, timeout: Optional[float] = JUPYTER_EXECUTION_TIMEOUT) -> Tuple[str, str]:
+        """
+        Executa um bloco de código no kernel ativo e aguarda o fim da execução.
+        Retorna uma tupla contendo (stdout, stderr).
+
+        Cada stream é capturada com memória limitada: se exceder os limites de bytes
+        ou linhas, apenas o início e o final são devolvidos, junto com o caminho do
+        arquivo no workspace que contém a saída completa.
+        """
+        stdout, stderr, _ = await self._capture(self.execute_stream(code, timeout=timeout), len(code))
+        return stdout, stderr
+
+    async def execute_many(self, cells: List[str], timeout: Optional[float] = JUPYTER_EXECUTION_TIMEOUT) -> List[Tuple[str, str]]:
+        """
+        Executa várias células em sequência, enviando todas as `execute_request` de uma
+        vez pelo canal: o kernel as enfileira e cada resultado é coletado pelo seu msg_id,
+        sem uma ida e volta por célula. `timeout` vale para cada célula.
+
+        Para na primeira célula com erro (ou timeout): as seguintes são abortadas pelo
+        próprio kernel (`stop_on_error`). Retorna (stdout, stderr) de cada célula
+        executada, na ordem; a lista é mais curta que `cells` se alguma falhou.
+        """
+        messages = [self._execute_message(code, stop_on_error=True) for code in cells]
+        queues: List[asyncio.Queue] = []
+        for msg in messages:
+            queue: asyncio.Queue = asyncio.Queue()
+            self._pending[msg["header"]["msg_id"]] = queue
+            queues.append(queue)
+        results = []
+        try:
+            with tracer.span("kernel.execute_many", kernel_id=self.kernel_id, cells=len(cells)) as span:
+                for msg in messages:
+                    await self._send(msg)
+                for code, queue in zip(cells, queues):
+                    stdout, stderr, status = await self._capture(self._events(queue, timeout, JUPYTER_IDLE_TIMEOUT), len(code))
+                    results.append((stdout, stderr))
+                    if status != "ok":
+                        break
+                # Espera o kernel descartar as células abortadas, para que a próxima execução não fique atrás delas.
+                for queue in queues[len(results):]:
+                    await self._wait_idle(queue, INTERRUPT_GRACE_PERIOD)
+                span.set(executed=len(results))
+        finally:
+            for msg in messages:
+                self._pending.pop(msg["header"]["msg_id"], None)
+        return results
 
+    async def _wait_idle(self, queue: asyncio.Queue, timeout: float):
+        """Descarta as mensagens de uma requisição até o status "idle" (sem interromper o kernel)."""
+        try:
             while True:
-                try:
-                    message_str = await asyncio.wait_for(websocket.recv(), timeout=10.0)
-                    message = json.loads(message_str)
+                message = await asyncio.wait_for(queue.get(), timeout=timeout)
+                if isinstance(message, Exception):
+                    return
+                event = self._to_event(message)
+                if event is not None and event.type == "status" and event.text == "idle":
+                    return
+        except asyncio.TimeoutError:
+            logger.warning("O kernel não confirmou o descarte de uma célula abortada.")
+
+    async def _capture(self, events: AsyncIterator[ExecutionEvent], code_chars: int) -> Tuple[str, str, str]:
+        """Consome os eventos de uma execução com saída limitada; devolve (stdout, stderr, resultado)."""
+        stdout = self._new_capture("stdout")
+        stderr = self._new_capture("stderr")
+        status = "ok"
 
-                    # Verificar se a mensagem é uma resposta à nossa requisição
-                    if message.get("parent_header", {}).get("msg_id") == msg_id:
-                        msg_type = message["header"]["msg_type"]
-                        content = message["content"]
-
-                        if msg_type == "stream":
-                            if content["name"] == "stdout":
-                                stdout_parts.append(content["text"])
-                            elif content["name"] == "stderr":
-                                stderr_parts.append(content["text"])
-                        elif msg_type == "error":
-                            stderr_parts.append(f"{content['ename']}: {content['evalue']}")
-                        elif msg_type == "status" and content["execution_state"] == "idle":
-                            # A execução terminou
-                            break
-                except asyncio.TimeoutError:
-                    print("Timeout esperando pela resposta do kernel. A execução pode ter travado.")
-                    break
-
-        return "".join(stdout_parts), "".join(stderr_parts)
+        with tracer.span("kernel.execute", kernel_id=self.kernel_id, code_chars=code_chars) as span:
+            try:
+                async for event in events:
+                    if event.type == "stdout":
+                        stdout.write(event.text)
+                    elif event.type in ("stderr", "error", "timeout"):
+                        stderr.write(event.text)
+                        if event.type != "stderr":
+                            status = event.type
+            except BaseException:
+                status = "failed"
+                raise
+            finally:
+                stdout.close()
+                stderr.close()
+                span.set(result=status)
+                _executions.inc(status=status)
+
+        return stdout.getvalue(), stderr.getvalue(), status
+
+    def interrupt_kernel(self):
+        """Interrompe a execução em andamento no kernel via REST API."""
+        if not self.kernel_id:
+            return
+        url = f"{self.http_url}/api/kernels/{self.kernel_id}/interrupt"
+        try:
+            response = self.session.post(url)
+            response.raise_for_status()
+        except requests.RequestException as e:
+            logger.warning("Falha ao interromper o kernel %s: %s", self.kernel_id, e)
+
+    async def close(self):
+        """Fecha o canal WebSocket persistente e encerra a tarefa de leitura."""
+        self._closing = True
+        websocket, self._websocket = self._websocket, None
+        reader_task, self._reader_task = self._reader_task, None
+        if websocket is not None:
+            await websocket.close()
+        if reader_task is not None:
+            reader_task.cancel()
+            try:
+                await reader_task
+            except asyncio.CancelledError:
+                pass
 
     def shutdown_kernel(self):
         """Desliga o kernel ativo via REST API."""
         if not self.kernel_id:
-            print("Nenhum kernel para desligar.")
+            logger.info("Nenhum kernel para desligar.")
             return
 
+        # O canal pertence a um event loop; aqui apenas descartamos as referências.
+        # Para um encerramento limpo, chame `await close()` antes.
+        self._closing = True
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        self._websocket = None
+        self._reader_task = None
+
         url = f"{self.http_url}/api/kernels/{self.kernel_id}"
         response = self.session.delete(url)
         if response.status_code == 204:
-            print(f"Kernel {self.kernel_id} desligado com sucesso.")
+            logger.info("Kernel %s desligado com sucesso.", self.kernel_id)
         else:
-            print(f"Falha ao desligar o kernel {self.kernel_id}. Status: {response.status_code}")
+            logger.error("Falha ao desligar o kernel %s. Status: %s", self.kernel_id, response.status_code)
         self.kernel_id = None
 
 # Exemplo de uso assíncrono
@@ -128,6 +456,7 @@ async def main():
         print(f"Saída de Erro:\n{stderr}")
 
     finally:
+        await client.close()
         client.shutdown_kernel()
 
 if __name__ == '__main__':
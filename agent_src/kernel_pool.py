@@ -0,0 +1,251 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, List, Optional, Set, Tuple
+
+from .config import (
+    JUPYTER_GATEWAY_URL,
+    KERNEL_POOL_IDLE_TTL,
+    KERNEL_POOL_MAX_SIZE,
+    KERNEL_POOL_MIN_IDLE,
+    KERNEL_POOL_PRELOAD,
+)
+from .jupyter_client import JupyterClient
+from .telemetry import metrics, tracer
+
+logger = logging.getLogger(__name__)
+_leases = metrics.counter("agent_kernel_leases_total", "Kernels emprestados pelo pool, por origem (warm: já ocioso; cold: criado na hora).")
+
+# Limpa o namespace do usuário sem descarregar os módulos já importados,
+# de modo que reexecutar o código de preload é praticamente instantâneo.
+RESET_CODE = "%reset -f"
+
+
+class KernelPool:
+    """
+    Mantém kernels pré-aquecidos no Jupyter Kernel Gateway e os empresta às tarefas.
+
+    Cada kernel novo executa `preload_code` antes de ficar disponível, de modo que o
+    custo de inicialização (e dos primeiros imports pesados) sai do caminho crítico.
+    Ao ser devolvido, o kernel é resetado (ou descartado, se `recycle=True` ou se a
+    tarefa falhou) e o pool é reabastecido em segundo plano até `min_idle`.
+
+    O pool deve ser usado a partir de um único event loop.
+    """
+    def __init__(
+        self,
+        gateway_url: str = JUPYTER_GATEWAY_URL,
+        min_idle: int = KERNEL_POOL_MIN_IDLE,
+        max_size: int = KERNEL_POOL_MAX_SIZE,
+        idle_ttl: float = KERNEL_POOL_IDLE_TTL,
+        preload_code: Optional[str] = KERNEL_POOL_PRELOAD,
+        recycle: bool = False,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size deve ser pelo menos 1.")
+        self.gateway_url = gateway_url
+        self.min_idle = min(min_idle, max_size)
+        self.max_size = max_size
+        self.idle_ttl = idle_ttl
+        self.preload_code = preload_code
+        self.recycle = recycle
+
+        # Kernels ociosos como (cliente, instante da última devolução), do mais antigo ao mais recente.
+        self._idle: List[Tuple[JupyterClient, float]] = []
+        # Total de kernels existentes ou em criação (ociosos + emprestados + iniciando).
+        self._total = 0
+        self._starting = 0
+        self._closed = False
+        self._cond: Optional[asyncio.Condition] = None
+        self._background: Set[asyncio.Task] = set()
+        self._maintenance_task: Optional[asyncio.Task] = None
+
+    @property
+    def idle_count(self) -> int:
+        return len(self._idle)
+
+    @property
+    def size(self) -> int:
+        return self._total
+
+    def _condition(self) -> asyncio.Condition:
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def start(self):
+        """Aquece o pool até `min_idle` kernels e inicia a rotina de manutenção."""
+        self._ensure_maintenance()
+        self._schedule_refill()
+        await asyncio.gather(*list(self._background), return_exceptions=True)
+
+    @asynccontextmanager
+    async def lease(self) -> AsyncIterator[JupyterClient]:
+        """
+        Empresta um kernel pronto para uso. Uso:
+
+            async with pool.lease() as jupyter_client:
+                stdout, stderr = await jupyter_client.execute_code("print(1)")
+        """
+        with tracer.span("kernel.lease"):
+            client = await self._acquire()
+        healthy = False
+        try:
+            yield client
+            healthy = True
+        finally:
+            await self._release(client, healthy)
+
+    async def _acquire(self) -> JupyterClient:
+        if self._closed:
+            raise RuntimeError("O KernelPool já foi fechado.")
+        self._ensure_maintenance()
+        cond = self._condition()
+        async with cond:
+            while not self._idle and self._total >= self.max_size:
+                await cond.wait()
+            if self._idle:
+                # LIFO: os kernels mais antigos ficam no fim da fila e expiram pelo TTL.
+                client, _ = self._idle.pop()
+                self._schedule_refill()
+                _leases.inc(source="warm")
+                return client
+            # Nenhum kernel ocioso: reserva a vaga e cria um kernel "a frio".
+            self._total += 1
+            _leases.inc(source="cold")
+
+        try:
+            client = await self._spawn()
+        except Exception:
+            async with cond:
+                self._total -= 1
+                cond.notify()
+            raise
+        self._schedule_refill()
+        return client
+
+    async def _release(self, client: JupyterClient, healthy: bool):
+        reusable = healthy and not self.recycle and not self._closed
+        if reusable:
+            try:
+                # Reset e preload vão em um único lote: sem uma ida e volta por célula.
+                cells = self._reset_cells()
+                results = await client.execute_many(cells)
+                reusable = len(results) == len(cells) and not any(stderr for _, stderr in results)
+            except Exception as e:
+                logger.warning("Falha ao resetar o kernel %s: %s", client.kernel_id, e)
+                reusable = False
+
+        if not reusable:
+            await self._discard(client)
+            self._schedule_refill()
+            return
+
+        cond = self._condition()
+        async with cond:
+            self._idle.append((client, time.monotonic()))
+            cond.notify()
+        await self._evict_expired()
+
+    def _reset_cells(self) -> List[str]:
+        if self.preload_code:
+            return [RESET_CODE, self.preload_code]
+        return [RESET_CODE]
+
+    async def _spawn(self) -> JupyterClient:
+        """Cria um kernel novo no gateway e executa o código de preload."""
+        client = JupyterClient(gateway_url=self.gateway_url)
+        # start_kernel é síncrono (requests); roda em thread para não bloquear o loop.
+        await asyncio.to_thread(client.start_kernel)
+        if self.preload_code:
+            try:
+                _, stderr = await client.execute_code(self.preload_code)
+            except Exception:
+                await self._shutdown(client)
+                raise
+            if stderr:
+                logger.warning("Aviso: o preload do kernel %s escreveu no STDERR:\n%s", client.kernel_id, stderr)
+        return client
+
+    async def _shutdown(self, client: JupyterClient):
+        try:
+            await client.close()
+            await asyncio.to_thread(client.shutdown_kernel)
+        except Exception as e:
+            logger.warning("Falha ao desligar o kernel %s: %s", client.kernel_id, e)
+
+    async def _discard(self, client: JupyterClient):
+        await self._shutdown(client)
+        cond = self._condition()
+        async with cond:
+            self._total -= 1
+            cond.notify()
+
+    def _schedule_refill(self):
+        """Dispara, em segundo plano, a criação de kernels até atingir `min_idle` ociosos."""
+        if self._closed:
+            return
+        missing = self.min_idle - (len(self._idle) + self._starting)
+        capacity = self.max_size - self._total
+        for _ in range(max(0, min(missing, capacity))):
+            self._total += 1
+            self._starting += 1
+            task = asyncio.get_running_loop().create_task(self._warm_one())
+            self._background.add(task)
+            task.add_done_callback(self._background.discard)
+
+    async def _warm_one(self):
+        cond = self._condition()
+        try:
+            client = await self._spawn()
+        except Exception as e:
+            logger.warning("Falha ao aquecer um kernel para o pool: %s", e)
+            async with cond:
+                self._starting -= 1
+                self._total -= 1
+                cond.notify()
+            return
+
+        async with cond:
+            self._starting -= 1
+            if self._closed:
+                self._total -= 1
+            else:
+                self._idle.append((client, time.monotonic()))
+                cond.notify()
+                return
+        await self._shutdown(client)
+
+    async def _evict_expired(self):
+        """Desliga kernels ociosos além de `min_idle` que passaram do TTL."""
+        now = time.monotonic()
+        expired: List[JupyterClient] = []
+        async with self._condition():
+            while len(self._idle) > self.min_idle and now - self._idle[0][1] > self.idle_ttl:
+                expired.append(self._idle.pop(0)[0])
+        for client in expired:
+            logger.info("Kernel ocioso %s expirou (TTL de %ss). Desligando.", client.kernel_id, self.idle_ttl)
+            await self._discard(client)
+
+    def _ensure_maintenance(self):
+        if self._maintenance_task is None or self._maintenance_task.done():
+            self._maintenance_task = asyncio.get_running_loop().create_task(self._maintenance_loop())
+
+    async def _maintenance_loop(self):
+        interval = max(1.0, min(self.idle_ttl / 2, 30.0))
+        while not self._closed:
+            await asyncio.sleep(interval)
+            await self._evict_expired()
+            self._schedule_refill()
+
+    async def close(self):
+        """Desliga todos os kernels ociosos e impede novos empréstimos."""
+        self._closed = True
+        if self._maintenance_task is not None:
+            self._maintenance_task.cancel()
+        await asyncio.gather(*list(self._background), return_exceptions=True)
+        async with self._condition():
+            idle, self._idle = self._idle, []
+        for client, _ in idle:
+            await self._discard(client)
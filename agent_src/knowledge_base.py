@@ -1,78 +1,630 @@
 import os
-import faiss
+import json
+import logging
+import threading
 import numpy as np
-from sentence_transformers import SentenceTransformer
-from typing import List, Optional
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .chunking import Chunk, batched, chunk_text
+from .config import (
+    KB_CHUNK_OVERLAP,
+    KB_CHUNK_SIZE,
+    KB_CHUNK_STRATEGY,
+    KB_ENCODE_BATCH_SIZE,
+    KB_LEXICAL_PREFILTER,
+    KB_QUERY_CACHE_SIZE,
+    KB_QUERY_CACHE_TTL,
+    KB_RETRIEVAL,
+    KB_RETRIEVAL_CANDIDATES,
+    KB_RRF_K,
+    KB_WATCH_INTERVAL,
+)
+from .embedding_cache import EmbeddingCache, atomic_write_json, content_hash
+from .index_factory import IndexBuilder, IndexConfig, configure_search, search_subset
+from .lexical_index import BM25Index, reciprocal_rank_fusion
+from .lru_cache import LRUCache
+from .telemetry import metrics, tracer
+
+# faiss e sentence_transformers (que carrega o torch) são importados só quando o índice
+# ou o modelo são de fato usados: importar este módulo, ou criar a KnowledgeBase, é barato.
+if TYPE_CHECKING:
+    import faiss
+    from sentence_transformers import SentenceTransformer
+
+logger = logging.getLogger(__name__)
+_queries = metrics.counter("agent_kb_queries_total", "Consultas à base de conhecimento, por resultado (hit, no_results, empty).")
+_results = metrics.counter("agent_kb_results_total", "Chunks devolvidos pelas buscas na base de conhecimento.")
+
+INDEX_FILENAME = "index.faiss"
+DOCUMENTS_FILENAME = "documents.json"
+MANIFEST_FILENAME = "manifest.json"
+RETRIEVAL_MODES = ("vector", "lexical", "hybrid")
+
+
+def _read_index(path: str):
+    """Lê um índice FAISS do disco usando memory-map quando o tipo de índice permite."""
+    import faiss
+    for flag in ("IO_FLAG_MMAP_IFC", "IO_FLAG_MMAP"):
+        if hasattr(faiss, flag):
+            try:
+                return faiss.read_index(path, getattr(faiss, flag))
+            except RuntimeError:
+                continue
+    return faiss.read_index(path)
+
+
+@dataclass
+class SearchResult:
+    """
+    Um chunk retornado pela busca, com sua procedência e seus scores. `score` é o da
+    busca vetorial: a distância até a consulta (métrica "l2", menor é melhor) ou a
+    similaridade (métrica "ip", maior é melhor); é None se o chunk veio só do BM25.
+    `lexical_score` é o score BM25 (None se o chunk não contém termos da consulta) e
+    `fused_score`, na recuperação híbrida, o score RRF que define a ordem dos resultados.
+    """
+    text: str
+    source: str
+    start: int
+    end: int
+    score: Optional[float]
+    lexical_score: Optional[float] = None
+    fused_score: Optional[float] = None
+
+    @property
+    def provenance(self) -> str:
+        return f"{self.source}:{self.start}-{self.end}"
+
+
+@dataclass
+class _IndexView:
+    """
+    Snapshot do índice e dos chunks (por id) que as buscas enxergam. Nunca é alterado
+    depois de publicado: cada atualização monta um novo e troca a referência de uma vez.
+    """
+    index: Optional["faiss.Index"] = None
+    chunks: Dict[int, Chunk] = field(default_factory=dict)
+    generation: int = 0
+    lexical: Optional[BM25Index] = None
+
 
 class KnowledgeBase:
     """
     Gerencia uma base de conhecimento vetorial usando FAISS e SentenceTransformers.
+
+    A ingestão é um pipeline em streaming: os arquivos são lidos um a um, divididos em
+    chunks com sobreposição (por tokens ou por sentenças), codificados em lotes de
+    tamanho fixo e adicionados ao índice de forma incremental. O pico de memória da
+    ingestão depende do tamanho do lote, e não do tamanho do corpus.
+
+    O índice, os chunks e um cache hash-do-conteúdo → embedding são persistidos em
+    `cache_dir`. Se nenhum arquivo mudou desde a última execução, o índice é apenas
+    carregado (com memory-map); caso contrário, só os chunks novos ou alterados são
+    codificados novamente, e os embeddings de arquivos removidos são descartados.
+
+    O tipo de índice (busca exata ou aproximada com IVF-Flat, IVF-PQ ou HNSW) é
+    definido por um `IndexConfig`. Embeddings de consultas e resultados de busca
+    ficam em caches LRU com TTL, de modo que perguntas repetidas não são recodificadas.
+
+    Cada chunk tem um id estável no índice (`IndexIDMap2`). `refresh()` aplica
+    inclusões, alterações e remoções de arquivos sem reconstruir tudo, e
+    `start_watching()` o chama periodicamente em uma thread de fundo. As buscas em
+    andamento continuam usando o snapshot anterior até a troca atômica.
+
+    Junto com o índice vetorial é mantido um índice invertido BM25 dos mesmos chunks,
+    que acerta identificadores, nomes de arquivo e mensagens de erro exatos. Com
+    `retrieval="hybrid"`, os dois rankings são combinados por reciprocal-rank fusion;
+    com `lexical_prefilter=N`, a busca vetorial fica restrita aos N melhores do BM25.
+
+    Por padrão (`lazy=True`), criar a KnowledgeBase não lê nada do disco: o índice é
+    carregado na primeira busca e o modelo, quando há algo a codificar. `warm_up()`
+    antecipa as duas cargas em uma thread de fundo.
     """
-    def __init__(self, model_name: str = 'all-MiniLM-L6-v2', knowledge_dir: str = './knowledge'):
+    def __init__(
+        self,
+        model_name: str = 'all-MiniLM-L6-v2',
+        knowledge_dir: str = './knowledge',
+        cache_dir: Optional[str] = None,
+        model: Optional["SentenceTransformer"] = None,
+        chunk_size: int = KB_CHUNK_SIZE,
+        chunk_overlap: int = KB_CHUNK_OVERLAP,
+        chunk_strategy: str = KB_CHUNK_STRATEGY,
+        batch_size: int = KB_ENCODE_BATCH_SIZE,
+        index_config: Optional[IndexConfig] = None,
+        lazy: bool = True,
+        retrieval: str = KB_RETRIEVAL,
+        rrf_k: int = KB_RRF_K,
+        candidates: int = KB_RETRIEVAL_CANDIDATES,
+        lexical_prefilter: int = KB_LEXICAL_PREFILTER,
+    ):
+        if chunk_overlap >= chunk_size:
+            raise ValueError("chunk_overlap deve ser menor que chunk_size.")
+        if retrieval not in RETRIEVAL_MODES:
+            raise ValueError(f"Modo de recuperação desconhecido: '{retrieval}'. Use um de {RETRIEVAL_MODES}.")
         self.knowledge_dir = knowledge_dir
-        self.model = SentenceTransformer(model_name)
-        self.index: Optional[faiss.IndexFlatL2] = None
-        self.documents: List[str] = []
-        self._build_index()
-
-    def _load_documents(self):
-        """Carrega documentos de texto do diretório de conhecimento."""
-        print(f"Carregando documentos de: {self.knowledge_dir}")
-        if not os.path.exists(self.knowledge_dir):
-            print(f"Diretório de conhecimento '{self.knowledge_dir}' não encontrado. A base de conhecimento estará vazia.")
+        self.model_name = model_name
+        self.cache_dir = cache_dir or os.path.join(knowledge_dir, ".kb_cache")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.chunk_strategy = chunk_strategy
+        self.batch_size = batch_size
+        self.index_config = index_config or IndexConfig()
+        self.retrieval = retrieval
+        self.rrf_k = rrf_k
+        self.candidates = candidates
+        self.lexical_prefilter = lexical_prefilter
+        # Um modelo já carregado pode ser reaproveitado; deve corresponder a `model_name`.
+        # Sem ele, o modelo só é carregado quando algo precisa ser codificado.
+        self._model = model
+        self._model_lock = threading.Lock()
+        self._loaded = False
+        self._view = _IndexView()
+        # Estado (mtime/tamanho) dos arquivos refletidos no snapshot atual.
+        self._files: Dict[str, Dict[str, float]] = {}
+        self._next_id = 0
+        self._update_lock = threading.Lock()
+        self._watch_thread: Optional[threading.Thread] = None
+        self._watch_stop = threading.Event()
+        self._query_cache = LRUCache(KB_QUERY_CACHE_SIZE, KB_QUERY_CACHE_TTL, name="kb_query_embeddings")
+        self._result_cache = LRUCache(KB_QUERY_CACHE_SIZE, KB_QUERY_CACHE_TTL, name="kb_results")
+        if not lazy:
+            self.load()
+
+    @property
+    def index(self) -> Optional["faiss.Index"]:
+        self.load()
+        return self._view.index
+
+    @property
+    def documents(self) -> List[Chunk]:
+        self.load()
+        return list(self._view.chunks.values())
+
+    @property
+    def model(self) -> "SentenceTransformer":
+        """O modelo de embeddings, carregado no primeiro uso."""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    with tracer.span("kb.load_model", model=self.model_name):
+                        from sentence_transformers import SentenceTransformer
+                        self._model = SentenceTransformer(self.model_name)
+        return self._model
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    def load(self):
+        """
+        Carrega o índice do cache ou o constrói, se ainda não foi feito. É chamado pela
+        primeira busca (ou por `index`, `documents`, `refresh` e `warm_up`).
+        """
+        if self._loaded:
             return
+        with self._update_lock:
+            if not self._loaded:
+                with tracer.span("kb.load"):
+                    self._build_index()
+                self._loaded = True
 
-        for filename in os.listdir(self.knowledge_dir):
+    def warm_up(self) -> threading.Thread:
+        """
+        Carrega o índice e o modelo em uma thread de fundo, para que a primeira busca
+        não pague esse custo. Devolve a thread (já iniciada).
+        """
+        thread = threading.Thread(target=self._warm_up, name="kb-warmup", daemon=True)
+        thread.start()
+        return thread
+
+    def _warm_up(self):
+        try:
+            self.load()
+            self.model
+        except Exception as e:
+            logger.exception("Falha ao aquecer a base de conhecimento: %s", e)
+
+    def _settings(self) -> dict:
+        """Parâmetros que, se mudarem, invalidam o índice salvo."""
+        return {
+            "model_name": self.model_name,
+            "chunk_size": self.chunk_size,
+            "chunk_overlap": self.chunk_overlap,
+            "chunk_strategy": self.chunk_strategy,
+            "index": self.index_config.build_settings(),
+        }
+
+    def _scan_files(self) -> Dict[str, Dict[str, float]]:
+        """Lista os arquivos .txt do diretório de conhecimento com seu mtime e tamanho."""
+        files = {}
+        if not os.path.exists(self.knowledge_dir):
+            return files
+        for filename in sorted(os.listdir(self.knowledge_dir)):
             if filename.endswith(".txt"):
-                filepath = os.path.join(self.knowledge_dir, filename)
+                stat = os.stat(os.path.join(self.knowledge_dir, filename))
+                files[filename] = {"mtime": stat.st_mtime, "size": stat.st_size}
+        return files
+
+    def _iter_files(self, filenames: Iterable[str]) -> Iterator[Tuple[str, str]]:
+        """Lê os arquivos de conhecimento um de cada vez, produzindo (nome, conteúdo)."""
+        for filename in filenames:
+            filepath = os.path.join(self.knowledge_dir, filename)
+            try:
                 with open(filepath, 'r', encoding='utf-8') as f:
-                    # Simplesmente adiciona o conteúdo do arquivo inteiro como um documento.
-                    # Para textos longos, uma estratégia de "chunking" (divisão) seria melhor.
-                    self.documents.append(f.read())
-        print(f"Carregados {len(self.documents)} documentos.")
+                    yield filename, f.read()
+            except FileNotFoundError:
+                # Removido entre a listagem e a leitura; a próxima atualização o descarta.
+                continue
+
+    def _token_limit(self) -> Tuple[Optional[Callable[[str], int]], Optional[int]]:
+        """
+        Contador de tokens e tamanho máximo de sequência do modelo de embeddings, para
+        que nenhum chunk seja truncado por ele. Modelos sem tokenizador (como os
+        codificadores de teste) não limitam os chunks.
+        """
+        tokenizer = getattr(self.model, "tokenizer", None)
+        max_seq_length = getattr(self.model, "max_seq_length", None)
+        if tokenizer is None or not max_seq_length:
+            return None, None
+        # Os tokens especiais ([CLS], [SEP]) também ocupam posições da sequência.
+        return (lambda text: len(tokenizer.tokenize(text))), max_seq_length - tokenizer.num_special_tokens_to_add()
+
+    def _iter_chunks(self, filenames: Iterable[str]) -> Iterator[Chunk]:
+        limit = None
+        for filename, text in self._iter_files(filenames):
+            if limit is None:
+                # O tokenizador vem com o modelo: ele só é carregado quando há arquivos para chunkar.
+                limit = self._token_limit()
+            yield from chunk_text(text, filename, self.chunk_size, self.chunk_overlap, self.chunk_strategy, *limit)
+
+    def _read_manifest(self) -> Optional[dict]:
+        path = os.path.join(self.cache_dir, MANIFEST_FILENAME)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _load_cached_index(self, files: Dict[str, Dict[str, float]]) -> bool:
+        """Carrega índice e chunks do cache se nenhum arquivo nem parâmetro mudou desde que foram salvos."""
+        manifest = self._read_manifest()
+        if not manifest or manifest.get("settings") != self._settings() or manifest.get("files") != files:
+            return False
+        try:
+            with open(os.path.join(self.cache_dir, DOCUMENTS_FILENAME), 'r', encoding='utf-8') as f:
+                records = json.load(f)
+            chunks = {}
+            for record in records:
+                chunk_id = record.pop("id")
+                chunks[chunk_id] = Chunk(**record)
+            index = None
+            if chunks:
+                index = _read_index(os.path.join(self.cache_dir, INDEX_FILENAME))
+                configure_search(index, self.index_config)
+        except (OSError, ValueError, TypeError, KeyError, RuntimeError) as e:
+            logger.warning("Não foi possível carregar o índice do cache: %s", e)
+            return False
+        lexical = BM25Index.load(self.cache_dir)
+        if lexical is None or set(lexical.ids.tolist()) != set(chunks):
+            # Cache anterior ao índice lexical (ou incompleto): basta reconstruí-lo a partir dos chunks.
+            lexical = self._build_lexical(chunks)
+            lexical.save(self.cache_dir)
+        self._view = _IndexView(index, chunks, self._view.generation + 1, lexical)
+        self._files = files
+        self._next_id = max(chunks, default=-1) + 1
+        return True
+
+    def _save_cache(self):
+        view = self._view
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if view.index is not None:
+            import faiss
+            index_path = os.path.join(self.cache_dir, INDEX_FILENAME)
+            tmp_path = f"{index_path}.tmp-{os.getpid()}"
+            faiss.write_index(view.index, tmp_path)
+            os.replace(tmp_path, index_path)
+        if view.lexical is not None:
+            view.lexical.save(self.cache_dir)
+        records = [dict(chunk.to_dict(), id=chunk_id) for chunk_id, chunk in view.chunks.items()]
+        atomic_write_json(os.path.join(self.cache_dir, DOCUMENTS_FILENAME), records)
+        # O manifesto é escrito por último: só é válido quando o resto já está no disco.
+        atomic_write_json(os.path.join(self.cache_dir, MANIFEST_FILENAME), {"settings": self._settings(), "files": self._files})
+
+    def _encode_batch(self, chunks: List[Chunk], cache: EmbeddingCache) -> Tuple[np.ndarray, int]:
+        """
+        Devolve os embeddings de um lote e quantos chunks precisaram ser codificados
+        (os demais vêm do cache).
+        """
+        hashes = [content_hash(chunk.text) for chunk in chunks]
+        missing = {}
+        for chunk_hash, chunk in zip(hashes, chunks):
+            if chunk_hash not in cache:
+                missing.setdefault(chunk_hash, chunk.text)
+        if missing:
+            new_embeddings = self.model.encode(list(missing.values()), convert_to_tensor=False)
+            for chunk_hash, embedding in zip(missing, new_embeddings):
+                cache.put(chunk_hash, embedding)
+            # Os vetores novos vão para o disco a cada lote, em vez de se acumularem até o `save()`.
+            cache.flush()
+        # Assegurar que os embeddings são do tipo float32, que é o que o FAISS espera.
+        embeddings = np.array([cache.get(chunk_hash) for chunk_hash in hashes]).astype('float32')
+        return embeddings, len(missing)
+
+    def _ingest(self, filenames: Iterable[str], cache: EmbeddingCache, add: Callable[[List[Chunk], np.ndarray, np.ndarray], None]) -> int:
+        """
+        Chunka e codifica os arquivos em lotes, atribuindo ids novos a cada chunk e
+        repassando (chunks, embeddings, ids) a `add`. Retorna quantos chunks foram codificados.
+        """
+        encoded = 0
+        for batch in batched(self._iter_chunks(filenames), self.batch_size):
+            embeddings, batch_encoded = self._encode_batch(batch, cache)
+            encoded += batch_encoded
+            ids = np.arange(self._next_id, self._next_id + len(batch), dtype="int64")
+            self._next_id += len(batch)
+            add(batch, embeddings, ids)
+        return encoded
+
+    def _publish(self, index: Optional["faiss.Index"], chunks: Dict[int, Chunk], files: Dict[str, Dict[str, float]], cache: EmbeddingCache):
+        """Troca atomicamente o snapshot pesquisável e persiste o novo estado."""
+        self._view = _IndexView(index, chunks, self._view.generation + 1, self._build_lexical(chunks))
+        self._files = files
+        # Mantém no cache apenas os embeddings ainda em uso (descarta arquivos removidos).
+        cache.save(keep=[content_hash(chunk.text) for chunk in chunks.values()])
+        self._save_cache()
+
+    @staticmethod
+    def _build_lexical(chunks: Dict[int, Chunk]) -> BM25Index:
+        with tracer.span("kb.build_lexical", chunks=len(chunks)):
+            return BM25Index.build((chunk_id, chunk.text) for chunk_id, chunk in chunks.items())
 
     def _build_index(self):
-        """Constrói ou reconstrói o índice FAISS a partir dos documentos."""
-        self._load_documents()
-        if not self.documents:
-            print("Nenhum documento para indexar.")
+        """Carrega o índice do cache ou o (re)constrói, codificando apenas chunks novos ou alterados."""
+        files = self._scan_files()
+        if self._load_cached_index(files):
+            logger.info("Índice carregado do cache com %s vetores.", self._view.index.ntotal if self._view.index else 0)
             return
 
-        print("Codificando documentos e construindo índice FAISS...")
-        embeddings = self.model.encode(self.documents, convert_to_tensor=False)
+        logger.info("Indexando documentos de: %s", self.knowledge_dir)
+        if not os.path.exists(self.knowledge_dir):
+            logger.warning("Diretório de conhecimento '%s' não encontrado. A base de conhecimento estará vazia.", self.knowledge_dir)
+            return
+        self._rebuild(files)
 
-        # Assegurar que os embeddings são do tipo float32, que é o que o FAISS espera.
-        embeddings = np.array(embeddings).astype('float32')
+    def _rebuild(self, files: Dict[str, Dict[str, float]]):
+        """Reconstrói o índice inteiro em streaming (os embeddings inalterados vêm do cache)."""
+        cache = EmbeddingCache(self.cache_dir)
+        builder = IndexBuilder(self.index_config)
+        chunks: Dict[int, Chunk] = {}
+
+        def add(batch, embeddings, ids):
+            builder.add(embeddings, ids)
+            chunks.update(zip(ids.tolist(), batch))
+
+        encoded = self._ingest(files, cache, add)
+        index = builder.finish()
+        if index is None:
+            logger.info("Nenhum documento para indexar.")
+        else:
+            logger.info(
+                "Índice construído com %s chunks de %s arquivos (%s codificados, %s reaproveitados do cache).",
+                index.ntotal, len(files), encoded, index.ntotal - encoded,
+            )
+        self._publish(index, chunks, files, cache)
+
+    def _writable_copy(self, index: "faiss.Index") -> "faiss.Index":
+        """
+        Cópia do índice totalmente em memória. Um índice carregado com memory-map
+        continua apontando para o arquivo (somente leitura), por isso `clone_index` não
+        serve; se nem a serialização funcionar, relê do disco o arquivo do snapshot atual.
+        """
+        import faiss
+        try:
+            return faiss.deserialize_index(faiss.serialize_index(index))
+        except RuntimeError:
+            return faiss.read_index(os.path.join(self.cache_dir, INDEX_FILENAME))
+
+    def refresh(self) -> bool:
+        """
+        Aplica de forma incremental as mudanças no diretório de conhecimento desde o
+        último snapshot: remove os chunks de arquivos alterados ou apagados e indexa os
+        de arquivos novos ou alterados. Retorna True se algo mudou.
+        """
+        if not self._loaded:
+            # A primeira carga já reflete o estado atual do diretório.
+            self.load()
+            return False
+        with self._update_lock:
+            files = self._scan_files()
+            if files == self._files:
+                return False
+
+            added = [f for f in files if f not in self._files]
+            changed = [f for f in files if f in self._files and files[f] != self._files[f]]
+            deleted = [f for f in self._files if f not in files]
+            logger.info("Atualizando a base de conhecimento: %s novos, %s alterados, %s removidos.", len(added), len(changed), len(deleted))
+
+            view = self._view
+            if view.index is None or not self.index_config.supports_removal:
+                self._rebuild(files)
+                return True
+            try:
+                # O snapshot publicado nunca é alterado: as mudanças são aplicadas em uma cópia.
+                index = self._writable_copy(view.index)
+            except RuntimeError as e:
+                logger.warning("Não foi possível copiar o índice (%s). Reconstruindo a partir do cache.", e)
+                self._rebuild(files)
+                return True
+
+            stale = set(changed) | set(deleted)
+            chunks = {chunk_id: chunk for chunk_id, chunk in view.chunks.items() if chunk.source not in stale}
+            stale_ids = [chunk_id for chunk_id, chunk in view.chunks.items() if chunk.source in stale]
+            if stale_ids:
+                index.remove_ids(np.array(stale_ids, dtype="int64"))
+
+            cache = EmbeddingCache(self.cache_dir)
+
+            def add(batch, embeddings, ids):
+                index.add_with_ids(self.index_config.prepare(embeddings), ids)
+                chunks.update(zip(ids.tolist(), batch))
 
-        dimension = embeddings.shape[1]
-        self.index = faiss.IndexFlatL2(dimension)
-        self.index.add(embeddings)
-        print(f"Índice construído com {self.index.ntotal} vetores.")
+            encoded = self._ingest(added + changed, cache, add)
+            configure_search(index, self.index_config)
+            self._publish(index, chunks, files, cache)
+            logger.info("Base de conhecimento atualizada: %s chunks (%s codificados).", index.ntotal, encoded)
+            return True
 
-    def search(self, query: str, k: int = 3) -> List[str]:
+    def start_watching(self, interval: float = KB_WATCH_INTERVAL):
+        """Inicia uma thread que verifica o diretório a cada `interval` segundos e aplica as mudanças."""
+        if self._watch_thread is not None and self._watch_thread.is_alive():
+            return
+        self._watch_stop.clear()
+        self._watch_thread = threading.Thread(target=self._watch_loop, args=(interval,), name="kb-watcher", daemon=True)
+        self._watch_thread.start()
+
+    def stop_watching(self):
+        self._watch_stop.set()
+        if self._watch_thread is not None:
+            self._watch_thread.join()
+            self._watch_thread = None
+
+    def _watch_loop(self, interval: float):
+        while not self._watch_stop.wait(interval):
+            if not self._loaded:
+                # Ainda não carregada: a primeira carga já lerá o estado atual do diretório.
+                continue
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.exception("Erro ao atualizar a base de conhecimento: %s", e)
+
+    def search(self, query: str, k: int = 3) -> List[SearchResult]:
         """
         Busca na base de conhecimento por trechos relevantes para a consulta.
-        Retorna os 'k' documentos mais relevantes.
+        Retorna os 'k' chunks mais relevantes com sua procedência (arquivo e offsets).
         """
-        if not self.index or self.index.ntotal == 0:
-            return ["A base de conhecimento está vazia."]
+        return self.search_many([query], k)[0]
+
+    def search_many(self, queries: List[str], k: int = 3) -> List[List[SearchResult]]:
+        """
+        Busca várias consultas de uma vez: as consultas sem resultado em cache são
+        codificadas em um único lote e resolvidas com uma única chamada a `index.search`
+        (e, conforme `retrieval`, também no BM25, com fusão dos rankings).
+        Retorna, para cada consulta (na mesma ordem), os 'k' chunks mais relevantes.
+        """
+        self.load()
+        # Uma única leitura do snapshot: uma atualização concorrente não afeta esta busca.
+        view = self._view
+        with tracer.span("kb.search", queries=len(queries), k=k) as span:
+            if view.index is None or view.index.ntotal == 0:
+                logger.debug("A base de conhecimento está vazia.")
+                _queries.inc(len(queries), result="empty")
+                return [[] for _ in queries]
+
+            results: Dict[str, List[SearchResult]] = {}
+            pending = []
+            for query in dict.fromkeys(queries):
+                cached = self._result_cache.get((view.generation, query, k))
+                if cached is not None:
+                    results[query] = cached
+                else:
+                    pending.append(query)
+
+            if pending:
+                logger.debug("Buscando na base de conhecimento por %d consulta(s): %s", len(pending), pending)
+                # Na fusão, cada busca contribui com mais candidatos do que os `k` devolvidos.
+                depth = k if self.retrieval == "vector" else max(k, self.candidates)
+                lexical: Dict[str, List[Tuple[int, float]]] = {}
+                if self.retrieval != "vector" or self.lexical_prefilter:
+                    with tracer.span("kb.bm25", queries=len(pending)):
+                        lexical = {query: view.lexical.search(query, max(depth, self.lexical_prefilter)) for query in pending}
+                vector: Dict[str, List[Tuple[int, float]]] = {}
+                if self.retrieval != "lexical":
+                    vector = self._vector_search(view, pending, depth, lexical)
+                for query in pending:
+                    found = self._rank(view, vector.get(query, []), lexical.get(query, [])[:depth], k)
+                    self._result_cache.put((view.generation, query, k), found)
+                    results[query] = found
+
+            found_total = sum(len(results[q]) for q in queries)
+            span.set(results=found_total, cached=len(queries) - len(pending))
+            _results.inc(found_total)
+            for query in queries:
+                _queries.inc(result="hit" if results[query] else "no_results")
+            logger.debug("Encontrados %d resultados relevantes para %d consulta(s).", found_total, len(queries))
+            return [list(results[query]) for query in queries]
+
+    def _vector_search(self, view: _IndexView, queries: List[str], k: int, lexical: Dict[str, List[Tuple[int, float]]]) -> Dict[str, List[Tuple[int, float]]]:
+        """
+        Os `k` vizinhos (id do chunk, score) de cada consulta no índice FAISS. Com o
+        pré-filtro lexical, cada consulta busca só entre os seus melhores chunks do BM25;
+        as consultas sem nenhum termo no vocabulário buscam, em lote, no índice inteiro.
+        """
+        with tracer.span("kb.embed", queries=len(queries)):
+            embeddings = self._embed_queries(queries)
+        prefilter = {}
+        if self.lexical_prefilter:
+            prefilter = {query: [chunk_id for chunk_id, _ in lexical[query][:self.lexical_prefilter]] for query in queries}
+        hits: Dict[str, List[Tuple[int, float]]] = {}
+
+        def collect(rows: List[int], distances: np.ndarray, ids: np.ndarray):
+            for row, found_distances, found_ids in zip(rows, distances, ids):
+                hits[queries[row]] = [
+                    (int(chunk_id), float(distance))
+                    for distance, chunk_id in zip(found_distances, found_ids)
+                    if int(chunk_id) in view.chunks
+                ]
+
+        with tracer.span("kb.faiss", queries=len(queries), vectors=view.index.ntotal, prefiltered=len(prefilter)):
+            unfiltered = [row for row, query in enumerate(queries) if not prefilter.get(query)]
+            if unfiltered:
+                collect(unfiltered, *view.index.search(embeddings[unfiltered], k))
+            for row, query in enumerate(queries):
+                if prefilter.get(query):
+                    ids = np.array(prefilter[query], dtype="int64")
+                    collect([row], *search_subset(view.index, self.index_config, embeddings[row:row + 1], k, ids))
+        return hits
 
-        print(f"Buscando na base de conhecimento por: '{query}'")
-        query_embedding = self.model.encode([query])
-        query_embedding = np.array(query_embedding).astype('float32')
+    def _rank(self, view: _IndexView, vector: List[Tuple[int, float]], lexical: List[Tuple[int, float]], k: int) -> List[SearchResult]:
+        """Os `k` melhores chunks segundo o modo de recuperação, com os scores de cada busca."""
+        vector_scores, lexical_scores = dict(vector), dict(lexical)
+        if self.retrieval == "hybrid":
+            ranked = reciprocal_rank_fusion([list(vector_scores), list(lexical_scores)], self.rrf_k)
+        else:
+            ranked = [(chunk_id, None) for chunk_id, _ in (vector if self.retrieval == "vector" else lexical)]
+        found = []
+        for chunk_id, fused in ranked[:k]:
+            chunk = view.chunks[chunk_id]
+            found.append(SearchResult(
+                chunk.text, chunk.source, chunk.start, chunk.end,
+                vector_scores.get(chunk_id), lexical_scores.get(chunk_id), fused,
+            ))
+        return found
 
-        distances, indices = self.index.search(query_embedding, k)
+    def _embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Embeddings das consultas, codificando em um único lote apenas as ausentes do cache."""
+        vectors = {query: self._query_cache.get(query) for query in queries}
+        missing = [query for query, vector in vectors.items() if vector is None]
+        if missing:
+            encoded = self.index_config.prepare(np.array(self.model.encode(missing)))
+            for query, vector in zip(missing, encoded):
+                self._query_cache.put(query, vector)
+                vectors[query] = vector
+        return np.vstack([vectors[query] for query in queries])
 
-        results = [self.documents[i] for i in indices[0] if i < len(self.documents)]
-        print(f"Encontrados {len(results)} resultados relevantes.")
-        return results
+    def cache_stats(self) -> Dict[str, dict]:
+        """Contadores de acerto/erro dos caches de embeddings de consulta e de resultados."""
+        return {"query_embeddings": self._query_cache.stats(), "results": self._result_cache.stats()}
 
 # Exemplo de uso
 if __name__ == '__main__':
     # Para testar, crie um diretório './knowledge' e adicione alguns arquivos .txt nele.
     # Ex: ./knowledge/ia.txt -> "Inteligência artificial é a simulação da inteligência humana em máquinas."
     # Ex: ./knowledge/python.txt -> "Python é uma linguagem de programação de alto nível."
+    from .telemetry import configure_logging
 
+    configure_logging()
     if not os.path.exists('./knowledge'):
         os.makedirs('./knowledge')
         with open('./knowledge/ia.txt', 'w') as f:
@@ -86,11 +638,11 @@ if __name__ == '__main__':
         search_results = kb.search("O que é IA?")
         print("\nResultados da busca por 'O que é IA?':")
         for res in search_results:
-            print(f"- {res}")
+            print(f"- {res.text} ({res.provenance})")
 
         search_results_py = kb.search("Me fale sobre linguagens de programação")
         print("\nResultados da busca por 'Me fale sobre linguagens de programação':")
         for res in search_results_py:
-            print(f"- {res}")
+            print(f"- {res.text} ({res.provenance})")
     else:
         print("\nNão foi possível testar a busca pois o índice não foi construído.")
@@ -0,0 +1,149 @@
+import json
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from itertools import chain
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .embedding_cache import atomic_write_json
+
+# Termos: palavras, e também identificadores compostos como `data_loader.py`,
+# `os.path.join` ou `ERR-42`, que são mantidos inteiros além de divididos em partes.
+_TERM_RE = re.compile(r"\w+(?:[.\-/:]\w+)*")
+_PART_RE = re.compile(r"[^\W_]+")
+LEXICAL_META_FILENAME = "lexical.json"
+_ARRAYS = ("offsets", "docs", "tfs", "lengths", "ids")
+
+
+def tokenize(text: str) -> List[str]:
+    """Termos (em minúsculas) de um texto, para o índice BM25 e para as consultas."""
+    terms = []
+    for match in _TERM_RE.finditer(text.lower()):
+        term = match.group()
+        terms.append(term)
+        parts = _PART_RE.findall(term)
+        if len(parts) > 1 or (parts and parts[0] != term):
+            terms.extend(parts)
+    return terms
+
+
+class BM25Index:
+    """
+    Índice invertido com ranking BM25, guardado em arrays numpy.
+
+    As postings de todos os termos ficam concatenadas em `docs` (posição do documento)
+    e `tfs` (frequência do termo); `offsets[t]:offsets[t + 1]` delimita as do termo `t`.
+    `ids` traduz a posição do documento para o id do chunk na KnowledgeBase. Os arrays
+    são salvos como .npy e carregados com memory-map, como o índice FAISS.
+
+    O índice é imutável: uma atualização da base constrói um novo.
+    """
+    def __init__(
+        self,
+        terms: Sequence[str],
+        offsets: np.ndarray,
+        docs: np.ndarray,
+        tfs: np.ndarray,
+        lengths: np.ndarray,
+        ids: np.ndarray,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.terms = list(terms)
+        self.vocabulary: Dict[str, int] = {term: i for i, term in enumerate(self.terms)}
+        self.offsets = offsets
+        self.docs = docs
+        self.tfs = tfs
+        self.lengths = lengths
+        self.ids = ids
+        self.k1 = k1
+        self.b = b
+        self.avg_length = float(lengths.mean()) if len(lengths) else 0.0
+
+    @classmethod
+    def build(cls, documents: Iterable[Tuple[int, str]], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """Constrói o índice a partir de pares (id do chunk, texto)."""
+        postings_docs: Dict[str, List[int]] = defaultdict(list)
+        postings_tfs: Dict[str, List[int]] = defaultdict(list)
+        ids, lengths = [], []
+        for position, (chunk_id, text) in enumerate(documents):
+            counts = Counter(tokenize(text))
+            ids.append(chunk_id)
+            lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings_docs[term].append(position)
+                postings_tfs[term].append(tf)
+
+        terms = sorted(postings_docs)
+        offsets = np.zeros(len(terms) + 1, dtype="int64")
+        offsets[1:] = np.cumsum([len(postings_docs[term]) for term in terms])
+        total = int(offsets[-1])
+        docs = np.fromiter(chain.from_iterable(postings_docs[t] for t in terms), dtype="int32", count=total)
+        tfs = np.fromiter(chain.from_iterable(postings_tfs[t] for t in terms), dtype="float32", count=total)
+        return cls(terms, offsets, docs, tfs, np.array(lengths, dtype="float32"), np.array(ids, dtype="int64"), k1, b)
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def scores(self, query: str) -> np.ndarray:
+        """Score BM25 da consulta para cada documento (por posição)."""
+        scores = np.zeros(len(self.ids), dtype="float32")
+        n = len(self.ids)
+        for term in set(tokenize(query)):
+            term_id = self.vocabulary.get(term)
+            if term_id is None:
+                continue
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs, tfs = self.docs[start:end], self.tfs[start:end]
+            df = end - start
+            idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * self.lengths[docs] / self.avg_length)
+            # Cada documento aparece uma única vez nas postings de um termo.
+            scores[docs] += idf * tfs * (self.k1 + 1) / (tfs + norm)
+        return scores
+
+    def search(self, query: str, k: int) -> List[Tuple[int, float]]:
+        """Os `k` chunks com maior score BM25 (apenas os que contêm algum termo da consulta)."""
+        scores = self.scores(query)
+        matched = np.flatnonzero(scores)
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        order = matched[np.argsort(-scores[matched], kind="stable")]
+        return [(int(self.ids[position]), float(scores[position])) for position in order]
+
+    def save(self, directory: str):
+        """Salva os arrays (.npy) e o vocabulário; o arquivo de metadados é escrito por último."""
+        os.makedirs(directory, exist_ok=True)
+        for name in _ARRAYS:
+            path = os.path.join(directory, f"lexical.{name}.npy")
+            tmp_path = f"{path}.tmp-{os.getpid()}"
+            with open(tmp_path, "wb") as f:
+                np.save(f, getattr(self, name))
+            os.replace(tmp_path, path)
+        atomic_write_json(os.path.join(directory, LEXICAL_META_FILENAME), {"k1": self.k1, "b": self.b, "terms": self.terms})
+
+    @classmethod
+    def load(cls, directory: str) -> Optional["BM25Index"]:
+        """Carrega um índice salvo por `save` (arrays com memory-map), ou None se não houver."""
+        try:
+            with open(os.path.join(directory, LEXICAL_META_FILENAME), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            arrays = {name: np.load(os.path.join(directory, f"lexical.{name}.npy"), mmap_mode="r") for name in _ARRAYS}
+        except (OSError, ValueError):
+            return None
+        return cls(meta["terms"], k1=meta["k1"], b=meta["b"], **arrays)
+
+
+def reciprocal_rank_fusion(rankings: Iterable[Sequence[int]], k: int = 60) -> List[Tuple[int, float]]:
+    """
+    Combina rankings (listas de ids, do melhor ao pior) somando 1 / (k + posição) de
+    cada id em cada ranking. Devolve (id, score) do maior para o menor score.
+    """
+    fused: Dict[int, float] = defaultdict(float)
+    for ranking in rankings:
+        for rank, item in enumerate(ranking, start=1):
+            fused[item] += 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda pair: pair[1], reverse=True)
@@ -0,0 +1,169 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Deque, Dict, Hashable, List, Optional
+
+from .config import LLM_API_BASE, LLM_MAX_CONNECTIONS, LLM_MAX_INFLIGHT, LLM_MODEL_NAME, LLM_TIMEOUT, OPENAI_API_KEY
+from .replay_cache import ReplayCache, llm_key
+from .telemetry import metrics, tracer
+
+# O SDK da OpenAI (e o httpx) só são importados ao criar o cliente.
+if TYPE_CHECKING:
+    import openai
+
+_first_token = metrics.histogram("agent_llm_time_to_first_token_seconds", "Tempo até o primeiro trecho de cada resposta do LLM em streaming.")
+
+
+def create_llm_client(max_connections: int = LLM_MAX_CONNECTIONS, base_url: str = LLM_API_BASE) -> "openai.AsyncOpenAI":
+    """
+    Cria um cliente assíncrono do servidor LLM sobre um pool de conexões HTTP keep-alive.
+
+    Um mesmo cliente pode (e deve) ser compartilhado por vários agentes rodando no mesmo
+    event loop: as requisições concorrentes reaproveitam as conexões abertas do pool.
+    """
+    import httpx
+    import openai
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        timeout=httpx.Timeout(LLM_TIMEOUT, connect=10.0),
+    )
+    return openai.AsyncOpenAI(api_key=OPENAI_API_KEY, base_url=base_url, http_client=http_client)
+
+
+class FairLimiter:
+    """
+    Limita as requisições simultâneas ao servidor LLM, com justiça entre chaves.
+
+    Até `max_concurrent` requisições ficam em andamento; as excedentes esperam em uma
+    fila por chave (por exemplo, por usuário) e as vagas liberadas são entregues em
+    rodízio entre as chaves com espera. Assim, quem abre muitas sessões não atrasa as
+    requisições dos demais, e o servidor recebe no máximo o lote que consegue atender.
+
+    Deve ser usado a partir de um único event loop.
+    """
+    def __init__(self, max_concurrent: int = LLM_MAX_INFLIGHT):
+        if max_concurrent < 1:
+            raise ValueError("max_concurrent deve ser pelo menos 1.")
+        self.max_concurrent = max_concurrent
+        self.active = 0
+        self._waiters: "OrderedDict[Hashable, Deque[asyncio.Future]]" = OrderedDict()
+
+    @property
+    def waiting(self) -> int:
+        return sum(len(queue) for queue in self._waiters.values())
+
+    @asynccontextmanager
+    async def slot(self, key: Hashable = None) -> AsyncIterator[None]:
+        await self.acquire(key)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, key: Hashable = None):
+        if self.active < self.max_concurrent and not self._waiters:
+            self.active += 1
+            return
+        future = asyncio.get_running_loop().create_future()
+        self._waiters.setdefault(key, deque()).append(future)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # A vaga chegou junto com o cancelamento: devolve-a ao próximo da fila.
+                self.release()
+            else:
+                self._forget(key, future)
+            raise
+
+    def release(self):
+        self.active -= 1
+        self._wake()
+
+    def _forget(self, key: Hashable, future: asyncio.Future):
+        queue = self._waiters.get(key)
+        if queue is None:
+            return
+        try:
+            queue.remove(future)
+        except ValueError:
+            pass
+        if not queue:
+            del self._waiters[key]
+
+    def _wake(self):
+        while self.active < self.max_concurrent and self._waiters:
+            key, queue = next(iter(self._waiters.items()))
+            future = queue.popleft()
+            if queue:
+                # Rodízio: a chave atendida vai para o fim da fila.
+                self._waiters.move_to_end(key)
+            else:
+                del self._waiters[key]
+            if future.done():
+                continue
+            self.active += 1
+            future.set_result(None)
+
+
+async def stream_completion(
+    client: "openai.AsyncOpenAI",
+    messages: List[Dict[str, str]],
+    temperature: float,
+    stop_when: Optional[Callable[[str], bool]] = None,
+    on_token: Optional[Callable[[str], None]] = None,
+    model: str = LLM_MODEL_NAME,
+    cache: Optional[ReplayCache] = None,
+) -> str:
+    """
+    Pede uma completion em modo streaming e devolve o texto acumulado.
+
+    `on_token` recebe cada trecho assim que chega. Se `stop_when(texto_acumulado)`
+    retornar True, a leitura para e o stream é fechado: a conexão cai e o servidor
+    (vLLM) aborta a geração, sem gastar tempo decodificando o restante.
+
+    Com um `cache` em modo replay, a resposta gravada é devolvida sem chamar o servidor;
+    em modo record, a resposta (já cortada por `stop_when`) é gravada.
+    """
+    if cache is not None and cache.mode != "passthrough":
+        key = llm_key(messages, model, temperature)
+        if cache.reads:
+            with tracer.span("llm.completion", replay=True):
+                text = cache.require(key)
+            if on_token is not None and text:
+                on_token(text)
+            return text
+        text = await stream_completion(client, messages, temperature, stop_when, on_token, model)
+        cache.put(key, "llm", text)
+        return text
+
+    with tracer.span("llm.completion", model=model) as span:
+        started = time.perf_counter()
+        stream = await client.chat.completions.create(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            stream=True,
+        )
+        parts = []
+        try:
+            async for chunk in stream:
+                if not chunk.choices:
+                    continue
+                delta = chunk.choices[0].delta.content or ""
+                if not delta:
+                    continue
+                if not parts:
+                    _first_token.observe(time.perf_counter() - started)
+                parts.append(delta)
+                if on_token is not None:
+                    on_token(delta)
+                # A condição de parada só precisa ser reavaliada quando chega um possível fechamento de bloco.
+                if stop_when is not None and "`" in delta and stop_when("".join(parts)):
+                    span.set(stopped_early=True)
+                    break
+        finally:
+            await stream.close()
+            span.set(chunks=len(parts))
+    return "".join(parts)
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+from .telemetry import metrics
+
+_requests = metrics.counter("agent_cache_requests_total", "Consultas aos caches em memória, por cache e resultado (hit/miss).")
+
+
+class LRUCache:
+    """
+    Cache LRU em memória com expiração opcional (TTL) e contadores de acerto/erro.
+
+    Quando `max_entries` é atingido, a entrada usada há mais tempo é descartada.
+    Entradas mais antigas que `ttl` segundos são tratadas como ausentes. É seguro
+    para uso a partir de várias threads. Com `name`, os acertos e erros também são
+    somados à métrica `agent_cache_requests_total{cache=name}`.
+    """
+    def __init__(self, max_entries: int = 1024, ttl: Optional[float] = None, name: Optional[str] = None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None:
+                value, stored_at = entry
+                if self.ttl is None or time.monotonic() - stored_at <= self.ttl:
+                    self._data.move_to_end(key)
+                    self.hits += 1
+                    if self.name:
+                        _requests.inc(cache=self.name, result="hit")
+                    return value
+                del self._data[key]
+            self.misses += 1
+        if self.name:
+            _requests.inc(cache=self.name, result="miss")
+        return None
+
+    def put(self, key: Hashable, value: Any):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "size": len(self._data),
+        }
@@ -1,28 +1,52 @@
-import openai
+import asyncio
+import logging
 import re
-from typing import List, Dict
+import time
+from contextlib import asynccontextmanager
+from typing import TYPE_CHECKING, Hashable, List, Dict, Optional
 
-from .config import LLM_API_BASE, LLM_MODEL_NAME, OPENAI_API_KEY
+from .config import REPLAY_MODE
+from .context_manager import ContextManager, PrefixTracker
+from .events import EventChannel
 from .jupyter_client import JupyterClient
+from .kernel_pool import KernelPool
 from .knowledge_base import KnowledgeBase
+from .llm_client import FairLimiter, create_llm_client, stream_completion
+from .output_capture import strip_truncation_notice
+from .replay_cache import CachedKernel, ReplayCache
+from .telemetry import metrics, tracer
+from .workspace_index import WorkspaceIndex
+
+if TYPE_CHECKING:
+    import openai
+
+logger = logging.getLogger(__name__)
+_tokens = metrics.counter(
+    "agent_llm_tokens_total",
+    "Tokens enviados e recebidos do LLM (prompt, prompt_shared: prefixo igual ao da requisição anterior, completion).",
+)
+_queue_wait = metrics.histogram("agent_llm_queue_wait_seconds", "Espera por uma vaga no limitador de requisições ao LLM.")
+
+CODE_BLOCK_RE = re.compile(r"```python\n(.*?)```", re.DOTALL)
+REPEATED_ERROR_NOTICE = "AVISO DO SISTEMA: Você tentou a mesma operação várias vezes e falhou. Tente uma abordagem completamente diferente."
 
 # 1. Definição do Prompt do Sistema (Versão com RAG)
-SYSTEM_PROMPT = """
-Você é Manus, um agente de IA autônomo e competente. Sua principal forma de interagir com o mundo é através da execução de código Python no ambiente de trabalho (`/home/jovyan/work`).
+SYSTEM_PROMPT_TEMPLATE = """
+Você é Manus, um agente de IA autônomo e competente. Sua principal forma de interagir com o mundo é através da execução de código Python no kernel, cujo diretório atual é o seu diretório de trabalho.
 
 <princípios_gerais>
 1.  **Analise e Planeje:** Antes de agir, sempre analise a tarefa. Para tarefas complexas, seu primeiro passo deve ser criar um plano detalhado e salvá-lo em `todo.md`.
 2.  **Aja com Código:** Sua única forma de ação é gerar um bloco de código Python. Responda SEMPRE com um único bloco de código formatado como ```python\n# seu código\n```. Não inclua texto fora do bloco.
 3.  **Use o Filesystem:** Use o diretório de trabalho para salvar arquivos, rascunhos, e resultados intermediários. Isso é sua memória de longo prazo.
-4.  **Consulte a Base de Conhecimento:** Antes de responder a uma pergunta, considere as informações de contexto fornecidas. Se o histórico contiver uma mensagem do tipo "[CONTEXTO DA BASE DE CONHECIMENTO]", use essa informação para formular sua resposta ou plano.
+4.  **Consulte a Base de Conhecimento:** Antes de responder a uma pergunta, considere as informações de contexto fornecidas. Se a mensagem com o objetivo começar com um bloco "[CONTEXTO DA BASE DE CONHECIMENTO]", use essa informação para formular sua resposta ou plano.
 5.  **Observe e Adapte:** Após cada execução, você receberá o resultado (STDOUT/STDERR). Use essa observação para decidir seu próximo passo e para depurar seu código se necessário.
 6.  **Conclusão:** Ao concluir todos os passos do plano, sua última ação deve ser `print("TASK_COMPLETE")`.
 </princípios_gerais>
 
 <regras_de_planejamento>
-- O plano deve ser salvo em `workspace/todo.md`.
+- O plano deve ser salvo em `todo.md`, no diretório de trabalho.
 - O formato do plano deve ser uma lista de tarefas em markdown (ex: `- [ ] Passo 1: Fazer X.`).
-- Conforme você completa os passos, sua primeira ação no ciclo seguinte deve ser ler o `todo.md`, e a ação seguinte deve ser reescrevê-lo com o passo correspondente marcado como concluído (ex: `- [x] Passo 1: Fazer X.`).
+{todo_rule}
 </regras_de_planejamento>
 
 <regras_de_erro>
@@ -33,6 +57,16 @@ Você é Manus, um agente de IA autônomo e competente. Sua principal forma de i
 </regras_de_erro>
 """
 
+TODO_RULE = "- Conforme você completa os passos, sua primeira ação no ciclo seguinte deve ser ler o `todo.md`, e a ação seguinte deve ser reescrevê-lo com o passo correspondente marcado como concluído (ex: `- [x] Passo 1: Fazer X.`)."
+# Com o índice do workspace, as observações já mostram o que mudou nos arquivos: não é preciso relê-los.
+TODO_RULE_WITH_WORKSPACE = (
+    "- Conforme você completa os passos, reescreva o `todo.md` com o passo correspondente marcado como concluído (ex: `- [x] Passo 1: Fazer X.`).\n"
+    "- Não é preciso ler o `todo.md` nem imprimir arquivos que você mesmo escreveu: cada observação lista os arquivos do workspace "
+    "criados, alterados ou apagados pela execução, com o diff dos arquivos de texto pequenos."
+)
+SYSTEM_PROMPT = SYSTEM_PROMPT_TEMPLATE.replace("{todo_rule}", TODO_RULE)
+SYSTEM_PROMPT_WITH_WORKSPACE = SYSTEM_PROMPT_TEMPLATE.replace("{todo_rule}", TODO_RULE_WITH_WORKSPACE)
+
 PLANNER_PROMPT_TEMPLATE = """
 Você é um assistente de planejamento de IA. Sua tarefa é decompor um objetivo complexo em uma lista de passos simples e acionáveis em formato markdown.
 
@@ -44,125 +78,398 @@ Responda APENAS com o plano em formato markdown, e nada mais.
 """
 
 
+def _normalize_stream(text: str) -> str:
+    text = text.replace("\r\n", "\n").replace("\r", "\n")
+    return "\n".join(line.rstrip() for line in text.strip("\n").splitlines())
+
+
+def format_observation(stdout: str, stderr: str, notice: Optional[str] = None, changes: str = "") -> str:
+    """
+    Formato canônico da observação de uma execução. Espaços no fim das linhas e quebras
+    de linha CRLF são normalizados, para que a mesma saída sempre gere os mesmos bytes.
+    `changes` é o resumo dos arquivos do workspace alterados pela execução.
+    """
+    observation = f"Resultado da execução:\nSTDOUT:\n{_normalize_stream(stdout)}\n\nSTDERR:\n{_normalize_stream(stderr)}"
+    if notice:
+        observation += f"\n\n{notice}"
+    if changes:
+        observation += f"\n\n{changes}"
+    return observation
+
+
+def format_task_message(user_task: str, knowledge_context: str = "", workdir: Optional[str] = None) -> str:
+    """
+    Mensagem com o objetivo. O contexto da base de conhecimento, quando existe, fica
+    sempre no início dela: logo após o prompt do sistema, que é idêntico entre tarefas.
+    O diretório de trabalho da sessão, quando informado, vem depois do objetivo.
+    """
+    task = f"O objetivo é: {user_task}."
+    if workdir:
+        task += f"\nSeu diretório de trabalho é `{workdir}`."
+    if not knowledge_context:
+        return task
+    return f"[CONTEXTO DA BASE DE CONHECIMENTO]\n{knowledge_context}\n[FIM DO CONTEXTO]\n\n{task}"
+
+
 class Agent:
-    def __init__(self):
-        self.client = openai.OpenAI(api_key=OPENAI_API_KEY, base_url=LLM_API_BASE)
-        self.jupyter_client = JupyterClient()
-        self.knowledge_base = KnowledgeBase()
-        self.event_stream: List[Dict[str, str]] = [{"role": "system", "content": SYSTEM_PROMPT}]
+    def __init__(
+        self,
+        kernel_pool: Optional[KernelPool] = None,
+        llm_client: Optional["openai.AsyncOpenAI"] = None,
+        knowledge_base: Optional[KnowledgeBase] = None,
+        context_manager: Optional[ContextManager] = None,
+        replay_cache: Optional[ReplayCache] = None,
+        llm_limiter: Optional[FairLimiter] = None,
+        owner: Hashable = None,
+        events: Optional[EventChannel] = None,
+        workspace: Optional[WorkspaceIndex] = None,
+        workdir: Optional[str] = None,
+    ):
+        # Cliente assíncrono: as chamadas ao LLM não bloqueiam o event loop. Pode ser
+        # compartilhado entre agentes para reaproveitar o pool de conexões.
+        # Sem um cliente compartilhado, o próprio é criado só na primeira chamada ao LLM.
+        self._owns_client = llm_client is None
+        self._client = llm_client
+        # Limite (compartilhado) de requisições simultâneas ao LLM; `owner` identifica a fila justa do agente.
+        self.llm_limiter = llm_limiter
+        self.owner = owner
+        # Canal de eventos estruturados da sessão (plano, código, observações, tokens do LLM...).
+        self.events = events
+        # Com um pool, o kernel é emprestado já aquecido no início de `run`.
+        self.kernel_pool = kernel_pool
+        self.jupyter_client: Optional[JupyterClient] = JupyterClient() if kernel_pool is None else None
+        # Cache de gravação/reprodução das chamadas ao LLM e ao kernel (REPLAY_MODE).
+        if replay_cache is None and REPLAY_MODE != "passthrough":
+            replay_cache = ReplayCache()
+        self.replay_cache = replay_cache
+        # Índice (no host) do diretório de trabalho da sessão, para resumir nas observações os
+        # arquivos alterados por cada execução. Não há um padrão: quem cria o agente (o
+        # SessionManager) o enraíza no diretório da sessão, para que arquivos de outras
+        # sessões não apareçam como mudanças. Sem ele, o `todo.md` é lido pelo kernel.
+        self.workspace = workspace
+        # Diretório de trabalho da sessão dentro do kernel; o kernel emprestado entra nele antes da tarefa.
+        self.workdir = workdir
+        # Interface usada para executar código durante `run`: o kernel, ou o cache de replay em volta dele.
+        self.executor = None
+        self.knowledge_base = knowledge_base if knowledge_base is not None else KnowledgeBase()
+        # O histórico completo fica em `event_stream`; o LLM recebe a versão compactada
+        # pelo ContextManager, que cabe no orçamento de tokens do modelo.
+        system_prompt = SYSTEM_PROMPT_WITH_WORKSPACE if self.workspace is not None else SYSTEM_PROMPT
+        self.event_stream: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
+        self.context = context_manager if context_manager is not None else ContextManager()
+        # Mede, a cada chamada, o prefixo compartilhado com o prompt anterior (cache de prefixos do vLLM).
+        self.prefix_tracker = PrefixTracker(self.context.counter)
         self.error_count = 0
         self.last_error = None
 
+    @property
+    def client(self) -> "openai.AsyncOpenAI":
+        if self._client is None:
+            self._client = create_llm_client()
+        return self._client
+
     def _extract_python_code(self, text: str) -> str:
         """Extrai o bloco de código Python de uma resposta do LLM."""
-        match = re.search(r"```python\n(.*?)```", text, re.DOTALL)
+        match = CODE_BLOCK_RE.search(text)
         if match:
             return match.group(1).strip()
         return ""
 
-    def _create_plan(self, task: str, context: str = "") -> str:
+    def _code_block_closed(self, text: str) -> bool:
+        """Indica se a resposta parcial já contém um bloco ```python completo."""
+        return CODE_BLOCK_RE.search(text) is not None
+
+    def _emit(self, type: str, text: str = "", log: Optional[str] = None, **data):
+        """
+        Publica um evento no canal da sessão, se houver, e escreve `log` no console
+        (por padrão, o próprio texto; uma string vazia não escreve nada).
+        """
+        log = text if log is None else log
+        if log:
+            logger.info(log)
+        if self.events is not None:
+            self.events.emit(type, text, **data)
+
+    async def _create_plan(self, task: str, context: str = "") -> str:
         """Gera um plano de execução para uma tarefa complexa, usando contexto se disponível."""
-        print("Gerando plano de execução...")
+        self._emit("log", "Gerando plano de execução...")
         planner_task = f"{task}\n\nContexto relevante:\n{context}" if context else task
         planner_prompt = PLANNER_PROMPT_TEMPLATE.format(task=planner_task)
 
-        response = self.client.chat.completions.create(
-            model=LLM_MODEL_NAME,
-            messages=[{"role": "user", "content": planner_prompt}],
-            temperature=0.0,
-        )
-        plan = response.choices[0].message.content
-        print(f"Plano gerado:\n---\n{plan}\n---")
+        messages = [{"role": "user", "content": planner_prompt}]
+        with tracer.span("agent.plan"):
+            _tokens.inc(self.context.counter.count_messages(messages), direction="prompt")
+            async with self._llm_slot():
+                plan = await stream_completion(self.client, messages=messages, temperature=0.0, cache=self.replay_cache)
+            self._count_completion(plan)
+        self._emit("plan", plan, log=f"Plano gerado:\n---\n{plan}\n---")
         return plan
 
-    def _inject_knowledge(self, task: str):
-        """Busca na base de conhecimento e injeta contexto no event stream se a tarefa for uma pergunta."""
+    async def _retrieve_knowledge(self, task: str) -> str:
+        """
+        Busca na base de conhecimento o contexto para a tarefa, se ela for uma pergunta.
+        A busca roda em uma thread: na primeira, a KnowledgeBase ainda carrega índice e modelo.
+        """
         # Heurística simples: se a tarefa contém 'o que é', 'quem é', 'me fale sobre', etc.
         question_triggers = ['o que é', 'quem é', 'me fale sobre', 'qual é', 'como funciona']
         if any(trigger in task.lower() for trigger in question_triggers):
-            print("Tarefa parece ser uma pergunta. Buscando na base de conhecimento...")
-            results = self.knowledge_base.search(task)
+            self._emit("log", "Tarefa parece ser uma pergunta. Buscando na base de conhecimento...")
+            results = await asyncio.to_thread(self.knowledge_base.search, task)
             if results:
-                context_str = "\n".join(f"- {res}" for res in results)
-                knowledge_prompt = f"[CONTEXTO DA BASE DE CONHECIMENTO]\n{context_str}\n[FIM DO CONTEXTO]"
-                self.event_stream.append({"role": "system", "content": knowledge_prompt})
-                print("Contexto injetado no event stream.")
+                context_str = "\n".join(f"- {res.text} (fonte: {res.provenance})" for res in results)
+                self._emit("log", "Contexto encontrado na base de conhecimento.", results=len(results))
                 return context_str
         return ""
 
-    async def run(self, user_task: str):
-        """Executa o loop principal do agente de forma assíncrona."""
-        print(f"Iniciando tarefa: {user_task}")
-        self.jupyter_client.start_kernel()
-
-        # Passo -1: Injetar conhecimento se for uma pergunta
-        knowledge_context = self._inject_knowledge(user_task)
+    async def _read_todo(self) -> Optional[str]:
+        """
+        Lê o `todo.md` atual do workspace, para incluí-lo no resumo do contexto: direto
+        do disco quando há o índice do workspace, senão executando código no kernel.
+        """
+        if self.workspace is not None:
+            try:
+                return await asyncio.to_thread(self.workspace.read_range, "todo.md")
+            except OSError:
+                return None
+        stdout, stderr = await self.executor.execute_code("print(open('todo.md').read())")
+        return None if stderr else stdout
+
+    async def _workspace_changes(self) -> str:
+        """Resumo dos arquivos do workspace alterados desde a última verificação (vazio sem o índice)."""
+        if self.workspace is None:
+            return ""
+        changes = await asyncio.to_thread(self.workspace.refresh)
+        return self.workspace.summarize(changes)
+
+    async def _prepare_messages(self) -> List[Dict[str, str]]:
+        """Compacta o event stream para o orçamento de tokens antes de enviá-lo ao LLM."""
+        with tracer.span("context.compact") as span:
+            if self.context.needs_refold(self.event_stream):
+                self.context.todo = await self._read_todo()
+            messages = self.context.compact(self.event_stream)
+            prefix = self.prefix_tracker.observe(messages)
+            span.set(folded_turns=self.context.folded_turns, **prefix)
+        _tokens.inc(prefix["total_tokens"], direction="prompt")
+        _tokens.inc(prefix["shared_tokens"], direction="prompt_shared")
+        self._emit(
+            "log",
+            f"Prefixo compartilhado com a requisição anterior: {prefix['shared_tokens']}/{prefix['total_tokens']} "
+            f"tokens ({prefix['shared_ratio']:.0%}).",
+            **prefix,
+        )
+        return messages
+
+    @asynccontextmanager
+    async def _llm_slot(self):
+        """Aguarda uma vaga no limitador de requisições ao LLM, se houver um."""
+        if self.llm_limiter is None:
+            yield
+            return
+        started = time.perf_counter()
+        async with self.llm_limiter.slot(self.owner):
+            _queue_wait.observe(time.perf_counter() - started)
+            yield
+
+    def _count_completion(self, text: str) -> int:
+        """Soma os tokens de uma resposta do LLM à métrica `agent_llm_tokens_total`."""
+        tokens = self.context.counter.count(text) if text else 0
+        _tokens.inc(tokens, direction="completion")
+        return tokens
+
+    async def close(self):
+        """Fecha o cliente LLM, se ele foi criado por este agente (e não compartilhado)."""
+        if self._owns_client and self._client is not None:
+            await self._client.close()
+
+    @asynccontextmanager
+    async def _kernel_session(self):
+        """
+        Prepara `self.executor` para a tarefa. Em modo replay nenhum kernel é usado; nos
+        demais, o kernel é emprestado do pool, ou iniciado e desligado aqui.
+        """
+        if self.replay_cache is not None and self.replay_cache.reads:
+            self.executor = CachedKernel(self.replay_cache)
+            yield self.executor
+            return
+
+        if self.kernel_pool is not None:
+            async with self.kernel_pool.lease() as jupyter_client:
+                self.jupyter_client = jupyter_client
+                await self._enter_workdir(jupyter_client)
+                self.executor = self._wrap_kernel(jupyter_client)
+                yield self.executor
+            return
 
-        # Passo 0: Gerar o plano
-        plan = self._create_plan(user_task, context=knowledge_context)
+        self.jupyter_client.start_kernel()
+        try:
+            await self._enter_workdir(self.jupyter_client)
+            self.executor = self._wrap_kernel(self.jupyter_client)
+            yield self.executor
+        finally:
+            await self.jupyter_client.close()
+            self.jupyter_client.shutdown_kernel()
 
-        initial_action_code = f'with open("workspace/todo.md", "w") as f:\n    f.write("""{plan}""")'
+    async def _enter_workdir(self, jupyter_client: JupyterClient):
+        """
+        Muda o diretório atual do kernel para o da sessão, criando-o se preciso. Roda
+        direto no kernel (fora do cache de replay), já que o caminho muda a cada sessão.
+        """
+        if self.workdir is None:
+            return
+        code = f"import os\nos.makedirs({self.workdir!r}, exist_ok=True)\nos.chdir({self.workdir!r})"
+        _, stderr = await jupyter_client.execute_code(code)
+        if stderr:
+            raise RuntimeError(f"Não foi possível usar o diretório de trabalho {self.workdir}:\n{stderr}")
+
+    def _wrap_kernel(self, jupyter_client: JupyterClient):
+        if self.replay_cache is not None and self.replay_cache.writes:
+            return CachedKernel(self.replay_cache, jupyter_client)
+        return jupyter_client
 
-        self.event_stream.append({"role": "user", "content": f"O objetivo é: {user_task}."})
+    async def run(self, user_task: str):
+        """Executa o loop principal do agente de forma assíncrona."""
+        self._emit("log", f"Iniciando tarefa: {user_task}")
+        try:
+            with tracer.span("agent.run", owner=self.owner):
+                async with self._kernel_session():
+                    await self._run_loop(user_task)
+        finally:
+            self._emit("log", "\nLoop do agente finalizado.")
 
-        code_to_execute = initial_action_code
+    async def _run_loop(self, user_task: str):
+        """Planeja a tarefa e alterna entre execução de código e chamadas ao LLM até concluir."""
+        # Passo -1: Buscar conhecimento se for uma pergunta
+        with tracer.span("agent.retrieve"):
+            knowledge_context = await self._retrieve_knowledge(user_task)
 
-        try:
-            while True:
-                print("\n==================== NOVO CICLO ====================")
-
-                print(f"Executando código:\n---\n{code_to_execute}\n---")
-                # A chamada para execute_code agora é assíncrona
-                stdout, stderr = await self.jupyter_client.execute_code(code_to_execute)
-                observation = f"STDOUT:\n{stdout}\n\nSTDERR:\n{stderr}"
-                print(f"Observação da Execução:\n---\n{observation}\n---")
-
-                # Lógica de contagem de erro
-                if stderr:
-                    if stderr == self.last_error:
-                        self.error_count += 1
-                    else:
-                        self.last_error = stderr
-                        self.error_count = 1
-
-                    if self.error_count >= 3:
-                        print("O mesmo erro ocorreu 3 vezes. Injetando instrução para mudar de estratégia.")
-                        observation += "\n\nAVISO DO SISTEMA: Você tentou a mesma operação várias vezes e falhou. Tente uma abordagem completamente diferente."
-                        self.error_count = 0 # Reseta o contador
-                else:
-                    self.error_count = 0
-                    self.last_error = None
-
-                self.event_stream.append({"role": "assistant", "content": f"```python\n{code_to_execute}\n```"})
-                self.event_stream.append({"role": "user", "content": f"Resultado da execução:\n{observation}"})
+        # Passo 0: Gerar o plano
+        plan = await self._create_plan(user_task, context=knowledge_context)
+
+        # Layout do prompt: prompt do sistema fixo, objetivo (com o contexto da base de
+        # conhecimento em posição fixa) e depois o log de ciclos, que só cresce no final.
+        # Com o cache de replay, o caminho (que muda a cada sessão) fica fora do prompt:
+        # as chaves das chamadas ao LLM não podem depender dele.
+        workdir = self.workdir if self.replay_cache is None else None
+        self.event_stream.append({"role": "user", "content": format_task_message(user_task, knowledge_context, workdir)})
+        # Linha de base do workspace: só o que as execuções desta tarefa mudarem aparece nas observações.
+        await self._workspace_changes()
+
+        turn = 1
+        with tracer.span("agent.turn", turn=turn) as span:
+            code_to_execute = await self._write_plan(plan, span)
+
+        while code_to_execute:
+            turn += 1
+            with tracer.span("agent.turn", turn=turn) as span:
+                self._emit_code(code_to_execute)
+                stdout, stderr = await self.executor.execute_code(code_to_execute)
+                self._record_turn(code_to_execute, stdout, stderr, await self._workspace_changes())
 
                 if "TASK_COMPLETE" in code_to_execute:
-                    print("\nSinal de 'TASK_COMPLETE' detectado. Finalizando a tarefa.")
+                    self._emit("complete", "\nSinal de 'TASK_COMPLETE' detectado. Finalizando a tarefa.")
                     break
 
-                print(f"Conteúdo do Event Stream enviado ao LLM (últimos 4 eventos): {self.event_stream[-4:]}")
-                response = self.client.chat.completions.create(
-                    model=LLM_MODEL_NAME,
-                    messages=self.event_stream,
-                    temperature=0.1,
-                )
-                llm_response_text = response.choices[0].message.content
-                print(f"Resposta do LLM:\n---\n{llm_response_text}\n---")
-
-                code_to_execute = self._extract_python_code(llm_response_text)
-
-                if not code_to_execute:
-                    print("Nenhum código encontrado na resposta. A tarefa pode ter terminado de forma inesperada.")
-                    break
+                code_to_execute = await self._next_code(span)
+
+    async def _write_plan(self, plan: str, span) -> str:
+        """
+        Primeiro ciclo: salva o plano em `todo.md` enquanto o LLM já gera a próxima ação.
+
+        Gravar um arquivo não produz saída, então o LLM recebe de antemão a observação
+        vazia. Se a execução real produzir alguma saída (ex: um erro), a observação
+        é corrigida e a chamada ao LLM refeita: o histórico sempre reflete o que houve.
+        Retorna o código da próxima ação (vazio se a resposta não trouxer nenhum).
+        """
+        code = f'with open("todo.md", "w") as f:\n    f.write("""{plan}""")'
+        self._emit_code(code)
+        writing = asyncio.ensure_future(self.executor.execute_code(code))
+        expected = format_observation("", "")
+        self.event_stream.append({"role": "assistant", "content": f"```python\n{code}\n```"})
+        self.event_stream.append({"role": "user", "content": expected})
+        try:
+            next_code = await self._next_code(span)
+        except BaseException:
+            writing.cancel()
+            raise
+        stdout, stderr = await writing
+        # O plano gravado já está no histórico: a mudança no `todo.md` só atualiza a linha de base.
+        await self._workspace_changes()
+        # Substitui a observação antecipada pela real (com a contagem de erros e os eventos).
+        del self.event_stream[-2:]
+        observation = self._record_turn(code, stdout, stderr)
+        if observation != expected:
+            self._emit("log", "A gravação do plano produziu saída. Refazendo a chamada ao LLM com a observação real.")
+            next_code = await self._next_code(span)
+        return next_code
+
+    def _emit_code(self, code: str):
+        self._emit(
+            "code",
+            code,
+            log=f"\n==================== NOVO CICLO ====================\nExecutando código:\n---\n{code}\n---",
+        )
 
-        finally:
-            self.jupyter_client.shutdown_kernel()
-            print("\nLoop do agente finalizado.")
+    def _record_turn(self, code: str, stdout: str, stderr: str, changes: str = "") -> str:
+        """Registra o ciclo no event stream (código e observação) e devolve a observação."""
+        notice = None
+
+        # Lógica de contagem de erro. Um erro truncado traz o caminho (único) do arquivo com a
+        # saída completa, por isso a comparação ignora o aviso de truncamento.
+        if stderr:
+            error = strip_truncation_notice(stderr)
+            if error == self.last_error:
+                self.error_count += 1
+            else:
+                self.last_error = error
+                self.error_count = 1
+
+            if self.error_count >= 3:
+                self._emit("log", "O mesmo erro ocorreu 3 vezes. Injetando instrução para mudar de estratégia.")
+                notice = REPEATED_ERROR_NOTICE
+                self.error_count = 0 # Reseta o contador
+        else:
+            self.error_count = 0
+            self.last_error = None
+
+        observation = format_observation(stdout, stderr, notice, changes)
+        self._emit("observation", observation, log=f"Observação da Execução:\n---\n{observation}\n---", error=bool(stderr))
+
+        self.event_stream.append({"role": "assistant", "content": f"```python\n{code}\n```"})
+        self.event_stream.append({"role": "user", "content": observation})
+        return observation
+
+    async def _next_code(self, span) -> str:
+        """Pede ao LLM a próxima ação a partir do event stream e extrai o código dela."""
+        messages = await self._prepare_messages()
+        logger.debug("Conteúdo do Event Stream enviado ao LLM (últimos 4 eventos): %s", messages[-4:])
+        # A geração é cancelada assim que o bloco de código fecha: o que viria depois é descartado de qualquer forma.
+        # Cada trecho vai para o canal de eventos assim que chega; o console recebe a resposta inteira no final.
+        self._emit("log", "Resposta do LLM:\n---", log="")
+        async with self._llm_slot():
+            llm_response_text = await stream_completion(
+                self.client,
+                messages=messages,
+                temperature=0.1,
+                stop_when=self._code_block_closed,
+                on_token=lambda token: self._emit("llm_token", token, log=""),
+                cache=self.replay_cache,
+            )
+        span.set(completion_tokens=self._count_completion(llm_response_text))
+        self._emit("llm_response", llm_response_text, log=f"Resposta do LLM:\n---\n{llm_response_text}\n---")
+
+        code = self._extract_python_code(llm_response_text)
+        if not code:
+            self._emit("log", "Nenhum código encontrado na resposta. A tarefa pode ter terminado de forma inesperada.")
+        return code
 
 if __name__ == '__main__':
-    import asyncio
     import os
 
+    from .telemetry import configure_logging, setup_telemetry
+
+    configure_logging()
+    setup_telemetry()
+
     # Crie o diretório 'knowledge' e um arquivo de exemplo para o teste de RAG
     if not os.path.exists('./knowledge'):
         os.makedirs('./knowledge')
@@ -173,5 +480,11 @@ if __name__ == '__main__':
     # Tarefa que pode usar a base de conhecimento
     task = "Me fale sobre o que é Inteligência Artificial e salve a explicação em um arquivo 'ia_explicação.txt' no workspace."
 
+    async def main():
+        try:
+            await agent.run(task)
+        finally:
+            await agent.close()
+
     # Executa o loop assíncrono do agente
-    asyncio.run(agent.run(task))
+    asyncio.run(main())
@@ -0,0 +1,146 @@
+import logging
+import os
+import re
+import uuid
+from collections import deque
+from typing import Deque, Optional
+
+from .config import OUTPUT_MAX_BYTES, OUTPUT_MAX_LINES, OUTPUT_SPILL_DIR, OUTPUT_SPILL_KERNEL_DIR
+
+logger = logging.getLogger(__name__)
+
+# Aviso que `BoundedOutput.getvalue()` põe no lugar da parte omitida; traz o caminho (aleatório) do arquivo completo.
+TRUNCATION_NOTICE_RE = re.compile(r"\n\[\.\.\. saída truncada: [^\n]*? \.\.\.\]\n")
+
+
+def strip_truncation_notice(text: str) -> str:
+    """O texto sem o aviso de truncamento, para comparar as saídas de execuções diferentes."""
+    return TRUNCATION_NOTICE_RE.sub("\n", text)
+
+
+def _head(text: str, max_bytes: int, max_lines: int) -> str:
+    """Retorna o início de `text` limitado a `max_bytes` bytes e `max_lines` linhas."""
+    lines = text.split("\n")
+    if len(lines) > max_lines:
+        text = "\n".join(lines[:max_lines]) + "\n"
+    return text.encode("utf-8")[:max_bytes].decode("utf-8", errors="ignore")
+
+
+def _tail(text: str, max_bytes: int, max_lines: int) -> str:
+    """Retorna o final de `text` limitado a `max_bytes` bytes e `max_lines` linhas."""
+    lines = text.split("\n")
+    if len(lines) > max_lines + 1:
+        text = "\n".join(lines[-(max_lines + 1):])
+    encoded = text.encode("utf-8")
+    return encoded[max(0, len(encoded) - max_bytes):].decode("utf-8", errors="ignore")
+
+
+class BoundedOutput:
+    """
+    Captura a saída de uma stream (stdout/stderr) com memória limitada.
+
+    Enquanto a saída couber nos limites de bytes e linhas, ela é mantida inteira.
+    Ao estourar, apenas o início (metade do orçamento) e um buffer circular com o
+    final são mantidos em memória, e a saída completa é despejada em um arquivo no
+    workspace. `getvalue()` então devolve início + aviso com o caminho do arquivo + final.
+    """
+    def __init__(
+        self,
+        name: str,
+        max_bytes: int = OUTPUT_MAX_BYTES,
+        max_lines: int = OUTPUT_MAX_LINES,
+        spill_dir: Optional[str] = OUTPUT_SPILL_DIR,
+        spill_kernel_dir: Optional[str] = OUTPUT_SPILL_KERNEL_DIR,
+    ):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.max_lines = max_lines
+        self.spill_dir = spill_dir
+        self.spill_kernel_dir = spill_kernel_dir
+        self.total_bytes = 0
+        self.total_lines = 0
+        self.truncated = False
+        self.spill_path: Optional[str] = None
+
+        self._head_bytes = max_bytes // 2
+        self._head_lines = max_lines // 2
+        self._parts = []
+        self._head = ""
+        self._tail: Deque[str] = deque()
+        self._tail_bytes = 0
+        self._spill_file = None
+
+    def write(self, text: str):
+        if not text:
+            return
+        size = len(text.encode("utf-8"))
+        self.total_bytes += size
+        self.total_lines += text.count("\n")
+
+        if self._spill_file is not None:
+            self._spill_file.write(text)
+
+        if not self.truncated:
+            self._parts.append(text)
+            if self.total_bytes > self.max_bytes or self.total_lines > self.max_lines:
+                self._start_truncation()
+            return
+
+        self._tail.append(text)
+        self._tail_bytes += size
+        self._trim_tail()
+
+    def _start_truncation(self):
+        self.truncated = True
+        full = "".join(self._parts)
+        self._parts = []
+        self._head = _head(full, self._head_bytes, self._head_lines)
+        self._tail.append(full[len(self._head):])
+        self._tail_bytes = len(self._tail[0].encode("utf-8"))
+        self._trim_tail()
+        self._open_spill(full)
+
+    def _trim_tail(self):
+        """Descarta o início do buffer circular até caber no orçamento do final."""
+        budget = self.max_bytes - self._head_bytes
+        while self._tail_bytes > budget and len(self._tail) > 1:
+            self._tail_bytes -= len(self._tail.popleft().encode("utf-8"))
+        if self._tail_bytes > budget:
+            last = _tail(self._tail.pop(), budget, self.max_lines - self._head_lines)
+            self._tail.append(last)
+            self._tail_bytes = len(last.encode("utf-8"))
+
+    def _open_spill(self, initial: str):
+        if not self.spill_dir:
+            return
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            filename = f"{self.name}-{uuid.uuid4().hex[:12]}.txt"
+            path = os.path.join(self.spill_dir, filename)
+            self._spill_file = open(path, "w", encoding="utf-8")
+            self._spill_file.write(initial)
+        except OSError as e:
+            logger.warning("Não foi possível salvar a saída completa em %s: %s", self.spill_dir, e)
+            self._spill_file = None
+            return
+        self.spill_path = os.path.join(self.spill_kernel_dir, filename) if self.spill_kernel_dir else path
+
+    def close(self):
+        if self._spill_file is not None:
+            self._spill_file.close()
+            self._spill_file = None
+
+    def getvalue(self) -> str:
+        if not self.truncated:
+            return "".join(self._parts)
+
+        tail = _tail("".join(self._tail), self.max_bytes - self._head_bytes, self.max_lines - self._head_lines)
+        omitted_bytes = self.total_bytes - len(self._head.encode("utf-8")) - len(tail.encode("utf-8"))
+        notice = (
+            f"\n[... saída truncada: {self.total_lines} linhas / {self.total_bytes} bytes no total, "
+            f"{omitted_bytes} bytes omitidos."
+        )
+        if self.spill_path:
+            notice += f" Saída completa salva em '{self.spill_path}'."
+        notice += " ...]\n"
+        return f"{self._head}{notice}{tail}"
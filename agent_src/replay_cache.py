@@ -0,0 +1,181 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from .config import JUPYTER_EXECUTION_TIMEOUT, REPLAY_CACHE_MAX_BYTES, REPLAY_CACHE_PATH, REPLAY_MODE
+from .telemetry import metrics
+
+MODES = ("passthrough", "record", "replay")
+# Impressão digital de um kernel recém-iniciado (ou resetado pelo pool).
+EMPTY_KERNEL_STATE = hashlib.sha256(b"").hexdigest()
+
+_requests = metrics.counter("agent_cache_requests_total", "Consultas aos caches em memória, por cache e resultado (hit/miss).")
+
+
+class ReplayMissError(KeyError):
+    """Em modo replay, a chamada pedida não está gravada no cache."""
+
+
+def _digest(obj: Any) -> str:
+    payload = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _normalize_text(text: str) -> str:
+    return text.replace("\r\n", "\n").strip()
+
+
+def llm_key(messages: List[Dict[str, str]], model: str, temperature: float) -> str:
+    """Chave de uma completion: mensagens normalizadas (só papel e conteúdo), modelo e temperatura."""
+    normalized = [{"role": m["role"], "content": _normalize_text(m["content"])} for m in messages]
+    return _digest({"kind": "llm", "model": model, "temperature": round(float(temperature), 4), "messages": normalized})
+
+
+def execution_key(code: str, kernel_state: str) -> str:
+    """Chave de uma execução: o código e a impressão digital do estado do kernel antes dela."""
+    return _digest({"kind": "execution", "state": kernel_state, "code": _normalize_text(code)})
+
+
+def batch_key(cells: List[str], kernel_state: str) -> str:
+    """Chave de um lote de células enviado com `execute_many`, gravado como uma única entrada."""
+    return _digest({"kind": "execution_batch", "state": kernel_state, "cells": [_normalize_text(code) for code in cells]})
+
+
+class ReplayCache:
+    """
+    Cache endereçado por conteúdo de completions do LLM e execuções de código, em SQLite.
+
+    Modos:
+    - "passthrough": não lê nem grava; tudo vai aos serviços reais.
+    - "record": chama os serviços reais e grava (ou sobrescreve) cada resultado.
+    - "replay": responde apenas a partir do cache, sem LLM nem kernel; uma chamada
+      não gravada levanta `ReplayMissError`.
+
+    Quando o total armazenado passa de `max_bytes`, as entradas usadas há mais tempo
+    são removidas. É seguro para uso a partir de várias threads e agentes.
+    """
+    def __init__(self, path: str = REPLAY_CACHE_PATH, mode: str = REPLAY_MODE, max_bytes: int = REPLAY_CACHE_MAX_BYTES):
+        if mode not in MODES:
+            raise ValueError(f"Modo de replay desconhecido: '{mode}'. Use um de {MODES}.")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._db:
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS entries ("
+                " key TEXT PRIMARY KEY, kind TEXT NOT NULL, value TEXT NOT NULL,"
+                " size INTEGER NOT NULL, created REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)")
+
+    @property
+    def reads(self) -> bool:
+        return self.mode == "replay"
+
+    @property
+    def writes(self) -> bool:
+        return self.mode == "record"
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            row = self._db.execute("SELECT value FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                _requests.inc(cache="replay", result="miss")
+                return None
+            with self._db:
+                self._db.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+            _requests.inc(cache="replay", result="hit")
+            return json.loads(row[0])
+
+    def require(self, key: str) -> Any:
+        value = self.get(key)
+        if value is None:
+            raise ReplayMissError(f"Chamada não gravada no cache de replay '{self.path}' (chave {key[:12]}).")
+        return value
+
+    def put(self, key: str, kind: str, value: Any):
+        payload = json.dumps(value, ensure_ascii=False)
+        now = time.time()
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (key, kind, value, size, created, last_used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, payload, len(payload.encode("utf-8")), now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        removed = []
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY last_used ASC"):
+            if total <= self.max_bytes:
+                break
+            removed.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM entries WHERE key = ?", removed)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+
+    def stats(self) -> dict:
+        return {"mode": self.mode, "entries": len(self), "bytes": self.size_bytes(), "hits": self.hits, "misses": self.misses}
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+class CachedKernel:
+    """
+    Envolve um JupyterClient com o ReplayCache, expondo os mesmos `execute_code` e `execute_many`.
+
+    O estado do kernel é identificado pela cadeia de execuções desde que ele foi
+    iniciado: a chave de cada execução vira a impressão digital da próxima. Assim,
+    o mesmo código só reaproveita um resultado gravado quando todo o histórico que
+    o precede no kernel também é o mesmo. Em modo replay, `client` pode ser None.
+    """
+    def __init__(self, cache: ReplayCache, client=None):
+        self.cache = cache
+        self.client = client
+        self.kernel_state = EMPTY_KERNEL_STATE
+
+    async def execute_code(self, code: str, timeout: float = JUPYTER_EXECUTION_TIMEOUT) -> Tuple[str, str]:
+        key = execution_key(code, self.kernel_state)
+        self.kernel_state = key
+        if self.cache.reads:
+            stdout, stderr = self.cache.require(key)
+            return stdout, stderr
+        stdout, stderr = await self.client.execute_code(code, timeout=timeout)
+        if self.cache.writes:
+            self.cache.put(key, "execution", [stdout, stderr])
+        return stdout, stderr
+
+    async def execute_many(self, cells: List[str], timeout: float = JUPYTER_EXECUTION_TIMEOUT) -> List[Tuple[str, str]]:
+        key = batch_key(cells, self.kernel_state)
+        self.kernel_state = key
+        if self.cache.reads:
+            return [tuple(result) for result in self.cache.require(key)]
+        results = await self.client.execute_many(cells, timeout=timeout)
+        if self.cache.writes:
+            self.cache.put(key, "execution_batch", [list(result) for result in results])
+        return results
@@ -0,0 +1,272 @@
+import asyncio
+import logging
+import os
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Dict, Hashable, List, Optional
+
+from .config import (
+    REPLAY_MODE,
+    SESSION_MAX_CONCURRENT,
+    SESSION_MAX_PER_USER,
+    SESSION_MAX_QUEUED,
+    WORKSPACE_DIR,
+    WORKSPACE_INDEX,
+    WORKSPACE_KERNEL_DIR,
+)
+from .context_manager import ContextManager, TokenCounter
+from .events import EventChannel
+from .kernel_pool import KernelPool
+from .knowledge_base import KnowledgeBase
+from .llm_client import FairLimiter, create_llm_client
+from .main import Agent
+from .replay_cache import ReplayCache
+from .telemetry import metrics
+from .workspace_index import WorkspaceIndex
+
+if TYPE_CHECKING:
+    import openai
+
+logger = logging.getLogger(__name__)
+_active = metrics.gauge("agent_sessions_active", "Sessões de agente na fila (queued) e em execução (running).")
+_sessions = metrics.counter("agent_sessions_total", "Sessões de agente terminadas, por status final.")
+_queue_wait = metrics.histogram("agent_session_queue_seconds", "Tempo entre o envio de uma sessão e o início da sua execução.")
+
+
+class SessionLimitError(RuntimeError):
+    """A fila de sessões está cheia; a tarefa deve ser reenviada mais tarde."""
+
+
+@dataclass
+class Session:
+    """
+    Uma tarefa submetida ao SessionManager.
+
+    `status` é um de "queued", "running", "done", "failed" ou "cancelled"; em caso de
+    falha, `error` guarda a exceção. `events` recebe os eventos da sessão e é fechado
+    quando ela termina.
+    """
+    id: str
+    task: str
+    owner: Hashable
+    status: str = "queued"
+    agent: Optional[Agent] = None
+    events: Optional[EventChannel] = None
+    error: Optional[BaseException] = None
+    created_at: float = field(default_factory=time.monotonic)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    _task: Optional[asyncio.Task] = field(default=None, repr=False)
+
+    @property
+    def done(self) -> bool:
+        return self.status in ("done", "failed", "cancelled")
+
+
+class SessionManager:
+    """
+    Executa várias tarefas de agente simultaneamente em um único event loop.
+
+    Todas as sessões compartilham o modelo de embeddings e o índice (uma KnowledgeBase),
+    o pool de conexões com o LLM e o pool de kernels. Até `max_concurrent` sessões rodam
+    ao mesmo tempo e cada usuário (`owner`) tem no máximo `max_per_user` delas em
+    execução; as demais esperam na fila, limitada a `max_queued` (além disso, `submit`
+    recusa novas tarefas). As requisições ao LLM passam por um FairLimiter, que limita
+    o lote enviado ao servidor e reparte as vagas em rodízio entre os usuários.
+
+    Cada sessão trabalha em um subdiretório próprio do workspace (`<workspace>/<id da
+    sessão>`): o kernel emprestado entra nele e o índice do workspace só enxerga ele.
+    Em modo replay as execuções vêm do cache, então nenhum pool de kernels é criado.
+    """
+    def __init__(
+        self,
+        kernel_pool: Optional[KernelPool] = None,
+        llm_client: Optional["openai.AsyncOpenAI"] = None,
+        knowledge_base: Optional[KnowledgeBase] = None,
+        replay_cache: Optional[ReplayCache] = None,
+        llm_limiter: Optional[FairLimiter] = None,
+        max_concurrent: int = SESSION_MAX_CONCURRENT,
+        max_per_user: int = SESSION_MAX_PER_USER,
+        max_queued: int = SESSION_MAX_QUEUED,
+        agent_factory: Callable[..., Agent] = Agent,
+        workspace_dir: str = WORKSPACE_DIR,
+        workspace_kernel_dir: str = WORKSPACE_KERNEL_DIR,
+    ):
+        if replay_cache is None and REPLAY_MODE != "passthrough":
+            replay_cache = ReplayCache()
+        self.replay_cache = replay_cache
+        replays = replay_cache is not None and replay_cache.reads
+        self._owns_pool = kernel_pool is None and not replays
+        self._owns_client = llm_client is None
+        self._owns_knowledge_base = knowledge_base is None
+        self.kernel_pool: Optional[KernelPool] = None
+        if not replays:
+            self.kernel_pool = kernel_pool if kernel_pool is not None else KernelPool()
+        # Como no Agent, o cliente próprio só é criado quando a primeira sessão o pede.
+        self._llm_client = llm_client
+        self.knowledge_base = knowledge_base if knowledge_base is not None else KnowledgeBase()
+        if self._owns_knowledge_base:
+            # A base compartilhada acompanha o diretório de conhecimento enquanto a aplicação roda.
+            self.knowledge_base.start_watching()
+        # O tokenizador também é carregado uma só vez e usado por todos os agentes.
+        self.token_counter = TokenCounter()
+        self.llm_limiter = llm_limiter if llm_limiter is not None else FairLimiter()
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        self.max_queued = max_queued
+        self.agent_factory = agent_factory
+        self.workspace_dir = workspace_dir
+        self.workspace_kernel_dir = workspace_kernel_dir
+        self.sessions: Dict[str, Session] = {}
+        self._running: Optional[asyncio.Semaphore] = None
+        self._pool_start: Optional[asyncio.Task] = None
+        self._per_user: Dict[Hashable, asyncio.Semaphore] = {}
+        self._user_sessions: Dict[Hashable, int] = {}
+
+    @property
+    def llm_client(self) -> "openai.AsyncOpenAI":
+        if self._llm_client is None:
+            self._llm_client = create_llm_client()
+        return self._llm_client
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for session in self.sessions.values() if session.status == "queued")
+
+    @property
+    def running(self) -> int:
+        return sum(1 for session in self.sessions.values() if session.status == "running")
+
+    def _start_pool(self) -> Optional[asyncio.Task]:
+        if self._pool_start is None and self.kernel_pool is not None:
+            # O pool só pode ser aquecido dentro do event loop, então isso acontece no
+            # primeiro `start()` ou `submit()`, e não no construtor.
+            self._pool_start = asyncio.get_running_loop().create_task(self.kernel_pool.start())
+        return self._pool_start
+
+    async def start(self):
+        """Aquece o pool de kernels até `min_idle` (só na primeira chamada; as seguintes apenas aguardam)."""
+        pool_start = self._start_pool()
+        if pool_start is not None:
+            await asyncio.shield(pool_start)
+
+    def submit(self, task: str, owner: Hashable = "default") -> Session:
+        """Enfileira uma tarefa e devolve a sessão imediatamente (deve ser chamado dentro do event loop)."""
+        # Sem um `start()` explícito, o pool é aquecido em segundo plano a partir da primeira tarefa.
+        self._start_pool()
+        if self.queued >= self.max_queued:
+            raise SessionLimitError(f"Fila cheia: {self.queued} sessões aguardando. Tente novamente mais tarde.")
+        session = Session(id=uuid.uuid4().hex, task=task, owner=owner, events=EventChannel())
+        session.events.emit("status", "queued")
+        session.agent = self._create_agent(session)
+        self.sessions[session.id] = session
+        self._user_sessions[owner] = self._user_sessions.get(owner, 0) + 1
+        session._task = asyncio.get_running_loop().create_task(self._run(session))
+        session._task.add_done_callback(lambda _: self._finished(session))
+        _active.inc(state="queued")
+        return session
+
+    def _create_agent(self, session: Session) -> Agent:
+        # O resumo do workspace fica desligado com o cache de replay: ele depende do disco e mudaria as chaves.
+        workspace = None
+        if WORKSPACE_INDEX and self.replay_cache is None:
+            workspace = WorkspaceIndex(root=os.path.join(self.workspace_dir, session.id))
+        return self.agent_factory(
+            kernel_pool=self.kernel_pool,
+            llm_client=self.llm_client,
+            knowledge_base=self.knowledge_base,
+            context_manager=ContextManager(counter=self.token_counter),
+            replay_cache=self.replay_cache,
+            llm_limiter=self.llm_limiter,
+            owner=session.owner,
+            events=session.events,
+            workspace=workspace,
+            workdir=f"{self.workspace_kernel_dir.rstrip('/')}/{session.id}",
+        )
+
+    def _user_slot(self, owner: Hashable) -> asyncio.Semaphore:
+        if owner not in self._per_user:
+            self._per_user[owner] = asyncio.Semaphore(self.max_per_user)
+        return self._per_user[owner]
+
+    async def _run(self, session: Session):
+        if self._running is None:
+            self._running = asyncio.Semaphore(self.max_concurrent)
+        try:
+            # A vaga do usuário vem antes da global, para que quem já esgotou a sua
+            # não ocupe a fila global à frente dos demais.
+            async with self._user_slot(session.owner), self._running:
+                session.status = "running"
+                session.events.emit("status", "running")
+                session.started_at = time.monotonic()
+                _active.dec(state="queued")
+                _active.inc(state="running")
+                _queue_wait.observe(session.started_at - session.created_at)
+                await session.agent.run(session.task)
+            session.status = "done"
+        except asyncio.CancelledError:
+            session.status = "cancelled"
+            raise
+        except Exception as e:
+            session.status = "failed"
+            session.error = e
+            logger.exception("Sessão %s falhou: %s", session.id, e)
+        finally:
+            await session.agent.close()
+
+    def _finished(self, session: Session):
+        # Também é chamado para sessões canceladas antes de começar, cujo `_run` nem chega a rodar.
+        if not session.done:
+            session.status = "cancelled"
+        session.finished_at = time.monotonic()
+        _active.dec(state="queued" if session.started_at is None else "running")
+        _sessions.inc(status=session.status)
+        if session.error is not None:
+            session.events.emit("status", session.status, error=repr(session.error))
+        else:
+            session.events.emit("status", session.status)
+        session.events.close()
+        self._user_sessions[session.owner] -= 1
+        if not self._user_sessions[session.owner]:
+            # Sem sessões pendentes do usuário: o semáforo dele pode ser descartado.
+            del self._user_sessions[session.owner]
+            self._per_user.pop(session.owner, None)
+
+    async def wait(self, session_id: str) -> Session:
+        """Aguarda o fim da sessão (concluída, com falha ou cancelada) e a devolve."""
+        session = self.sessions[session_id]
+        await asyncio.gather(session._task, return_exceptions=True)
+        return session
+
+    def cancel(self, session_id: str) -> bool:
+        """Cancela a sessão; o kernel emprestado é descartado e a vaga, liberada."""
+        session = self.sessions.get(session_id)
+        if session is None or session.done:
+            return False
+        return session._task.cancel()
+
+    async def run_many(self, tasks: List[str], owner: Hashable = "default") -> List[Session]:
+        """Submete várias tarefas e aguarda todas terminarem."""
+        sessions = [self.submit(task, owner=owner) for task in tasks]
+        return [await self.wait(session.id) for session in sessions]
+
+    def forget(self, session_id: str):
+        """Remove do registro uma sessão já terminada."""
+        session = self.sessions.get(session_id)
+        if session is not None and session.done:
+            del self.sessions[session_id]
+
+    async def close(self):
+        """Cancela as sessões em andamento e fecha os recursos criados pelo gerenciador."""
+        for session in list(self.sessions.values()):
+            self.cancel(session.id)
+        await asyncio.gather(*(s._task for s in self.sessions.values() if s._task), return_exceptions=True)
+        if self._owns_pool:
+            await self.kernel_pool.close()
+        if self._pool_start is not None:
+            await asyncio.gather(self._pool_start, return_exceptions=True)
+        if self._owns_client and self._llm_client is not None:
+            await self._llm_client.close()
+        if self._owns_knowledge_base:
+            await asyncio.to_thread(self.knowledge_base.stop_watching)
@@ -0,0 +1,323 @@
+import atexit
+import contextvars
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import IO, Any, Dict, Iterator, List, Optional, Tuple
+
+from .config import LOG_LEVEL, METRICS_HOST, METRICS_PORT, TRACE_FILE
+
+# Limites (em segundos) dos buckets dos histogramas de duração.
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in items) + "}"
+
+
+class Counter:
+    """Contador monotônico, com um valor por combinação de labels."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str):
+        self.name = name
+        self.help = help
+        self._values: Dict[Labels, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = _labels(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(_labels(labels), 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            return [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+
+
+class Gauge(Counter):
+    """Valor instantâneo (pode subir e descer)."""
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[_labels(labels)] = value
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram:
+    """Histograma com buckets fixos, no formato do Prometheus (buckets acumulados, soma e contagem)."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(sorted(buckets))
+        # Por combinação de labels: [contagens por bucket (+Inf no fim), soma, total].
+        self._values: Dict[Labels, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _labels(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            position = next((i for i, bound in enumerate(self.buckets) if value <= bound), len(self.buckets))
+            state[0][position] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self, **labels) -> Dict[str, float]:
+        state = self._values.get(_labels(labels))
+        if state is None:
+            return {"count": 0, "sum": 0.0}
+        return {"count": state[2], "sum": state[1]}
+
+    def render(self) -> List[str]:
+        lines = []
+        with self._lock:
+            for key, (counts, total, count) in self._values.items():
+                cumulative = 0
+                for bound, bucket in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += bucket
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(key, ('le', le))} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    """Métricas do processo. Pedir duas vezes o mesmo nome devolve a mesma métrica."""
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, help: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, **kwargs)
+            elif not isinstance(metric, cls):
+                raise ValueError(f"A métrica '{name}' já existe com outro tipo ({metric.kind}).")
+            return metric
+
+    def counter(self, name: str, help: str) -> Counter:
+        return self._get(Counter, name, help)
+
+    def gauge(self, name: str, help: str) -> Gauge:
+        return self._get(Gauge, name, help)
+
+    def histogram(self, name: str, help: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, buckets=buckets)
+
+    def render_prometheus(self) -> str:
+        """Todas as métricas no formato de texto de exposição do Prometheus."""
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+@dataclass
+class Span:
+    """Uma fase do trabalho do agente, com duração e atributos; spans aninhados compartilham o `trace_id`."""
+    name: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start: float
+    duration: float = 0.0
+    status: str = "ok"
+    attributes: Dict[str, Any] = field(default_factory=dict)
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self) -> dict:
+        return asdict(self)
+
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Tracer:
+    """
+    Cria spans em volta de cada fase (via contextvars, o aninhamento segue as tarefas
+    asyncio). Toda span alimenta o histograma `agent_span_duration_seconds` e é
+    repassada aos exportadores registrados.
+    """
+    def __init__(self, registry: MetricsRegistry):
+        self.exporters: List[Any] = []
+        self._duration = registry.histogram("agent_span_duration_seconds", "Duração de cada fase do agente, por span.")
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        parent = _current_span.get()
+        span = Span(
+            name=name,
+            trace_id=parent.trace_id if parent else uuid.uuid4().hex,
+            span_id=uuid.uuid4().hex[:16],
+            parent_id=parent.span_id if parent else None,
+            start=time.time(),
+            attributes=attributes,
+        )
+        token = _current_span.set(span)
+        t0 = time.perf_counter()
+        try:
+            yield span
+        except BaseException as e:
+            span.status = "error"
+            span.attributes["error"] = repr(e)
+            raise
+        finally:
+            span.duration = time.perf_counter() - t0
+            try:
+                _current_span.reset(token)
+            except ValueError:
+                # Encerrada em outro contexto (ex: gerador fechado por outra tarefa).
+                pass
+            self._duration.observe(span.duration, span=name)
+            for exporter in self.exporters:
+                exporter.export(span)
+
+
+class JsonlExporter:
+    """Grava cada span como uma linha JSON; a escrita acontece em uma thread de fundo."""
+    _STOP = object()
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+        self._thread.start()
+
+    def export(self, span: Span):
+        self._queue.put(span.to_dict())
+
+    def _write_loop(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                item = self._queue.get()
+                if item is self._STOP:
+                    return
+                f.write(json.dumps(item, ensure_ascii=False, default=str) + "\n")
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self):
+        self._queue.put(self._STOP)
+        self._thread.join()
+
+
+class PrometheusServer:
+    """Serve `/metrics` no formato de texto do Prometheus, em uma thread de fundo."""
+    def __init__(self, registry: MetricsRegistry, port: int = METRICS_PORT, host: str = METRICS_HOST):
+        registry_ref = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry_ref.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-server", daemon=True)
+
+    @property
+    def port(self) -> int:
+        return self._server.server_address[1]
+
+    def start(self) -> "PrometheusServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# Instâncias do processo, usadas pelos módulos instrumentados.
+metrics = MetricsRegistry()
+tracer = Tracer(metrics)
+
+_log_listener: Optional[logging.handlers.QueueListener] = None
+_telemetry_started = False
+
+
+def configure_logging(level: str = LOG_LEVEL, stream: Optional[IO[str]] = None):
+    """
+    Envia os logs para uma fila em memória; uma thread de fundo os escreve no console
+    (ou em `stream`). Assim, quem loga (o loop do agente) nunca espera por I/O do terminal.
+    """
+    global _log_listener
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _log_listener is not None:
+        return
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    console = logging.StreamHandler(stream)
+    console.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _log_listener = logging.handlers.QueueListener(log_queue, console)
+    _log_listener.start()
+    atexit.register(_log_listener.stop)
+    root.addHandler(logging.handlers.QueueHandler(log_queue))
+
+
+def setup_telemetry(trace_file: str = TRACE_FILE, metrics_port: int = METRICS_PORT) -> Optional[PrometheusServer]:
+    """Liga os exportadores configurados (arquivo JSONL de spans e endpoint do Prometheus); idempotente."""
+    global _telemetry_started
+    if _telemetry_started:
+        return None
+    _telemetry_started = True
+    if trace_file:
+        exporter = JsonlExporter(trace_file)
+        tracer.exporters.append(exporter)
+        atexit.register(exporter.close)
+        logging.getLogger(__name__).info("Spans gravados em %s.", trace_file)
+    if metrics_port:
+        server = PrometheusServer(metrics, port=metrics_port).start()
+        logging.getLogger(__name__).info("Métricas em http://%s:%d/metrics.", METRICS_HOST, server.port)
+        return server
+    return None
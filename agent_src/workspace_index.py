@@ -0,0 +1,199 @@
+import difflib
+import hashlib
+import logging
+import os
+import threading
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from .config import (
+    WORKSPACE_DIFF_MAX_BYTES,
+    WORKSPACE_DIR,
+    WORKSPACE_MAX_FILES,
+    WORKSPACE_READ_MAX_BYTES,
+    WORKSPACE_SUMMARY_MAX_LINES,
+)
+
+logger = logging.getLogger(__name__)
+
+# Cabeçalho da seção de arquivos alterados anexada às observações.
+CHANGES_HEADER = "ARQUIVOS ALTERADOS NO WORKSPACE:"
+_HASH_BLOCK = 1 << 20
+
+
+@dataclass(frozen=True)
+class FileState:
+    """Estado de um arquivo do workspace: tamanho, mtime e hash do conteúdo."""
+    size: int
+    mtime_ns: int
+    digest: str
+
+
+@dataclass
+class WorkspaceChange:
+    """Um arquivo criado ("added"), alterado ("modified") ou apagado ("removed") desde o último snapshot."""
+    path: str
+    kind: str
+    size: int = 0
+    previous_size: int = 0
+    diff: str = ""
+
+
+def _format_size(size: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if size < 1024 or unit == "MB":
+            return f"{size} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def _file_digest(path: str) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(_HASH_BLOCK), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class WorkspaceIndex:
+    """
+    Índice, do lado do host, dos arquivos do workspace compartilhado com o kernel.
+
+    Cada `refresh()` percorre o diretório e compara tamanho, mtime e hash com o
+    snapshot anterior; só arquivos com tamanho ou mtime diferentes são relidos para
+    calcular o hash. O conteúdo de arquivos de texto pequenos (até `diff_max_bytes`)
+    fica guardado, o que permite mostrar um diff das alterações. Entradas ocultas
+    (como o diretório `.outputs` das saídas truncadas) são ignoradas.
+
+    `read_range` lê um trecho de um arquivo diretamente do disco, sem executar
+    código no kernel. Os caminhos são relativos à raiz do workspace, que é o
+    diretório de trabalho do kernel.
+    """
+    def __init__(
+        self,
+        root: str = WORKSPACE_DIR,
+        diff_max_bytes: int = WORKSPACE_DIFF_MAX_BYTES,
+        summary_max_lines: int = WORKSPACE_SUMMARY_MAX_LINES,
+        max_files: int = WORKSPACE_MAX_FILES,
+    ):
+        self.root = root
+        self.diff_max_bytes = diff_max_bytes
+        self.summary_max_lines = summary_max_lines
+        self.max_files = max_files
+        self._files: Dict[str, FileState] = {}
+        self._texts: Dict[str, str] = {}
+        self._scanned = False
+        self._lock = threading.Lock()
+
+    @property
+    def files(self) -> Dict[str, FileState]:
+        return dict(self._files)
+
+    def _scan(self) -> Dict[str, os.stat_result]:
+        stats = {}
+        if not os.path.isdir(self.root):
+            return stats
+        for directory, subdirs, filenames in os.walk(self.root):
+            subdirs[:] = sorted(d for d in subdirs if not d.startswith("."))
+            for filename in sorted(filenames):
+                if filename.startswith("."):
+                    continue
+                path = os.path.join(directory, filename)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                stats[os.path.relpath(path, self.root).replace(os.sep, "/")] = stat
+                if len(stats) >= self.max_files:
+                    logger.warning("O workspace tem mais de %s arquivos; o restante não é indexado.", self.max_files)
+                    return stats
+        return stats
+
+    def _read_text(self, path: str, size: int) -> Optional[str]:
+        if size > self.diff_max_bytes:
+            return None
+        try:
+            with open(os.path.join(self.root, path), "rb") as f:
+                return f.read(self.diff_max_bytes + 1).decode("utf-8")
+        except (OSError, UnicodeDecodeError):
+            return None
+
+    def refresh(self) -> List[WorkspaceChange]:
+        """Atualiza o snapshot e devolve as mudanças desde o anterior (vazio na primeira chamada)."""
+        with self._lock:
+            files: Dict[str, FileState] = {}
+            texts: Dict[str, str] = {}
+            changes: List[WorkspaceChange] = []
+            for path, stat in self._scan().items():
+                previous = self._files.get(path)
+                if previous is not None and previous.size == stat.st_size and previous.mtime_ns == stat.st_mtime_ns:
+                    files[path] = previous
+                    if path in self._texts:
+                        texts[path] = self._texts[path]
+                    continue
+                try:
+                    state = FileState(stat.st_size, stat.st_mtime_ns, _file_digest(os.path.join(self.root, path)))
+                except OSError:
+                    # Apagado entre a listagem e a leitura.
+                    continue
+                files[path] = state
+                text = self._read_text(path, state.size)
+                if text is not None:
+                    texts[path] = text
+                if previous is None:
+                    changes.append(WorkspaceChange(path, "added", state.size, diff=self._diff(None, text)))
+                elif previous.digest != state.digest:
+                    changes.append(WorkspaceChange(path, "modified", state.size, previous.size, self._diff(self._texts.get(path), text)))
+            for path, previous in self._files.items():
+                if path not in files:
+                    changes.append(WorkspaceChange(path, "removed", previous_size=previous.size))
+            self._files, self._texts = files, texts
+            if not self._scanned:
+                # O primeiro snapshot é a linha de base: nada "mudou" ainda.
+                self._scanned = True
+                return []
+            return sorted(changes, key=lambda change: change.path)
+
+    @staticmethod
+    def _diff(before: Optional[str], after: Optional[str]) -> str:
+        """Diff unificado (sem cabeçalho) entre duas versões de um arquivo de texto pequeno."""
+        if after is None:
+            return ""
+        if before is None:
+            return "\n".join(f"+{line}" for line in after.splitlines())
+        lines = difflib.unified_diff(before.splitlines(), after.splitlines(), n=0, lineterm="")
+        return "\n".join(line for line in lines if not line.startswith(("---", "+++", "@@")))
+
+    def summarize(self, changes: List[WorkspaceChange]) -> str:
+        """
+        Resumo compacto das mudanças para a observação: uma linha por arquivo e, para
+        textos pequenos, o diff, limitado a `summary_max_lines` linhas no total.
+        """
+        if not changes:
+            return ""
+        lines = [CHANGES_HEADER]
+        for change in changes:
+            if change.kind == "added":
+                lines.append(f"+ {change.path} (novo, {_format_size(change.size)})")
+            elif change.kind == "modified":
+                lines.append(f"~ {change.path} ({_format_size(change.previous_size)} -> {_format_size(change.size)})")
+            else:
+                lines.append(f"- {change.path} (apagado)")
+            if change.diff:
+                lines.extend(f"    {line}" for line in change.diff.splitlines())
+        if len(lines) > self.summary_max_lines + 1:
+            omitted = len(lines) - self.summary_max_lines
+            lines = lines[:self.summary_max_lines] + [f"(... {omitted} linhas omitidas)"]
+        return "\n".join(lines)
+
+    def read_range(self, path: str, start: int = 0, length: int = WORKSPACE_READ_MAX_BYTES) -> str:
+        """
+        Lê `length` bytes de um arquivo do workspace a partir do byte `start`, direto do
+        disco. Um caractere UTF-8 cortado nas bordas do trecho é descartado.
+        """
+        root = os.path.realpath(self.root)
+        full_path = os.path.realpath(os.path.join(root, path))
+        if os.path.commonpath([root, full_path]) != root:
+            raise ValueError(f"O caminho '{path}' está fora do workspace.")
+        with open(full_path, "rb") as f:
+            f.seek(max(0, start))
+            return f.read(max(0, length)).decode("utf-8", errors="ignore")
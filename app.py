@@ -1,43 +1,52 @@
 import gradio as gr
-import asyncio
-import io
-import sys
-from agent_src.main import Agent
+from agent_src.config import KB_WARMUP, UI_UPDATE_INTERVAL
+from agent_src.events import format_event
+from agent_src.session_manager import SessionLimitError, SessionManager
+from agent_src.telemetry import configure_logging, setup_telemetry
 
-# Função para capturar a saída de print e exibi-la em tempo real (simulado via yield)
-async def run_agent_task(task: str, progress=gr.Progress()):
-    """
-    Executa a tarefa do agente e captura a saída do console para exibir na UI.
-    """
-    if not task:
-        yield "Por favor, insira uma tarefa.", ""
-
-    # Redireciona stdout para capturar os logs do agente
-    old_stdout = sys.stdout
-    sys.stdout = captured_output = io.StringIO()
+# Logs do agente vão para o console por uma fila (sem I/O síncrono no loop); spans e
+# métricas são exportados conforme TRACE_FILE e METRICS_PORT.
+configure_logging()
+setup_telemetry()
 
-    agent = Agent()
+# Gerenciador compartilhado entre todas as requisições da UI: as tarefas rodam em
+# paralelo no event loop do Gradio, com um único pool de kernels pré-aquecidos, um
+# único pool de conexões com o LLM e um único modelo de embeddings.
+session_manager = SessionManager()
+# Índice e modelo de embeddings são carregados em segundo plano: a UI sobe sem esperar por eles.
+if KB_WARMUP:
+    session_manager.knowledge_base.warm_up()
 
-    # Gerador para fornecer feedback de progresso
-    def log_generator():
-        yield "Iniciando a tarefa do agente...\n"
-        # O loop do agente é bloqueante, então executamos e depois pegamos a saída.
-        # Uma implementação mais avançada usaria yields dentro do loop do agente.
-        asyncio.run(agent.run(task))
-        yield captured_output.getvalue()
+async def run_agent_task(task: str, request: gr.Request):
+    """
+    Executa a tarefa do agente e exibe o log na UI enquanto ela roda.
 
-    full_log = ""
-    # Como a execução do agente é um processo longo, iteramos sobre um gerador
-    # para manter a UI responsiva, embora o log só apareça no final aqui.
-    for log_chunk in log_generator():
-        full_log += log_chunk
-        yield full_log
+    Cada chamada lê apenas os eventos da própria sessão (sem redirecionar o stdout do
+    processo), agrupados para atualizar a UI no máximo a cada UI_UPDATE_INTERVAL segundos.
+    A sessão do navegador (`session_hash`, injetada pelo Gradio) identifica o usuário
+    nos limites por usuário e na fila justa do LLM.
+    """
+    if not task:
+        yield "Por favor, insira uma tarefa."
+        return
 
-    # Restaura stdout
-    sys.stdout = old_stdout
+    try:
+        session = session_manager.submit(task, owner=request.session_hash if request else "default")
+    except SessionLimitError as e:
+        yield str(e)
+        return
 
-    # Retorna o log final
-    return full_log
+    full_log = "Iniciando a tarefa do agente...\n"
+    yield full_log
+    try:
+        async for batch in session.events.batches(UI_UPDATE_INTERVAL):
+            full_log += "".join(format_event(event) for event in batch)
+            yield full_log
+    finally:
+        # Se a página for fechada no meio da tarefa, a sessão é cancelada em vez de ficar órfã.
+        session_manager.cancel(session.id)
+        await session_manager.wait(session.id)
+        session_manager.forget(session.id)
 
 # Criação da Interface Gradio
 with gr.Blocks(theme=gr.themes.Soft(), title="Agente Autônomo") as demo:
@@ -58,5 +67,8 @@ with gr.Blocks(theme=gr.themes.Soft(), title="Agente Autônomo") as demo:
         outputs=[output_log]
     )
 
+    # Os kernels são aquecidos assim que a página abre, antes da primeira tarefa.
+    demo.load(fn=session_manager.start)
+
 if __name__ == "__main__":
     demo.launch(server_name="0.0.0.0", server_port=7860)
@@ -0,0 +1,229 @@
+"""
+Benchmark offline do agente: mede o custo do loop do agente, do cliente Jupyter e da
+KnowledgeBase usando os substitutos locais de `benchmarks.fake_services` (sem GPU,
+Docker nem download de modelos).
+
+Cenários:
+    kernel  JupyterClient.execute_code, com N clientes em paralelo.
+    kb      construção da KnowledgeBase e KnowledgeBase.search, por tamanho de corpus.
+    agent   Agent.run completo (plano + turnos) via SessionManager, por número de
+            turnos e de sessões simultâneas.
+
+Cada resultado traz latência p50/p95 (ms), vazão e o pico de memória residente (RSS)
+do processo até o fim do cenário (o pico nunca diminui; rode um cenário por vez para
+isolá-lo).
+
+Uso:
+    python -m benchmarks.agent_benchmark --json resultados.json
+    python -m benchmarks.agent_benchmark --scenarios agent --turns 5 20 --concurrency 1 8 32 --token-latency 0.005
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from agent_src.jupyter_client import JupyterClient
+from agent_src.kernel_pool import KernelPool
+from agent_src.knowledge_base import KnowledgeBase
+from agent_src.llm_client import create_llm_client
+from agent_src.session_manager import SessionManager
+from agent_src.telemetry import configure_logging
+
+from .fake_services import FakeKernelGateway, FakeLLMServer, HashingEncoder, ServiceThread
+
+SCENARIOS = ("kernel", "kb", "agent")
+_VOCABULARY = [f"termo{i}" for i in range(5000)]
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss é em KiB no Linux e em bytes no macOS.
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def summarize(scenario: str, params: Dict, latencies_ms: List[float], wall_seconds: float, **extra) -> Dict:
+    return {
+        "scenario": scenario,
+        "params": params,
+        "count": len(latencies_ms),
+        "latency_ms_p50": float(np.percentile(latencies_ms, 50)) if latencies_ms else None,
+        "latency_ms_p95": float(np.percentile(latencies_ms, 95)) if latencies_ms else None,
+        "latency_ms_mean": float(np.mean(latencies_ms)) if latencies_ms else None,
+        "throughput_per_s": len(latencies_ms) / wall_seconds if wall_seconds > 0 else None,
+        "wall_seconds": wall_seconds,
+        "peak_rss_mb": peak_rss_mb(),
+        **extra,
+    }
+
+
+async def bench_kernel(gateway: FakeKernelGateway, executions: int, concurrency: int) -> Dict:
+    clients = [JupyterClient(gateway_url=gateway.url, spill_dir=None) for _ in range(concurrency)]
+    for client in clients:
+        await asyncio.to_thread(client.start_kernel)
+    latencies = []
+
+    async def worker(client: JupyterClient, count: int):
+        for i in range(count):
+            t0 = time.perf_counter()
+            await client.execute_code(f"print({i})")
+            latencies.append((time.perf_counter() - t0) * 1000)
+
+    per_client = max(1, executions // concurrency)
+    # Uma execução por cliente antes de medir, para abrir os canais WebSocket.
+    await asyncio.gather(*(client.execute_code("pass") for client in clients))
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(client, per_client) for client in clients))
+    wall = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+        await asyncio.to_thread(client.shutdown_kernel)
+    return summarize("kernel", {"concurrency": concurrency, "exec_latency": gateway.exec_latency}, latencies, wall)
+
+
+def _write_corpus(directory: str, documents: int, words_per_document: int, rng: random.Random):
+    for i in range(documents):
+        words = rng.choices(_VOCABULARY, k=words_per_document)
+        with open(os.path.join(directory, f"doc{i:06d}.txt"), "w", encoding="utf-8") as f:
+            f.write(" ".join(words) + ".")
+
+
+def bench_knowledge_base(documents: int, queries: int, words_per_document: int = 300) -> Dict:
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        knowledge_dir = os.path.join(tmp, "knowledge")
+        os.makedirs(knowledge_dir)
+        _write_corpus(knowledge_dir, documents, words_per_document, rng)
+
+        encoder = HashingEncoder()
+        t0 = time.perf_counter()
+        kb = KnowledgeBase(knowledge_dir=knowledge_dir, model=encoder, lazy=False)
+        build_seconds = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        KnowledgeBase(knowledge_dir=knowledge_dir, model=encoder, lazy=False)
+        warm_load_seconds = time.perf_counter() - t0
+
+        # Consultas distintas, para medir a busca e não o cache de resultados.
+        texts = [" ".join(rng.choices(_VOCABULARY, k=8)) for _ in range(queries)]
+        latencies = []
+        start = time.perf_counter()
+        for text in texts:
+            t0 = time.perf_counter()
+            kb.search(text)
+            latencies.append((time.perf_counter() - t0) * 1000)
+        wall = time.perf_counter() - start
+        return summarize(
+            "kb",
+            {"documents": documents, "words_per_document": words_per_document},
+            latencies,
+            wall,
+            chunks=len(kb.documents),
+            build_seconds=build_seconds,
+            warm_load_seconds=warm_load_seconds,
+        )
+
+
+async def bench_agent(llm: FakeLLMServer, gateway: FakeKernelGateway, knowledge_base: KnowledgeBase, turns: int, concurrency: int, tasks: int) -> Dict:
+    llm.turns = turns
+    kernel_pool = KernelPool(gateway_url=gateway.url, min_idle=concurrency, max_size=concurrency, preload_code=None)
+    manager = SessionManager(
+        kernel_pool=kernel_pool,
+        llm_client=create_llm_client(base_url=f"{llm.url}/v1"),
+        knowledge_base=knowledge_base,
+        max_concurrent=concurrency,
+        max_per_user=concurrency,
+        max_queued=tasks,
+    )
+    llm_requests, executions = llm.requests, gateway.executions
+    await manager.start()
+    start = time.perf_counter()
+    sessions = [manager.submit(f"O que é o turno {i}? Execute {turns} turnos.") for i in range(tasks)]
+    sessions = [await manager.wait(session.id) for session in sessions]
+    wall = time.perf_counter() - start
+    await manager.close()
+    await kernel_pool.close()
+    await manager.llm_client.close()
+
+    failed = [s for s in sessions if s.status != "done"]
+    latencies = [(s.finished_at - s.started_at) * 1000 for s in sessions if s.status == "done"]
+    return summarize(
+        "agent",
+        {"turns": turns, "concurrency": concurrency, "tasks": tasks, "token_latency": llm.token_latency},
+        latencies,
+        wall,
+        failed=len(failed),
+        llm_requests=llm.requests - llm_requests,
+        kernel_executions=gateway.executions - executions,
+    )
+
+
+async def run(args) -> List[Dict]:
+    results = []
+    # Os logs do agente e da KB vão para /dev/null (o custo de gerá-los continua medido);
+    # só o resumo de cada cenário aparece no terminal.
+    configure_logging(args.log_level, stream=open(os.devnull, "w"))
+    llm = FakeLLMServer(token_latency=args.token_latency, prefill_latency=args.prefill_latency)
+    gateway = FakeKernelGateway(exec_latency=args.exec_latency, output_bytes=args.output_bytes)
+
+    def report(result: Dict):
+        results.append(result)
+        print(
+            f"{result['scenario']:<8}{json.dumps(result['params']):<72}"
+            f"p50={result['latency_ms_p50'] or 0:9.2f}ms p95={result['latency_ms_p95'] or 0:9.2f}ms "
+            f"vazão={result['throughput_per_s'] or 0:9.1f}/s rss={result['peak_rss_mb']:8.1f}MB"
+        )
+
+    with ServiceThread(llm, gateway):
+        if "kernel" in args.scenarios:
+            for concurrency in args.concurrency:
+                report(await bench_kernel(gateway, args.executions, concurrency))
+        if "kb" in args.scenarios:
+            for documents in args.corpus_sizes:
+                report(await asyncio.to_thread(bench_knowledge_base, documents, args.queries))
+        if "agent" in args.scenarios:
+            with tempfile.TemporaryDirectory() as tmp:
+                knowledge_dir = os.path.join(tmp, "knowledge")
+                os.makedirs(knowledge_dir)
+                _write_corpus(knowledge_dir, 20, 100, random.Random(0))
+                knowledge_base = KnowledgeBase(knowledge_dir=knowledge_dir, model=HashingEncoder(), lazy=False)
+                for turns in args.turns:
+                    for concurrency in args.concurrency:
+                        tasks = max(concurrency, args.tasks)
+                        report(await bench_agent(llm, gateway, knowledge_base, turns, concurrency, tasks))
+    return results
+
+
+def main(argv: List[str] = None) -> List[Dict]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16], help="Clientes/sessões simultâneos.")
+    parser.add_argument("--turns", type=int, nargs="+", default=[1, 5, 20], help="Turnos por tarefa do agente.")
+    parser.add_argument("--tasks", type=int, default=16, help="Tarefas por medição do agente (no mínimo a concorrência).")
+    parser.add_argument("--executions", type=int, default=500, help="Execuções por medição do kernel.")
+    parser.add_argument("--corpus-sizes", type=int, nargs="+", default=[100, 1000, 5000], help="Documentos no corpus da KB.")
+    parser.add_argument("--queries", type=int, default=200, help="Consultas por medição da KB.")
+    parser.add_argument("--token-latency", type=float, default=0.0, help="Segundos entre tokens do LLM falso.")
+    parser.add_argument("--prefill-latency", type=float, default=0.0, help="Segundos até o primeiro token do LLM falso.")
+    parser.add_argument("--exec-latency", type=float, default=0.0, help="Segundos por execução no kernel falso.")
+    parser.add_argument("--output-bytes", type=int, default=0, help="Bytes extras no stdout de cada execução.")
+    parser.add_argument("--log-level", default="INFO", help="Nível dos logs do agente (descartados, mas ainda gerados).")
+    parser.add_argument("--json", help="Arquivo onde salvar os resultados em JSON.")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(run(args))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+        print(f"Resultados salvos em {args.json}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,367 @@
+"""
+Substitutos locais do servidor LLM (API da OpenAI), do Jupyter Kernel Gateway e do
+modelo de embeddings, para medir o custo do próprio agente sem GPU nem Docker. Os
+testes usam os mesmos substitutos.
+
+Os servidores falam os protocolos reais: as APIs HTTP (o LLM, com keep-alive e SSE, e
+a REST do gateway) usam o `http.server` da biblioteca padrão, e os canais do kernel, o
+`websockets`. No benchmark, rodam em um event loop próprio, em outra thread
+(`ServiceThread`), como serviços externos.
+"""
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from typing import Dict, List, Optional
+from urllib.parse import urlsplit
+
+import numpy as np
+import websockets
+
+_TOKEN_RE = re.compile(r"\s*\S+|\s+")
+_TURN_RE = re.compile(r'print\("turno (\d+)"\)')
+_KERNEL_PATH_RE = re.compile(r"^/api/kernels/([^/]+)(/interrupt|/channels)?$")
+
+
+class _JSONHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: HTTPStatus, payload: Optional[dict] = None, headers: Optional[Dict[str, str]] = None):
+        body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class _ChatCompletionsHandler(_JSONHandler):
+    def do_POST(self):
+        llm: "FakeLLMServer" = self.server.llm
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        llm.count_request()
+        if not self.path.endswith("/chat/completions"):
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": self.path})
+            return
+        request = json.loads(body)
+        text = llm.script(request["messages"])
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        if not request.get("stream"):
+            self._send_json(HTTPStatus.OK, {
+                "id": completion_id, "object": "chat.completion", "created": int(time.time()), "model": request["model"],
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            })
+            return
+
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(data: str):
+            payload = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(payload):x}\r\n".encode("latin-1") + payload + b"\r\n")
+
+        def send_delta(delta: dict, finish_reason=None):
+            send(json.dumps({
+                "id": completion_id, "object": "chat.completion.chunk", "created": int(time.time()), "model": request["model"],
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+            }))
+
+        if llm.prefill_latency:
+            time.sleep(llm.prefill_latency)
+        send_delta({"role": "assistant", "content": ""})
+        for token in _TOKEN_RE.findall(text):
+            if llm.token_latency:
+                time.sleep(llm.token_latency)
+            send_delta({"content": token})
+        send_delta({}, finish_reason="stop")
+        send("[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class FakeLLMServer:
+    """
+    Endpoint `/v1/chat/completions` compatível com a API da OpenAI, com respostas roteirizadas.
+
+    O pedido do planejador recebe um plano fixo. Nos demais, o servidor lê o número do
+    último turno no histórico (o código gerado é `print("turno N")`) e responde com o
+    turno seguinte, até `turns`, quando responde `print("TASK_COMPLETE")`. Cada token
+    (palavra) é enviado após `token_latency` segundos, e `prefill_latency` é aplicado
+    antes do primeiro. Cada conexão é atendida por uma thread própria.
+    """
+    def __init__(self, turns: int = 3, token_latency: float = 0.0, prefill_latency: float = 0.0):
+        self.turns = turns
+        self.token_latency = token_latency
+        self.prefill_latency = prefill_latency
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_address[1]}"
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def script(self, messages: List[Dict[str, str]]) -> str:
+        if len(messages) == 1 and "planejamento" in messages[0]["content"]:
+            return "- [ ] Passo 1: Executar os turnos.\n- [ ] Passo 2: Concluir a tarefa."
+        last_turn = 0
+        for message in reversed(messages):
+            match = _TURN_RE.search(message["content"]) if message["role"] == "assistant" else None
+            if match:
+                last_turn = int(match.group(1))
+                break
+        if last_turn >= self.turns:
+            return '```python\nprint("TASK_COMPLETE")\n```'
+        return f'```python\nprint("turno {last_turn + 1}")\n```'
+
+    async def start(self):
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _ChatCompletionsHandler)
+        self._server.daemon_threads = True
+        self._server.llm = self
+        threading.Thread(target=self._server.serve_forever, name="fake-llm", daemon=True).start()
+
+    async def stop(self):
+        await asyncio.to_thread(self._server.shutdown)
+        self._server.server_close()
+
+
+def _reply(request: dict, msg_type: str, content: dict) -> str:
+    """Monta uma mensagem de resposta do kernel vinculada à requisição original."""
+    return json.dumps({
+        "header": {"msg_id": f"{msg_type}-{request['header']['msg_id']}", "msg_type": msg_type},
+        "parent_header": request["header"],
+        "metadata": {},
+        "content": content,
+        "channel": "iopub",
+    })
+
+
+class _KernelRestHandler(_JSONHandler):
+    """API REST do gateway falso. O pedido de abertura de um canal é redirecionado ao servidor WebSocket."""
+    def do_POST(self):
+        gateway: "FakeKernelGateway" = self.server.gateway
+        self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        path = urlsplit(self.path).path
+        match = _KERNEL_PATH_RE.match(path)
+        if path == "/api/kernels":
+            kernel_id = uuid.uuid4().hex
+            gateway.kernels.add(kernel_id)
+            self._send_json(HTTPStatus.CREATED, {"id": kernel_id, "name": "python3"})
+        elif match and match.group(2) == "/interrupt":
+            gateway.interrupt()
+            self._send_json(HTTPStatus.NO_CONTENT)
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": path})
+
+    def do_DELETE(self):
+        gateway: "FakeKernelGateway" = self.server.gateway
+        match = _KERNEL_PATH_RE.match(urlsplit(self.path).path)
+        if match and match.group(2) is None:
+            gateway.kernels.discard(match.group(1))
+            self._send_json(HTTPStatus.NO_CONTENT)
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": self.path})
+
+    def do_GET(self):
+        gateway: "FakeKernelGateway" = self.server.gateway
+        match = _KERNEL_PATH_RE.match(urlsplit(self.path).path)
+        if match and match.group(2) == "/channels":
+            # O cliente `websockets` segue o redirecionamento, como faria através de um proxy.
+            self._send_json(HTTPStatus.TEMPORARY_REDIRECT, headers={"Location": f"{gateway.ws_url}{self.path}"})
+        else:
+            self._send_json(HTTPStatus.NOT_FOUND, {"error": self.path})
+
+
+class FakeKernelGateway:
+    """
+    Kernel Gateway falso: API REST (`/api/kernels`) e canais WebSocket, sem executar código.
+
+    Cada `execute_request` espera `exec_latency` segundos e, se a célula chama `print`,
+    devolve o próprio código (mais `output_bytes` bytes de enchimento) no stdout; as
+    demais (ex: a gravação do `todo.md`) não produzem saída, como no kernel real.
+    Códigos especiais: "sleep N" espera N segundos (interrompível pela API REST ou por
+    `interrupt()`) antes de devolver o código, "raise" produz um erro e "result X", um
+    `execute_result` com X. Como o ipykernel, um erro em uma requisição com
+    `stop_on_error` aborta as que foram enviadas antes dele terminar.
+
+    A API REST roda em um `ThreadingHTTPServer` (em `url`) e os canais, no `websockets`
+    (em `ws_url`, para onde a REST redireciona a abertura de um canal). Os testes o usam
+    como context manager assíncrono, no próprio event loop; o benchmark, dentro de um
+    `ServiceThread`.
+    """
+    def __init__(self, exec_latency: float = 0.0, output_bytes: int = 0):
+        self.exec_latency = exec_latency
+        self.output_bytes = output_bytes
+        self.kernels: set = set()
+        self.connections = 0
+        self.executed: List[str] = []
+        self.aborted: List[str] = []
+        self.server = None
+        self._rest: Optional[ThreadingHTTPServer] = None
+        self._abort_before: Optional[datetime] = None
+        self._interrupted: Optional[asyncio.Event] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._rest.server_address[1]}"
+
+    @property
+    def ws_url(self) -> str:
+        port = next(iter(self.server.sockets)).getsockname()[1]
+        return f"ws://127.0.0.1:{port}"
+
+    @property
+    def executions(self) -> int:
+        return len(self.executed) + len(self.aborted)
+
+    def interrupt(self):
+        # Pode ser chamado de outra thread (como a da API REST).
+        self._loop.call_soon_threadsafe(self._interrupted.set)
+
+    async def handler(self, websocket):
+        self.connections += 1
+        async for raw in websocket:
+            request = json.loads(raw)
+            if request["header"]["msg_type"] == "execute_request":
+                await self._execute(websocket, request)
+
+    async def _execute(self, websocket, request: dict):
+        code = request["content"]["code"]
+        await websocket.send(_reply(request, "status", {"execution_state": "busy"}))
+        if self._abort_before and datetime.fromisoformat(request["header"]["date"]) <= self._abort_before:
+            self.aborted.append(code)
+            await websocket.send(_reply(request, "execute_reply", {"status": "aborted"}))
+            await websocket.send(_reply(request, "status", {"execution_state": "idle"}))
+            return
+        self.executed.append(code)
+        if self.exec_latency:
+            await asyncio.sleep(self.exec_latency)
+        if code.startswith("sleep "):
+            self._interrupted.clear()
+            try:
+                await asyncio.wait_for(self._interrupted.wait(), float(code.split()[1]))
+            except asyncio.TimeoutError:
+                pass
+            else:
+                await websocket.send(_reply(request, "error", {"ename": "KeyboardInterrupt", "evalue": "", "traceback": []}))
+                self._stop_on_error(request)
+                await websocket.send(_reply(request, "status", {"execution_state": "idle"}))
+                return
+        if code.startswith("result "):
+            await websocket.send(_reply(request, "execute_result", {"data": {"text/plain": code[7:]}, "execution_count": 1}))
+        elif code == "raise":
+            await websocket.send(_reply(request, "error", {"ename": "ValueError", "evalue": "boom", "traceback": []}))
+            self._stop_on_error(request)
+        elif "print(" in code or code.startswith("sleep "):
+            await websocket.send(_reply(request, "stream", {"name": "stdout", "text": code + ("\n" + "x" * self.output_bytes if self.output_bytes else "")}))
+        await websocket.send(_reply(request, "status", {"execution_state": "idle"}))
+
+    def _stop_on_error(self, request: dict):
+        if request["content"].get("stop_on_error", True):
+            self._abort_before = datetime.now(timezone.utc)
+
+    async def start(self):
+        self._loop = asyncio.get_running_loop()
+        self._interrupted = asyncio.Event()
+        self.server = await websockets.serve(self.handler, "127.0.0.1", 0)
+        self._rest = ThreadingHTTPServer(("127.0.0.1", 0), _KernelRestHandler)
+        self._rest.daemon_threads = True
+        self._rest.gateway = self
+        threading.Thread(target=self._rest.serve_forever, name="fake-gateway-rest", daemon=True).start()
+
+    async def stop(self):
+        await asyncio.to_thread(self._rest.shutdown)
+        self._rest.server_close()
+        self.server.close()
+        await self.server.wait_closed()
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.stop()
+
+
+class ServiceThread:
+    """Roda os servidores falsos em um event loop próprio, em uma thread separada."""
+    def __init__(self, *servers):
+        self.servers = servers
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="fake-services", daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        for server in self.servers:
+            asyncio.run_coroutine_threadsafe(server.start(), self.loop).result()
+        return self
+
+    def __exit__(self, *exc):
+        for server in self.servers:
+            asyncio.run_coroutine_threadsafe(server.stop(), self.loop).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+class FakeStream:
+    """Imita o AsyncStream do SDK da OpenAI, registrando quantos chunks foram lidos."""
+    def __init__(self, deltas):
+        self.deltas = deltas
+        self.consumed = 0
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.consumed >= len(self.deltas):
+            raise StopAsyncIteration
+        delta = self.deltas[self.consumed]
+        self.consumed += 1
+        return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=delta))])
+
+    async def close(self):
+        self.closed = True
+
+
+class HashingEncoder:
+    """
+    Codificador determinístico e barato (hashing de palavras em `dimension` posições),
+    usado no lugar do SentenceTransformer. Registra os textos codificados (`encoded`) e
+    o tamanho de cada lote (`calls`), para os testes verificarem o que foi recodificado.
+    """
+    def __init__(self, dimension: int = 384):
+        self.dimension = dimension
+        self.encoded: List[str] = []
+        self.calls: List[int] = []
+
+    def encode(self, texts, convert_to_tensor=False, **kwargs):
+        self.encoded.extend(texts)
+        self.calls.append(len(texts))
+        vectors = np.zeros((len(texts), self.dimension), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+                column = int.from_bytes(digest[:4], "little") % self.dimension
+                vectors[row, column] += 1.0 if digest[4] & 1 else -1.0
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-6)
@@ -0,0 +1,154 @@
+"""
+Compara os tipos de índice da KnowledgeBase (recall@k x latência) contra a busca exata.
+
+Uso:
+    # Corpus sintético (não precisa do modelo de embeddings):
+    python -m benchmarks.index_benchmark --synthetic 200000 --dim 384
+    # Corpus real, chunkado e codificado como na KnowledgeBase:
+    python -m benchmarks.index_benchmark --knowledge-dir ./knowledge --json resultados.json
+"""
+import argparse
+import json
+import os
+import time
+from dataclasses import replace
+from typing import Dict, List
+
+import numpy as np
+
+from agent_src.chunking import chunk_text
+from agent_src.config import KB_CHUNK_OVERLAP, KB_CHUNK_SIZE, KB_CHUNK_STRATEGY
+from agent_src.index_factory import IndexConfig, build_index
+
+DEFAULT_CONFIGS = [
+    "flat",
+    "ivf_flat:nprobe=1",
+    "ivf_flat:nprobe=8",
+    "ivf_flat:nprobe=32",
+    "ivf_pq:nprobe=8",
+    "ivf_pq:nprobe=32",
+    "hnsw:ef_search=16",
+    "hnsw:ef_search=64",
+    "hnsw:ef_search=128",
+]
+
+
+def parse_config(spec: str, metric: str, base: IndexConfig) -> IndexConfig:
+    """Converte "tipo:param=valor,param=valor" em um IndexConfig."""
+    kind, _, params = spec.partition(":")
+    overrides = {"kind": kind, "metric": metric}
+    for item in filter(None, params.split(",")):
+        key, _, value = item.partition("=")
+        overrides[key] = int(value)
+    return replace(base, **overrides)
+
+
+def synthetic_corpus(n: int, dimension: int, n_queries: int, seed: int = 0):
+    """Vetores agrupados em clusters (mais realista que ruído uniforme) e consultas próximas deles."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(1, n // 100), dimension)).astype("float32")
+    assignment = rng.integers(0, len(centers), size=n)
+    vectors = centers[assignment] + 0.3 * rng.normal(size=(n, dimension)).astype("float32")
+    picks = rng.integers(0, n, size=n_queries)
+    queries = vectors[picks] + 0.1 * rng.normal(size=(n_queries, dimension)).astype("float32")
+    return vectors.astype("float32"), queries.astype("float32")
+
+
+def knowledge_corpus(knowledge_dir: str, n_queries: int, model_name: str, seed: int = 0):
+    """Chunka e codifica os arquivos .txt do diretório; as consultas são chunks sorteados."""
+    from sentence_transformers import SentenceTransformer
+
+    chunks = []
+    for filename in sorted(os.listdir(knowledge_dir)):
+        if filename.endswith(".txt"):
+            with open(os.path.join(knowledge_dir, filename), "r", encoding="utf-8") as f:
+                chunks.extend(c.text for c in chunk_text(f.read(), filename, KB_CHUNK_SIZE, KB_CHUNK_OVERLAP, KB_CHUNK_STRATEGY))
+    if not chunks:
+        raise SystemExit(f"Nenhum arquivo .txt em '{knowledge_dir}'.")
+    model = SentenceTransformer(model_name)
+    vectors = np.asarray(model.encode(chunks, batch_size=64, convert_to_tensor=False), dtype="float32")
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), size=n_queries)]
+    return vectors, queries
+
+
+def run_config(config: IndexConfig, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int) -> Dict:
+    start = time.perf_counter()
+    index = build_index(config, [vectors[i:i + 4096] for i in range(0, len(vectors), 4096)])
+    build_seconds = time.perf_counter() - start
+
+    prepared = config.prepare(queries)
+    latencies = []
+    found = np.empty((len(queries), k), dtype="int64")
+    for i in range(len(prepared)):
+        t0 = time.perf_counter()
+        _, ids = index.search(prepared[i:i + 1], k)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        found[i] = ids[0]
+
+    t0 = time.perf_counter()
+    index.search(prepared, k)
+    batch_seconds = time.perf_counter() - t0
+
+    recall = np.mean([len(set(found[i]) & set(truth[i])) / k for i in range(len(queries))])
+    return {
+        "config": config.kind,
+        "params": {key: getattr(config, key) for key in ("nlist", "nprobe", "pq_m", "hnsw_m", "ef_search")},
+        "metric": config.metric,
+        "recall_at_k": float(recall),
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+        "batch_qps": float(len(queries) / batch_seconds) if batch_seconds > 0 else None,
+        "build_seconds": build_seconds,
+        "ntotal": int(index.ntotal),
+    }
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument("--knowledge-dir", help="Diretório com arquivos .txt a indexar.")
+    source.add_argument("--synthetic", type=int, default=100_000, help="Tamanho do corpus sintético.")
+    parser.add_argument("--dim", type=int, default=384, help="Dimensão dos vetores sintéticos.")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="Modelo de embeddings (com --knowledge-dir).")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--metric", choices=["l2", "ip"], default="l2")
+    parser.add_argument("--nlist", type=int, default=None, help="Número de listas IVF (padrão: ~sqrt(N)*4).")
+    parser.add_argument("--configs", nargs="+", default=DEFAULT_CONFIGS, help="Ex: flat ivf_flat:nprobe=8 hnsw:ef_search=64")
+    parser.add_argument("--json", help="Arquivo onde salvar os resultados em JSON.")
+    args = parser.parse_args(argv)
+
+    if args.knowledge_dir:
+        vectors, queries = knowledge_corpus(args.knowledge_dir, args.queries, args.model)
+    else:
+        vectors, queries = synthetic_corpus(args.synthetic, args.dim, args.queries)
+    print(f"Corpus: {vectors.shape[0]} vetores de dimensão {vectors.shape[1]}, {len(queries)} consultas, k={args.k}")
+
+    nlist = args.nlist or max(1, int(4 * np.sqrt(len(vectors))))
+    base = IndexConfig(nlist=nlist, train_sample=min(len(vectors), max(50_000, nlist * 39)))
+
+    exact_config = replace(base, kind="flat", metric=args.metric)
+    exact = build_index(exact_config, [vectors])
+    _, truth = exact.search(exact_config.prepare(queries), args.k)
+
+    results = []
+    print(f"{'índice':<28}{'recall@k':>10}{'p50 ms':>10}{'p95 ms':>10}{'lote q/s':>12}{'build s':>10}")
+    for spec in args.configs:
+        config = parse_config(spec, args.metric, base)
+        result = run_config(config, vectors, queries, truth, args.k)
+        result["spec"] = spec
+        results.append(result)
+        print(
+            f"{spec:<28}{result['recall_at_k']:>10.3f}{result['latency_ms_p50']:>10.3f}"
+            f"{result['latency_ms_p95']:>10.3f}{result['batch_qps'] or 0:>12.0f}{result['build_seconds']:>10.2f}"
+        )
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"corpus_size": int(vectors.shape[0]), "dimension": int(vectors.shape[1]), "k": args.k, "results": results}, f, indent=2)
+        print(f"Resultados salvos em {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+"""
+Benchmark de inicialização: mede, em processos Python novos, o tempo para importar os
+módulos do agente e para criar um Agent / SessionManager, e quais dependências pesadas
+(torch, sentence_transformers, faiss, openai...) foram carregadas no caminho.
+
+Cada alvo roda `--repeats` vezes com `python -X importtime`; o resultado traz a mediana
+e o máximo do tempo medido dentro do processo e os imports mais caros (tempo acumulado).
+
+Alvos:
+    main             import agent_src.main
+    session_manager  import agent_src.session_manager
+    agent            Agent() (sem usar a base de conhecimento)
+    manager          SessionManager()
+    app              import app (requer gradio; o aquecimento da KB roda em segundo plano)
+
+Uso:
+    python -m benchmarks.startup_benchmark --json startup.json
+    python -m benchmarks.startup_benchmark --targets main agent --repeats 10
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Dependências cuja presença em sys.modules indica que a inicialização não ficou leve.
+HEAVY_MODULES = ("torch", "sentence_transformers", "transformers", "faiss", "openai", "httpx", "websockets")
+TARGETS = {
+    "main": "import agent_src.main",
+    "session_manager": "import agent_src.session_manager",
+    "agent": "from agent_src.main import Agent\nAgent()",
+    "manager": "from agent_src.session_manager import SessionManager\nSessionManager()",
+    "app": "import app",
+}
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+{code}
+seconds = time.perf_counter() - t0
+print(json.dumps({{"seconds": seconds, "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def parse_importtime(stderr: str, top: int) -> List[Dict]:
+    """Os `top` módulos com maior tempo acumulado na saída de `-X importtime`."""
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if cumulative.strip().isdigit():
+            imports.append({"module": name.strip(), "cumulative_ms": int(cumulative) / 1000})
+    return sorted(imports, key=lambda item: item["cumulative_ms"], reverse=True)[:top]
+
+
+def measure(target: str, repeats: int, top: int = 10) -> Dict:
+    code = _PROBE.format(code=TARGETS[target], heavy=HEAVY_MODULES)
+    seconds, heavy, imports = [], [], []
+    for _ in range(repeats):
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=ROOT,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            error = proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else f"código {proc.returncode}"
+            return {"target": target, "error": error}
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        seconds.append(result["seconds"])
+        heavy = result["heavy"]
+        imports = parse_importtime(proc.stderr, top)
+    return {
+        "target": target,
+        "repeats": repeats,
+        "seconds_median": statistics.median(seconds),
+        "seconds_max": max(seconds),
+        "heavy_modules": heavy,
+        "top_imports": imports,
+    }
+
+
+def main(argv: List[str] = None) -> List[Dict]:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    parser.add_argument("--repeats", type=int, default=5, help="Processos novos por alvo.")
+    parser.add_argument("--top", type=int, default=10, help="Imports mais caros listados por alvo.")
+    parser.add_argument("--json", help="Arquivo onde salvar os resultados em JSON.")
+    args = parser.parse_args(argv)
+
+    results = []
+    for target in args.targets:
+        result = measure(target, args.repeats, args.top)
+        results.append(result)
+        if "error" in result:
+            print(f"{target:<16}erro: {result['error']}")
+            continue
+        slowest = ", ".join(f"{i['module']} {i['cumulative_ms']:.0f}ms" for i in result["top_imports"][:3])
+        print(
+            f"{target:<16}mediana={result['seconds_median'] * 1000:8.1f}ms máx={result['seconds_max'] * 1000:8.1f}ms "
+            f"pesados={result['heavy_modules'] or '-'}  [{slowest}]"
+        )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"python": sys.version.split()[0], "results": results}, f, indent=2)
+        print(f"Resultados salvos em {args.json}")
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,10 @@
+import pytest_asyncio
+
+from benchmarks.fake_services import FakeKernelGateway
+
+
+@pytest_asyncio.fixture
+async def fake_kernel():
+    """Kernel Gateway local (o mesmo substituto do benchmark), no event loop do teste."""
+    async with FakeKernelGateway() as fake:
+        yield fake
@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+from agent_src.main import Agent, format_observation
+from agent_src.workspace_index import WorkspaceIndex
+from benchmarks.fake_services import FakeStream
+
+
+class ScriptedClient:
+    """Cliente LLM falso que responde, em ordem, com os textos dados."""
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.requests = []
+
+    @property
+    def chat(self):
+        return self
+
+    @property
+    def completions(self):
+        return self
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs["messages"])
+        return FakeStream([self.responses.pop(0)])
+
+
+class SlowWriteKernel:
+    """Kernel falso em que a gravação do plano só termina quando `release` é sinalizado."""
+    def __init__(self, write_result=("", "")):
+        self.write_result = write_result
+        self.release = asyncio.Event()
+        self.executed = []
+
+    async def execute_code(self, code, timeout=None):
+        self.executed.append(code)
+        if "todo.md" in code:
+            await self.release.wait()
+            return self.write_result
+        return "TASK_COMPLETE\n", ""
+
+
+def make_agent(client, kernel):
+    agent = Agent(llm_client=client)
+    agent.executor = kernel
+    return agent
+
+
+@pytest.mark.asyncio
+async def test_plan_write_overlaps_first_llm_call():
+    client = ScriptedClient(["- [ ] Passo 1", '```python\nprint("TASK_COMPLETE")\n```'])
+    kernel = SlowWriteKernel()
+    agent = make_agent(client, kernel)
+    run = asyncio.create_task(agent._run_loop("tarefa"))
+    while len(client.requests) < 2:
+        await asyncio.sleep(0.01)
+    # O LLM já recebeu o pedido da próxima ação enquanto o plano ainda está sendo gravado.
+    assert not run.done() and len(kernel.executed) == 1
+    kernel.release.set()
+    await run
+
+    assert len(client.requests) == 2
+    assert client.requests[1][-1]["content"] == format_observation("", "")
+    assert kernel.executed[-1] == 'print("TASK_COMPLETE")'
+
+
+@pytest.mark.asyncio
+async def test_llm_call_is_redone_when_plan_write_fails():
+    client = ScriptedClient(["- [ ] Passo 1", "```python\nprint(1)\n```", '```python\nprint("TASK_COMPLETE")\n```'])
+    kernel = SlowWriteKernel(write_result=("", "PermissionError: workspace"))
+    kernel.release.set()
+    agent = make_agent(client, kernel)
+    await agent._run_loop("tarefa")
+
+    assert len(client.requests) == 3
+    assert "PermissionError" in client.requests[2][-1]["content"]
+    # A ação gerada com a observação antecipada é descartada.
+    assert kernel.executed[1:] == ['print("TASK_COMPLETE")']
+    assert [m["role"] for m in agent.event_stream[-4:]] == ["assistant", "user", "assistant", "user"]
+
+
+@pytest.mark.asyncio
+async def test_observations_summarize_workspace_changes(tmp_path):
+    # Sem um índice explícito (enraizado no diretório da sessão), o agente não olha o workspace compartilhado.
+    assert Agent(llm_client=object()).workspace is None
+    session_dir, other_dir = tmp_path / "sessao", tmp_path / "outra"
+    session_dir.mkdir()
+    other_dir.mkdir()
+
+    class WritingKernel:
+        async def execute_code(self, code, timeout=None):
+            if "todo.md" in code:
+                (session_dir / "todo.md").write_text("- [ ] Passo 1\n", encoding="utf-8")
+            elif "resultado" in code:
+                (session_dir / "resultado.csv").write_text("a,b\n1,2\n", encoding="utf-8")
+                # Uma sessão vizinha grava no mesmo workspace ao mesmo tempo.
+                (other_dir / "todo.md").write_text("- [ ] Outro plano\n", encoding="utf-8")
+            return "", ""
+
+    client = ScriptedClient([
+        "- [ ] Passo 1",
+        '```python\nopen("resultado.csv", "w").write("a,b")\n```',
+        '```python\nprint("TASK_COMPLETE")\n```',
+    ])
+    agent = Agent(llm_client=client, workspace=WorkspaceIndex(str(session_dir)))
+    agent.executor = WritingKernel()
+    await agent._run_loop("tarefa")
+
+    # A gravação do plano não aparece como mudança; o arquivo criado depois, sim, com o conteúdo.
+    assert client.requests[1][-1]["content"] == format_observation("", "")
+    assert client.requests[2][-1]["content"].endswith("+ resultado.csv (novo, 8 B)\n    +a,b\n    +1,2")
+    assert await agent._read_todo() == "- [ ] Passo 1\n"
+
+
+@pytest.mark.asyncio
+async def test_repeated_truncated_error_is_detected_despite_spill_paths(tmp_path):
+    from agent_src.jupyter_client import JupyterClient
+    from agent_src.main import REPEATED_ERROR_NOTICE
+
+    capture = JupyterClient(max_output_bytes=200, max_output_lines=5, spill_dir=str(tmp_path), spill_kernel_dir=None)
+
+    class FailingKernel:
+        async def execute_code(self, code, timeout=None):
+            if "todo.md" in code:
+                return "", ""
+            stderr = capture._new_capture("stderr")
+            stderr.write("Traceback\n" + "linha\n" * 50 + "ValueError: falhou\n")
+            stderr.close()
+            return "", stderr.getvalue()
+
+    failing = '```python\nfalhar()\n```'
+    client = ScriptedClient(["- [ ] Passo 1", failing, failing, failing, '```python\nprint("TASK_COMPLETE")\n```'])
+    agent = Agent(llm_client=client, workspace=WorkspaceIndex(str(tmp_path / "workspace")))
+    agent.executor = FailingKernel()
+    await agent._run_loop("tarefa")
+
+    observations = [request[-1]["content"] for request in client.requests[2:]]
+    # Cada saída truncada aponta para um arquivo diferente, mas o erro é o mesmo.
+    assert len({o.split("salva em")[1] for o in observations}) == 3
+    assert [REPEATED_ERROR_NOTICE in o for o in observations] == [False, False, True]
+
+
+@pytest.mark.asyncio
+async def test_leased_kernel_enters_the_session_workdir(fake_kernel):
+    from agent_src.kernel_pool import KernelPool
+
+    pool = KernelPool(gateway_url=fake_kernel.url, min_idle=0, max_size=1, preload_code=None)
+    agent = Agent(llm_client=object(), kernel_pool=pool, workdir="/home/jovyan/work/sessao-1")
+    try:
+        async with agent._kernel_session():
+            assert fake_kernel.executed == [
+                "import os\nos.makedirs('/home/jovyan/work/sessao-1', exist_ok=True)\nos.chdir('/home/jovyan/work/sessao-1')"
+            ]
+    finally:
+        await pool.close()
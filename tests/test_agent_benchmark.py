@@ -0,0 +1,17 @@
+from benchmarks.agent_benchmark import main
+
+
+def test_offline_benchmark_runs_every_scenario(tmp_path):
+    output = tmp_path / "resultados.json"
+    results = main([
+        "--concurrency", "2", "--turns", "2", "--tasks", "2", "--executions", "10",
+        "--corpus-sizes", "10", "--queries", "5", "--json", str(output),
+    ])
+    assert [r["scenario"] for r in results] == ["kernel", "kb", "agent"]
+    agent = results[-1]
+    assert agent["failed"] == 0 and agent["count"] == 2
+    # Por tarefa: plano + 2 turnos + TASK_COMPLETE no LLM; escrita do todo, 2 turnos e TASK_COMPLETE no kernel.
+    assert agent["llm_requests"] == 2 * 4
+    assert agent["kernel_executions"] >= 2 * 4
+    assert all(r["latency_ms_p95"] >= r["latency_ms_p50"] > 0 and r["peak_rss_mb"] > 0 for r in results)
+    assert output.exists()
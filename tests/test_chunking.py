@@ -0,0 +1,46 @@
+from agent_src.chunking import batched, chunk_text
+
+
+def test_token_windows_overlap_and_keep_offsets():
+    text = " ".join(f"t{i}" for i in range(10))
+    chunks = list(chunk_text(text, "doc.txt", chunk_size=4, overlap=1))
+    assert [c.text for c in chunks] == ["t0 t1 t2 t3", "t3 t4 t5 t6", "t6 t7 t8 t9"]
+    for chunk in chunks:
+        assert text[chunk.start:chunk.end] == chunk.text
+        assert chunk.source == "doc.txt"
+
+
+def test_sentence_windows_keep_whole_sentences():
+    text = "Um dois três. Quatro cinco. Seis sete oito! Nove dez."
+    chunks = list(chunk_text(text, "doc.txt", chunk_size=5, overlap=2, strategy="sentences"))
+    assert [c.text for c in chunks] == [
+        "Um dois três. Quatro cinco.",
+        "Quatro cinco. Seis sete oito!",
+        "Nove dez.",
+    ]
+
+
+def test_long_sentence_is_split_into_pieces_of_chunk_size():
+    text = "Curta. " + " ".join(f"p{i}" for i in range(12)) + "."
+    chunks = list(chunk_text(text, "doc.txt", chunk_size=5, overlap=0, strategy="sentences"))
+    assert [c.text for c in chunks] == ["Curta.", "p0 p1 p2 p3 p4", "p5 p6 p7 p8 p9", "p10 p11."]
+    for chunk in chunks:
+        assert text[chunk.start:chunk.end] == chunk.text
+
+
+def test_chunks_over_the_model_limit_are_split():
+    text = " ".join(f"palavra{i}" for i in range(10))
+    # Tokenizador que quebra cada palavra em dois tokens: 10 palavras = 20 tokens.
+    count = lambda chunk: 2 * len(chunk.split())
+    chunks = list(chunk_text(text, "doc.txt", chunk_size=10, overlap=2, count_tokens=count, max_tokens=6))
+    assert all(count(c.text) <= 6 for c in chunks)
+    assert " ".join(c.text for c in chunks) == text
+    for chunk in chunks:
+        assert text[chunk.start:chunk.end] == chunk.text
+
+
+def test_batched_does_not_materialize_the_input():
+    def numbers():
+        yield from range(5)
+
+    assert list(batched(numbers(), 2)) == [[0, 1], [2, 3], [4]]
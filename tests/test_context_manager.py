@@ -0,0 +1,81 @@
+from agent_src.context_manager import SUMMARY_HEADER, ContextManager, PrefixTracker, TokenCounter, render_prompt
+from agent_src.main import format_observation, format_task_message
+
+
+def make_history(turns, stderr="", stdout_size=200):
+    messages = [
+        {"role": "system", "content": "prompt do sistema"},
+        {"role": "user", "content": "O objetivo é: testar."},
+    ]
+    for i in range(turns):
+        messages.append({"role": "assistant", "content": f"```python\nprint({i})\n```"})
+        observation = f"STDOUT:\n{i}\n{'x' * stdout_size}\n\nSTDERR:\n{stderr}"
+        messages.append({"role": "user", "content": f"Resultado da execução:\n{observation}"})
+    return messages
+
+
+def test_history_within_budget_is_sent_unchanged():
+    manager = ContextManager(budget=4000, counter=TokenCounter(tokenizer_path=None))
+    messages = make_history(3)
+    assert manager.compact(messages) == messages
+    assert manager.folded_turns == 0
+
+
+def test_old_turns_are_folded_and_prefix_stays_stable():
+    counter = TokenCounter(tokenizer_path=None)
+    manager = ContextManager(budget=600, keep_last_turns=2, counter=counter)
+    manager.todo = "- [x] Passo 1\n- [ ] Passo 2"
+    messages = make_history(12)
+
+    compacted = manager.compact(messages)
+    assert counter.count_messages(compacted) <= 600
+    assert compacted[0] == messages[0]
+    assert SUMMARY_HEADER in compacted[1]["content"]
+    assert "Passo 2" in compacted[1]["content"]
+    # Os ciclos mais recentes seguem na íntegra e a alternância user/assistant é preservada.
+    assert compacted[-2:] == messages[-2:]
+    assert [m["role"] for m in compacted[1:]] == ["user", "assistant"] * ((len(compacted) - 2) // 2) + ["user"]
+
+    # Um ciclo novo abaixo do orçamento só acrescenta mensagens no final.
+    folded = manager.folded_turns
+    messages += make_history(1)[2:]
+    again = manager.compact(messages)
+    assert manager.folded_turns == folded
+    assert again[:len(compacted)] == compacted
+
+
+def test_repeated_errors_are_deduplicated_and_oversized_output_truncated():
+    counter = TokenCounter(tokenizer_path=None)
+    manager = ContextManager(budget=400, keep_last_turns=1, counter=counter)
+    messages = make_history(6, stderr="NameError: name 'x' is not defined", stdout_size=10)
+    messages += make_history(1, stdout_size=5000)[2:]
+
+    compacted = manager.compact(messages)
+    assert counter.count_messages(compacted) <= 400
+    assert "mesmo erro 6x" in compacted[1]["content"]
+    assert "tokens omitidos" in compacted[-1]["content"]
+
+
+def test_prefix_tracker_reports_shared_prefix_between_requests():
+    tracker = PrefixTracker(TokenCounter(tokenizer_path=None))
+    messages = make_history(2)
+    first = tracker.observe(messages)
+    assert first["shared_tokens"] == 0
+
+    second = tracker.observe(messages + make_history(1)[2:])
+    assert second["shared_chars"] == len(render_prompt(messages))
+    assert 0 < second["shared_ratio"] < 1
+
+    # Reescrever uma mensagem antiga quebra o prefixo a partir dela.
+    rewritten = [dict(m) for m in messages]
+    rewritten[1]["content"] = "outro objetivo"
+    third = tracker.observe(rewritten)
+    assert third["shared_chars"] < len(render_prompt(messages[:1])) + 10
+    assert tracker.stats()["requests"] == 3
+
+
+def test_observation_format_is_canonical():
+    noisy = format_observation("linha 1  \r\nlinha 2\r\n\n", "")
+    clean = format_observation("linha 1\nlinha 2", "")
+    assert noisy == clean
+    assert format_task_message("x", "- fato").startswith("[CONTEXTO DA BASE DE CONHECIMENTO]\n- fato")
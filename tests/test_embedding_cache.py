@@ -0,0 +1,31 @@
+import os
+
+import numpy as np
+
+from agent_src.embedding_cache import EmbeddingCache
+
+
+def test_flush_moves_new_vectors_to_disk_and_save_writes_in_blocks(tmp_path):
+    cache = EmbeddingCache(str(tmp_path))
+    vectors = {f"k{i}": np.full(4, i, dtype="float32") for i in range(10)}
+    for start in (0, 5):
+        for key in list(vectors)[start:start + 5]:
+            cache.put(key, vectors[key])
+        cache.flush()
+        # Depois de cada lote, nada fica acumulado em memória.
+        assert cache._new == {}
+    assert len(cache) == 10 and os.path.exists(cache.pending_path)
+    assert np.array_equal(cache.get("k7"), vectors["k7"])
+
+    cache.save(keep=[f"k{i}" for i in range(1, 10)], block_size=3)
+    assert not os.path.exists(cache.pending_path)
+
+    reloaded = EmbeddingCache(str(tmp_path))
+    assert len(reloaded) == 9 and "k0" not in reloaded
+    assert all(np.array_equal(reloaded.get(key), vectors[key]) for key in list(vectors)[1:])
+
+    # Vetores novos somados aos já salvos (memory-map) em um novo save.
+    reloaded.put("k10", np.full(4, 10, dtype="float32"))
+    reloaded.save()
+    again = EmbeddingCache(str(tmp_path))
+    assert len(again) == 10 and again.get("k10")[0] == 10 and again.get("k3")[0] == 3
@@ -0,0 +1,28 @@
+import asyncio
+
+import pytest
+
+from agent_src.events import EventChannel, format_event
+
+
+@pytest.mark.asyncio
+async def test_batches_group_events_by_interval_and_end_on_close():
+    channel = EventChannel()
+
+    async def produce():
+        for i in range(20):
+            channel.emit("llm_token", str(i))
+            await asyncio.sleep(0.005)
+        channel.emit("complete", "fim")
+        channel.close()
+        channel.emit("log", "ignorado")
+
+    producer = asyncio.create_task(produce())
+    batches = [batch async for batch in channel.batches(0.05)]
+    await producer
+
+    events = [event for batch in batches for event in batch]
+    assert [e.text for e in events] == [str(i) for i in range(20)] + ["fim"]
+    # Os 21 eventos chegam em bem menos atualizações da UI.
+    assert 1 < len(batches) < 10
+    assert "".join(format_event(e) for e in events[:3]) == "012"
@@ -0,0 +1,133 @@
+import asyncio
+
+import pytest
+
+from agent_src.jupyter_client import JupyterClient
+
+
+@pytest.fixture
+def client(fake_kernel):
+    jupyter_client = JupyterClient(gateway_url=fake_kernel.url)
+    jupyter_client.kernel_id = "fake-kernel"
+    return jupyter_client
+
+
+@pytest.mark.asyncio
+async def test_execute_code_reuses_single_channel(fake_kernel, client):
+    try:
+        for i in range(3):
+            stdout, stderr = await client.execute_code(f"print({i})")
+            assert stdout == f"print({i})"
+            assert stderr == ""
+        assert fake_kernel.connections == 1
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_are_routed_by_msg_id(fake_kernel, client):
+    try:
+        results = await asyncio.gather(
+            client.execute_code("sleep 0.1"),
+            client.execute_code("raise"),
+            client.execute_code("print('c')"),
+        )
+        assert results[0] == ("sleep 0.1", "")
+        assert results[1] == ("", "ValueError: boom")
+        assert results[2] == ("print('c')", "")
+        assert fake_kernel.connections == 1
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_channel_reconnects_after_drop(fake_kernel, client):
+    try:
+        await client.execute_code("print(1)")
+        await client._websocket.close()
+        stdout, _ = await client.execute_code("print(2)")
+        assert stdout == "print(2)"
+        assert fake_kernel.connections == 2
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_execute_stream_yields_typed_events(client):
+    try:
+        events = [event async for event in client.execute_stream("result 42")]
+        assert [event.type for event in events] == ["status", "execute_result", "status"]
+        assert events[1].text == "42"
+        assert events[1].data == {"text/plain": "42"}
+        assert events[-1].text == "idle"
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_execute_stream_interrupts_kernel_after_deadline(fake_kernel, client, monkeypatch):
+    monkeypatch.setattr(client, "interrupt_kernel", fake_kernel.interrupt)
+    try:
+        events = [event async for event in client.execute_stream("sleep 5", timeout=0.1, idle_timeout=None)]
+        assert [event.type for event in events] == ["status", "timeout", "error", "status"]
+        assert events[2].text == "KeyboardInterrupt: "
+
+        stdout, stderr = await client.execute_code("sleep 5", timeout=0.1)
+        assert stdout == ""
+        assert stderr.startswith("TimeoutError:")
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_execute_many_pipelines_cells_and_stops_on_error(fake_kernel, client):
+    try:
+        results = await client.execute_many(["print(1)", "result 2", "print(3)"])
+        assert results == [("print(1)", ""), ("", ""), ("print(3)", "")]
+
+        results = await client.execute_many(["print('a')", "raise", "print('b')", "print('c')"])
+        assert results == [("print('a')", ""), ("", "ValueError: boom")]
+        assert fake_kernel.aborted == ["print('b')", "print('c')"]
+        # As células abortadas já foram descartadas: a próxima execução roda normalmente.
+        assert await client.execute_code("print('d')") == ("print('d')", "")
+        assert fake_kernel.connections == 1
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_pending_requests_fail_when_reconnect_gives_up(fake_kernel, client, monkeypatch):
+    reconnect = client._reconnect
+    monkeypatch.setattr(client, "_reconnect", lambda stale: reconnect(stale, attempts=2, delay=0.01))
+    try:
+        running = asyncio.create_task(client.execute_code("sleep 30"))
+        while not fake_kernel.executed:
+            await asyncio.sleep(0.01)
+        # O gateway sai do ar: a execução em andamento falha em vez de esperar o timeout.
+        fake_kernel.server.close()
+        fake_kernel.interrupt()
+        await fake_kernel.server.wait_closed()
+        with pytest.raises(ConnectionError):
+            await asyncio.wait_for(running, timeout=5)
+        assert client._pending == {}
+    finally:
+        await client.close()
+
+
+@pytest.mark.asyncio
+async def test_kernel_lifecycle_over_the_rest_api(fake_kernel):
+    jupyter_client = JupyterClient(gateway_url=fake_kernel.url)
+    # As chamadas REST são síncronas: rodam em thread, enquanto o gateway atende no loop.
+    kernel_id = await asyncio.to_thread(jupyter_client.start_kernel)
+    assert fake_kernel.kernels == {kernel_id}
+    try:
+        running = asyncio.create_task(jupyter_client.execute_code("sleep 30"))
+        while not fake_kernel.executed:
+            await asyncio.sleep(0.01)
+        await asyncio.to_thread(jupyter_client.interrupt_kernel)
+        _, stderr = await asyncio.wait_for(running, timeout=5)
+        assert stderr.startswith("KeyboardInterrupt")
+    finally:
+        await jupyter_client.close()
+    await asyncio.to_thread(jupyter_client.shutdown_kernel)
+    assert fake_kernel.kernels == set() and jupyter_client.kernel_id is None
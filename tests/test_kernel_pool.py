@@ -0,0 +1,87 @@
+import asyncio
+import itertools
+
+import pytest
+
+from agent_src.jupyter_client import JupyterClient
+from agent_src.kernel_pool import KernelPool
+
+
+@pytest.fixture
+def fake_gateway(monkeypatch):
+    """Substitui as chamadas REST de ciclo de vida do kernel e registra os desligamentos."""
+    ids = itertools.count()
+    shut_down = []
+
+    def start_kernel(self):
+        self.kernel_id = f"kernel-{next(ids)}"
+        return self.kernel_id
+
+    def shutdown_kernel(self):
+        shut_down.append(self.kernel_id)
+        self.kernel_id = None
+
+    monkeypatch.setattr(JupyterClient, "start_kernel", start_kernel)
+    monkeypatch.setattr(JupyterClient, "shutdown_kernel", shutdown_kernel)
+    return shut_down
+
+
+@pytest.mark.asyncio
+async def test_pool_warms_kernels_with_preload(fake_kernel, fake_gateway):
+    pool = KernelPool(gateway_url=fake_kernel.url, min_idle=2, max_size=4, preload_code="import math")
+    await pool.start()
+    try:
+        assert pool.idle_count == 2
+        assert fake_kernel.executed == ["import math", "import math"]
+
+        async with pool.lease() as client:
+            stdout, _ = await client.execute_code("print(1)")
+            assert stdout == "print(1)"
+        # O kernel devolvido é resetado e volta para a fila de ociosos.
+        # Em células separadas, enviadas em lote (o reabastecimento pode intercalar outro preload).
+        reset = fake_kernel.executed.index("%reset -f")
+        assert "import math" in fake_kernel.executed[reset + 1:]
+        await asyncio.sleep(0.05)
+        assert pool.size == pool.idle_count == 3
+        assert fake_kernel.executed.count("import math") == 4
+    finally:
+        await pool.close()
+    assert len(fake_gateway) == 3
+
+
+@pytest.mark.asyncio
+async def test_pool_respects_max_size(fake_kernel, fake_gateway):
+    pool = KernelPool(gateway_url=fake_kernel.url, min_idle=0, max_size=1, preload_code=None)
+    order = []
+
+    async def task(name):
+        async with pool.lease():
+            order.append(f"{name}-in")
+            await asyncio.sleep(0.05)
+            order.append(f"{name}-out")
+
+    try:
+        await asyncio.gather(task("a"), task("b"))
+        assert order == ["a-in", "a-out", "b-in", "b-out"]
+        assert pool.size == 1
+    finally:
+        await pool.close()
+
+
+@pytest.mark.asyncio
+async def test_pool_discards_kernel_after_failure_and_evicts_expired(fake_kernel, fake_gateway):
+    pool = KernelPool(gateway_url=fake_kernel.url, min_idle=0, max_size=2, idle_ttl=0.0, preload_code=None)
+    try:
+        with pytest.raises(RuntimeError):
+            async with pool.lease():
+                raise RuntimeError("falha na tarefa")
+        assert fake_gateway == ["kernel-0"]
+
+        async with pool.lease():
+            pass
+        await asyncio.sleep(0.01)
+        await pool._evict_expired()
+        assert pool.size == 0
+        assert fake_gateway == ["kernel-0", "kernel-1"]
+    finally:
+        await pool.close()
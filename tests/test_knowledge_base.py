@@ -0,0 +1,254 @@
+import hashlib
+import os
+import time
+
+import faiss
+import pytest
+
+from agent_src.index_factory import IndexConfig
+from agent_src.knowledge_base import KnowledgeBase
+from benchmarks.fake_services import HashingEncoder
+
+
+@pytest.fixture
+def knowledge_dir(tmp_path):
+    directory = tmp_path / "knowledge"
+    directory.mkdir()
+    (directory / "ia.txt").write_text("Inteligência artificial é a simulação da inteligência humana.", encoding="utf-8")
+    (directory / "python.txt").write_text("Python é uma linguagem de programação.", encoding="utf-8")
+    return directory
+
+
+def test_knowledge_base_loads_lazily_and_warms_up_in_background(knowledge_dir):
+    encoder = HashingEncoder(dimension=16)
+    kb = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=encoder)
+    # Criar a base não lê nem codifica nada.
+    assert not kb.loaded and encoder.encoded == []
+    assert not (knowledge_dir / ".kb_cache").exists()
+    kb.warm_up().join(timeout=10)
+    assert kb.loaded and len(encoder.encoded) == 2
+
+    # Uma segunda instância sobre o mesmo cache carrega o índice salvo na primeira busca.
+    encoder = HashingEncoder(dimension=16)
+    reloaded = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=encoder)
+    (result,) = reloaded.search("Python é uma linguagem de programação.", k=1)
+    assert result.source == "python.txt"
+    assert reloaded.loaded and encoder.encoded == ["Python é uma linguagem de programação."]
+    # E o aquecimento de uma base já carregada retorna de imediato.
+    reloaded.warm_up().join(timeout=10)
+    assert reloaded.index.ntotal == 2
+
+
+def test_index_is_loaded_from_cache_when_nothing_changed(knowledge_dir):
+    first = HashingEncoder(dimension=16)
+    kb = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=first)
+    assert kb.index.ntotal == 2
+    assert len(first.encoded) == 2
+
+    second = HashingEncoder(dimension=16)
+    kb = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=second)
+    assert kb.index.ntotal == 2
+    assert second.encoded == []
+    # O codificador falso é determinístico: o próprio texto é o vizinho mais próximo.
+    (result,) = kb.search("Python é uma linguagem de programação.", k=1)
+    assert result.text == "Python é uma linguagem de programação."
+    assert result.provenance == "python.txt:0-38"
+
+
+def test_only_new_or_changed_files_are_reencoded(knowledge_dir):
+    KnowledgeBase(knowledge_dir=str(knowledge_dir), model=HashingEncoder(dimension=16), lazy=False)
+
+    (knowledge_dir / "python.txt").write_text("Python é uma linguagem interpretada.", encoding="utf-8")
+    (knowledge_dir / "faiss.txt").write_text("FAISS faz busca por similaridade.", encoding="utf-8")
+    os.remove(knowledge_dir / "ia.txt")
+
+    encoder = HashingEncoder(dimension=16)
+    kb = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=encoder, lazy=False)
+    assert sorted(encoder.encoded) == ["FAISS faz busca por similaridade.", "Python é uma linguagem interpretada."]
+    assert kb.index.ntotal == 2
+    # O embedding do arquivo apagado foi descartado do cache.
+    keys = (knowledge_dir / ".kb_cache" / "embeddings.keys.json").read_text(encoding="utf-8")
+    assert hashlib.sha256("Inteligência artificial é a simulação da inteligência humana.".encode("utf-8")).hexdigest() not in keys
+
+
+def test_ingestion_is_chunked_and_encoded_in_fixed_size_batches(tmp_path):
+    knowledge_dir = tmp_path / "knowledge"
+    knowledge_dir.mkdir()
+    words = [f"palavra{i}" for i in range(50)]
+    (knowledge_dir / "longo.txt").write_text(" ".join(words), encoding="utf-8")
+
+    encoder = HashingEncoder(dimension=16)
+    kb = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=encoder, chunk_size=10, chunk_overlap=2, batch_size=2)
+    assert kb.index.ntotal == len(kb.documents) == 6
+    assert max(encoder.calls) <= 2
+    assert kb.documents[1].text.split()[:2] == ["palavra8", "palavra9"]
+
+    (result,) = kb.search(kb.documents[3].text, k=1)
+    assert result.source == "longo.txt"
+    assert result.text == " ".join(words)[result.start:result.end]
+
+
+@pytest.mark.parametrize("kind", ["ivf_flat", "hnsw"])
+def test_approximate_index_types_with_inner_product(tmp_path, kind):
+    knowledge_dir = tmp_path / "knowledge"
+    knowledge_dir.mkdir()
+    for i in range(100):
+        (knowledge_dir / f"doc{i}.txt").write_text(f"documento número {i}", encoding="utf-8")
+
+    config = IndexConfig(kind=kind, metric="ip", nlist=64, nprobe=4, train_sample=50)
+    kb = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=HashingEncoder(dimension=16), batch_size=16, index_config=config)
+    assert kb.index.ntotal == 100
+
+    (result,) = kb.search("documento número 42", k=1)
+    assert result.source == "doc42.txt"
+    assert result.score == pytest.approx(1.0, abs=1e-5)
+
+    # O índice recarregado do cache recebe de novo os parâmetros de busca.
+    reloaded = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=HashingEncoder(dimension=16), index_config=config)
+    inner = faiss.downcast_index(reloaded.index.index)
+    if kind == "ivf_flat":
+        assert inner.nprobe == 4
+    else:
+        assert inner.hnsw.efSearch == config.ef_search
+
+
+def test_search_many_batches_queries_and_caches_results(knowledge_dir):
+    encoder = HashingEncoder(dimension=16)
+    kb = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=encoder, lazy=False)
+    encoder.calls.clear()
+
+    queries = ["Python é uma linguagem de programação.", "o que é IA?", "Python é uma linguagem de programação."]
+    results = kb.search_many(queries, k=1)
+    assert encoder.calls == [2]
+    assert results[0][0].source == "python.txt"
+    assert results[0] == results[2]
+
+    assert kb.search("o que é IA?", k=1) == results[1]
+    assert encoder.calls == [2]
+    # Mesmo com outro k, o embedding da consulta vem do cache.
+    kb.search("o que é IA?", k=2)
+    assert encoder.calls == [2]
+    stats = kb.cache_stats()
+    assert stats["results"]["hits"] == 1
+    assert stats["query_embeddings"]["hits"] == 1
+
+
+@pytest.mark.parametrize("kind", ["flat", "hnsw"])
+def test_refresh_applies_adds_updates_and_deletes_incrementally(knowledge_dir, kind):
+    KnowledgeBase(knowledge_dir=str(knowledge_dir), model=HashingEncoder(dimension=16), index_config=IndexConfig(kind=kind), lazy=False)
+    # Parte de um índice carregado do cache (memory-map), que não pode ser alterado no lugar.
+    encoder = HashingEncoder(dimension=16)
+    kb = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=encoder, index_config=IndexConfig(kind=kind), lazy=False)
+    old_view = kb._view
+    assert kb.refresh() is False
+
+    (knowledge_dir / "novo.txt").write_text("FAISS faz busca por similaridade.", encoding="utf-8")
+    (knowledge_dir / "python.txt").write_text("Python é uma linguagem interpretada.", encoding="utf-8")
+    os.remove(knowledge_dir / "ia.txt")
+    encoder.encoded.clear()
+
+    assert kb.refresh() is True
+    assert sorted(encoder.encoded) == ["FAISS faz busca por similaridade.", "Python é uma linguagem interpretada."]
+    assert sorted(c.source for c in kb.documents) == ["novo.txt", "python.txt"]
+    assert kb.index.ntotal == 2
+    # O snapshot anterior continua intacto para buscas que já estavam em andamento.
+    assert old_view.index.ntotal == 2
+    assert sorted(c.source for c in old_view.chunks.values()) == ["ia.txt", "python.txt"]
+
+    (result,) = kb.search("Python é uma linguagem interpretada.", k=1)
+    assert result.source == "python.txt"
+
+    # O estado atualizado também é o que fica persistido.
+    reloaded = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=HashingEncoder(dimension=16), index_config=IndexConfig(kind=kind))
+    assert sorted(c.source for c in reloaded.documents) == ["novo.txt", "python.txt"]
+
+
+def test_watcher_picks_up_new_files(knowledge_dir):
+    kb = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=HashingEncoder(dimension=16))
+    kb.start_watching(interval=0.05)
+    try:
+        # O watcher não antecipa a carga de uma base ainda não usada.
+        time.sleep(0.2)
+        assert not kb.loaded
+        kb.load()
+        (knowledge_dir / "novo.txt").write_text("Arquivo adicionado com o processo rodando.", encoding="utf-8")
+        deadline = time.monotonic() + 5
+        while kb.index.ntotal < 3 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        assert kb.index.ntotal == 3
+    finally:
+        kb.stop_watching()
+
+
+class WordpieceEncoder(HashingEncoder):
+    """Codificador com tokenizador e limite de sequência, como um SentenceTransformer."""
+    max_seq_length = 10
+
+    @property
+    def tokenizer(self):
+        return self
+
+    def tokenize(self, text):
+        # Duas "wordpieces" por palavra.
+        return [piece for word in text.split() for piece in (word[:2], f"##{word[2:]}")]
+
+    def num_special_tokens_to_add(self):
+        return 2
+
+
+def test_chunks_never_exceed_the_model_sequence_length(knowledge_dir):
+    (knowledge_dir / "longo.txt").write_text(" ".join(f"termo{i}" for i in range(30)), encoding="utf-8")
+    encoder = WordpieceEncoder(dimension=16)
+    kb = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=encoder, chunk_size=12, chunk_overlap=2, lazy=False)
+    # 12 palavras = 24 wordpieces, bem acima do limite de 8 (10 menos [CLS] e [SEP]).
+    assert encoder.encoded and all(len(encoder.tokenize(text)) <= 8 for text in encoder.encoded)
+    longo = " ".join(c.text for c in sorted(kb.documents, key=lambda c: c.start) if c.source == "longo.txt")
+    assert all(f"termo{i}" in longo.split() for i in range(30))
+
+
+class OpaqueEncoder(HashingEncoder):
+    """Codifica cada texto como uma palavra só: os vetores não carregam nenhuma sobreposição de termos."""
+    def encode(self, texts, convert_to_tensor=False, **kwargs):
+        return super().encode([text.replace(" ", "_") for text in texts], convert_to_tensor, **kwargs)
+
+
+def test_hybrid_retrieval_finds_exact_identifiers(tmp_path):
+    knowledge_dir = tmp_path / "knowledge"
+    knowledge_dir.mkdir()
+    # Menos documentos que KB_RETRIEVAL_CANDIDATES: todos entram no ranking vetorial da fusão.
+    for i in range(15):
+        (knowledge_dir / f"doc{i}.txt").write_text(f"notas gerais sobre o módulo {i}", encoding="utf-8")
+    (knowledge_dir / "erro.txt").write_text("ValueError em parse_header quando o cabeçalho está vazio", encoding="utf-8")
+
+    query = "como corrigir ValueError em parse_header?"
+    vector = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=OpaqueEncoder(), retrieval="vector", lazy=False)
+    assert "erro.txt" not in [r.source for r in vector.search(query, k=3)]
+
+    hybrid = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=OpaqueEncoder(), retrieval="hybrid")
+    (result, *_) = hybrid.search(query, k=3)
+    assert result.source == "erro.txt"
+    assert result.lexical_score > 0 and result.fused_score is not None
+
+    # O pré-filtro lexical restringe a busca vetorial aos chunks com termos da consulta.
+    prefiltered = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=OpaqueEncoder(), retrieval="vector", lexical_prefilter=1)
+    (result,) = prefiltered.search(query, k=3)
+    assert result.source == "erro.txt" and result.score is not None
+    # Sem nenhum termo conhecido, a busca volta a ser no índice inteiro.
+    assert len(prefiltered.search("xyzzy", k=3)) == 3
+
+    # A busca só lexical não precisa do modelo de embeddings.
+    encoder = OpaqueEncoder()
+    lexical = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=encoder, retrieval="lexical")
+    assert lexical.search("parse_header", k=1)[0].source == "erro.txt"
+    assert encoder.encoded == []
+
+
+def test_lexical_index_is_rebuilt_when_missing_from_cache(knowledge_dir):
+    KnowledgeBase(knowledge_dir=str(knowledge_dir), model=HashingEncoder(dimension=16), lazy=False)
+    cache_dir = knowledge_dir / ".kb_cache"
+    (cache_dir / "lexical.json").unlink()
+
+    encoder = HashingEncoder(dimension=16)
+    reloaded = KnowledgeBase(knowledge_dir=str(knowledge_dir), model=encoder, retrieval="lexical")
+    assert reloaded.search("linguagem", k=1)[0].source == "python.txt"
+    assert (cache_dir / "lexical.json").exists() and encoder.encoded == []
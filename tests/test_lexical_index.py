@@ -0,0 +1,36 @@
+import numpy as np
+
+from agent_src.lexical_index import BM25Index, reciprocal_rank_fusion, tokenize
+
+
+def test_tokenize_keeps_identifiers_whole_and_split():
+    terms = tokenize("Erro em data_loader.py: KeyError ERR-42")
+    assert "data_loader.py" in terms and {"data", "loader", "py"} <= set(terms)
+    assert "err-42" in terms and "keyerror" in terms
+    assert tokenize("Simulação") == ["simulação"]
+
+
+def test_bm25_ranks_exact_terms_and_persists_with_mmap(tmp_path):
+    documents = [
+        (10, "o parser falha com KeyError em config.yaml"),
+        (11, "o parser lê arquivos de texto"),
+        (12, "gráficos com matplotlib"),
+    ]
+    index = BM25Index.build(documents)
+    hits = index.search("KeyError no parser", k=5)
+    assert [chunk_id for chunk_id, _ in hits] == [10, 11]
+    assert hits[0][1] > hits[1][1] > 0
+    assert index.search("inexistente", k=5) == []
+    assert len(index.search("o", k=1)) == 1
+
+    index.save(str(tmp_path))
+    loaded = BM25Index.load(str(tmp_path))
+    assert isinstance(loaded.docs, np.memmap)
+    assert loaded.search("KeyError no parser", k=5) == hits
+    assert BM25Index.load(str(tmp_path / "vazio")) is None
+
+
+def test_reciprocal_rank_fusion_rewards_agreement():
+    fused = reciprocal_rank_fusion([[1, 2, 3], [3, 1]], k=60)
+    assert [item for item, _ in fused] == [1, 3, 2]
+    assert fused[0][1] == 1 / 61 + 1 / 62
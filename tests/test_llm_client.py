@@ -0,0 +1,47 @@
+from types import SimpleNamespace
+
+import pytest
+
+from agent_src.llm_client import stream_completion
+from agent_src.main import CODE_BLOCK_RE
+from benchmarks.fake_services import FakeStream
+
+
+class FakeClient:
+    def __init__(self, deltas):
+        self.stream = FakeStream(deltas)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        return self.stream
+
+
+@pytest.mark.asyncio
+async def test_stream_stops_reading_after_code_block_closes():
+    deltas = ["```python\n", "print('oi')\n", "```", "\nTexto que", " não deveria ser gerado."]
+    client = FakeClient(deltas)
+    tokens = []
+
+    text = await stream_completion(
+        client,
+        messages=[{"role": "user", "content": "oi"}],
+        temperature=0.1,
+        stop_when=lambda t: CODE_BLOCK_RE.search(t) is not None,
+        on_token=tokens.append,
+    )
+
+    assert text == "```python\nprint('oi')\n```"
+    assert client.stream.consumed == 3
+    assert client.stream.closed
+    assert client.requests[0]["stream"] is True
+    assert tokens == deltas[:3]
+
+
+@pytest.mark.asyncio
+async def test_stream_reads_everything_without_stop_condition():
+    client = FakeClient(["- [ ] Passo 1", "\n- [ ] Passo 2"])
+    text = await stream_completion(client, messages=[], temperature=0.0)
+    assert text == "- [ ] Passo 1\n- [ ] Passo 2"
+    assert client.stream.closed
@@ -0,0 +1,46 @@
+import os
+
+from agent_src.output_capture import BoundedOutput
+
+
+def test_small_output_is_kept_verbatim(tmp_path):
+    capture = BoundedOutput("stdout", max_bytes=100, max_lines=10, spill_dir=str(tmp_path))
+    capture.write("linha 1\n")
+    capture.write("linha 2\n")
+    capture.close()
+    assert capture.getvalue() == "linha 1\nlinha 2\n"
+    assert not capture.truncated
+    assert os.listdir(tmp_path) == []
+
+
+def test_large_output_keeps_head_and_tail_and_spills(tmp_path):
+    capture = BoundedOutput(
+        "stdout", max_bytes=200, max_lines=10, spill_dir=str(tmp_path), spill_kernel_dir="/home/jovyan/work/.outputs"
+    )
+    full = "".join(f"linha {i}\n" for i in range(1000))
+    for line in full.splitlines(keepends=True):
+        capture.write(line)
+    capture.close()
+
+    value = capture.getvalue()
+    assert capture.truncated
+    assert value.startswith("linha 0\nlinha 1\n")
+    assert value.endswith("linha 998\nlinha 999\n")
+    assert "linha 500\n" not in value
+    assert "1000 linhas" in value
+    assert len(value.encode("utf-8")) < 400
+
+    (spilled,) = os.listdir(tmp_path)
+    assert capture.spill_path == f"/home/jovyan/work/.outputs/{spilled}"
+    with open(tmp_path / spilled, encoding="utf-8") as f:
+        assert f.read() == full
+
+
+def test_single_huge_chunk_is_bounded_without_spill_dir():
+    capture = BoundedOutput("stderr", max_bytes=100, max_lines=10, spill_dir=None)
+    capture.write("x" * 10_000)
+    value = capture.getvalue()
+    assert capture.spill_path is None
+    assert value.startswith("x" * 50)
+    assert value.endswith("x" * 50)
+    assert len(value) < 300
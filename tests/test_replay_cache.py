@@ -0,0 +1,67 @@
+import pytest
+
+from agent_src.llm_client import stream_completion
+from agent_src.replay_cache import CachedKernel, ReplayCache, ReplayMissError, llm_key
+from tests.test_llm_client import FakeClient
+
+
+class FakeKernel:
+    def __init__(self):
+        self.executed = []
+
+    async def execute_code(self, code, timeout=None):
+        self.executed.append(code)
+        return f"saída {len(self.executed)}", ""
+
+    async def execute_many(self, cells, timeout=None):
+        return [await self.execute_code(code) for code in cells]
+
+
+@pytest.mark.asyncio
+async def test_llm_record_then_replay(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    messages = [{"role": "user", "content": "olá"}]
+    recorder = ReplayCache(path, mode="record")
+    client = FakeClient(["```python\n", "print(1)\n", "```"])
+    recorded = await stream_completion(client, messages, temperature=0.1, cache=recorder)
+    recorder.close()
+
+    replayer = ReplayCache(path, mode="replay")
+    tokens = []
+    # Diferenças de CRLF e espaços nas bordas não mudam a chave.
+    replayed = await stream_completion(
+        None, [{"role": "user", "content": "olá\r\n"}], temperature=0.1, on_token=tokens.append, cache=replayer
+    )
+    assert replayed == recorded and tokens == [recorded]
+    with pytest.raises(ReplayMissError):
+        await stream_completion(None, messages, temperature=0.5, cache=replayer)
+
+
+@pytest.mark.asyncio
+async def test_execution_replay_depends_on_kernel_history(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    kernel = FakeKernel()
+    recording = CachedKernel(ReplayCache(path, mode="record"), kernel)
+    assert await recording.execute_code("x = 1") == ("saída 1", "")
+    assert await recording.execute_code("print(x)") == ("saída 2", "")
+    assert await recording.execute_many(["y = 2", "print(y)"]) == [("saída 3", ""), ("saída 4", "")]
+
+    replay_cache = ReplayCache(path, mode="replay")
+    replaying = CachedKernel(replay_cache)
+    assert await replaying.execute_code("x = 1") == ("saída 1", "")
+    assert await replaying.execute_code("print(x)") == ("saída 2", "")
+    assert await replaying.execute_many(["y = 2", "print(y)"]) == [("saída 3", ""), ("saída 4", "")]
+
+    # O mesmo código após outro histórico não reaproveita o resultado gravado.
+    with pytest.raises(ReplayMissError):
+        await CachedKernel(replay_cache).execute_code("print(x)")
+
+
+def test_size_based_eviction_drops_least_recently_used(tmp_path):
+    cache = ReplayCache(str(tmp_path / "cache.sqlite"), mode="record", max_bytes=250)
+    for i in range(3):
+        cache.put(f"k{i}", "llm", "x" * 100)
+    assert cache.size_bytes() <= 250
+    assert cache.get("k0") is None
+    assert cache.get("k2") is not None
+    assert llm_key([{"role": "user", "content": "a"}], "m", 0.1) != llm_key([{"role": "user", "content": "a"}], "m", 0.2)
@@ -0,0 +1,173 @@
+import asyncio
+
+import pytest
+
+from agent_src.llm_client import FairLimiter
+from agent_src.replay_cache import ReplayCache
+from agent_src.session_manager import SessionLimitError, SessionManager
+
+
+class FakeAgent:
+    """Agente que só simula uma chamada ao LLM e registra a concorrência observada."""
+    running = 0
+    peak = 0
+
+    def __init__(self, llm_limiter=None, owner=None, **kwargs):
+        self.llm_limiter = llm_limiter
+        self.owner = owner
+        self.kwargs = kwargs
+        self.closed = False
+
+    async def run(self, task):
+        FakeAgent.running += 1
+        FakeAgent.peak = max(FakeAgent.peak, FakeAgent.running)
+        try:
+            async with self.llm_limiter.slot(self.owner):
+                await asyncio.sleep(float(task))
+        finally:
+            FakeAgent.running -= 1
+
+    async def close(self):
+        self.closed = True
+
+
+class FakePool:
+    """Pool de kernels que só conta os aquecimentos."""
+    def __init__(self):
+        self.starts = 0
+
+    async def start(self):
+        self.starts += 1
+        await asyncio.sleep(0)
+
+
+def make_manager(**kwargs):
+    FakeAgent.running = FakeAgent.peak = 0
+    return SessionManager(kernel_pool=FakePool(), knowledge_base=object(), agent_factory=FakeAgent, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_sessions_run_concurrently_within_limits():
+    manager = make_manager(max_concurrent=3, max_per_user=2)
+    sessions = [manager.submit("0.05", owner=f"user{i % 3}") for i in range(6)]
+    finished = [await manager.wait(s.id) for s in sessions]
+    assert all(s.status == "done" and s.agent.closed for s in finished)
+    assert FakeAgent.peak == 3
+
+    # Um único usuário não passa de `max_per_user` sessões em execução.
+    FakeAgent.peak = 0
+    await manager.run_many(["0.02"] * 4, owner="sozinho")
+    assert FakeAgent.peak == 2
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_cancel_and_queue_backpressure():
+    manager = make_manager(max_concurrent=1, max_queued=1)
+    running = manager.submit("10")
+    await asyncio.sleep(0.01)
+    queued = manager.submit("10")
+    with pytest.raises(SessionLimitError):
+        manager.submit("10")
+
+    assert manager.cancel(queued.id)
+    assert manager.cancel(running.id)
+    assert (await manager.wait(queued.id)).status == "cancelled"
+    assert (await manager.wait(running.id)).status == "cancelled"
+    assert manager.submit("0").status == "queued"
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_fair_limiter_serves_waiting_keys_in_round_robin():
+    limiter = FairLimiter(max_concurrent=1)
+    order = []
+
+    async def request(key):
+        async with limiter.slot(key):
+            order.append(key)
+            await asyncio.sleep(0)
+
+    await limiter.acquire("bloqueio")
+    tasks = [asyncio.create_task(request(key)) for key in ["a", "a", "a", "b", "c"]]
+    await asyncio.sleep(0)
+    limiter.release()
+    await asyncio.gather(*tasks)
+    assert order == ["a", "b", "c", "a", "a"]
+    assert limiter.active == 0 and limiter.waiting == 0
+
+
+@pytest.mark.asyncio
+async def test_each_session_streams_its_own_events():
+    class EmittingAgent(FakeAgent):
+        def __init__(self, events=None, **kwargs):
+            super().__init__(**kwargs)
+            self.events = events
+
+        async def run(self, task):
+            self.events.emit("log", task)
+            await asyncio.sleep(0.01)
+
+    FakeAgent.running = FakeAgent.peak = 0
+    manager = SessionManager(kernel_pool=FakePool(), knowledge_base=object(), agent_factory=EmittingAgent)
+    first, second = manager.submit("tarefa 1"), manager.submit("tarefa 2")
+
+    for session in (first, second):
+        events = [(e.type, e.text) async for e in session.events]
+        assert events == [("status", "queued"), ("status", "running"), ("log", session.task), ("status", "done")]
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_shared_knowledge_base_is_watched_while_the_manager_runs(tmp_path):
+    from agent_src.knowledge_base import KnowledgeBase
+
+    manager = SessionManager(kernel_pool=FakePool(), llm_client=object(), agent_factory=FakeAgent)
+    assert isinstance(manager.knowledge_base, KnowledgeBase)
+    assert manager.knowledge_base._watch_thread.is_alive()
+    await manager.close()
+    assert manager.knowledge_base._watch_thread is None
+
+    # Uma base recebida de fora é responsabilidade de quem a criou.
+    external = KnowledgeBase(knowledge_dir=str(tmp_path))
+    SessionManager(kernel_pool=FakePool(), llm_client=object(), knowledge_base=external, agent_factory=FakeAgent)
+    assert external._watch_thread is None
+
+
+@pytest.mark.asyncio
+async def test_kernel_pool_is_warmed_up_once():
+    manager = make_manager()
+    await manager.start()
+    await manager.start()
+    assert manager.kernel_pool.starts == 1
+    await manager.close()
+
+    # Sem `start()` explícito, a primeira tarefa dispara o aquecimento.
+    manager = make_manager()
+    await manager.run_many(["0", "0"])
+    assert manager.kernel_pool.starts == 1
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_replay_mode_runs_without_a_kernel_pool(tmp_path):
+    cache = ReplayCache(path=str(tmp_path / "replay.sqlite"), mode="replay")
+    manager = SessionManager(knowledge_base=object(), replay_cache=cache, agent_factory=FakeAgent)
+    assert manager.kernel_pool is None
+    await manager.start()
+    session, = await manager.run_many(["0"])
+    assert session.status == "done"
+    assert session.agent.kwargs["kernel_pool"] is None
+    assert session.agent.kwargs["workspace"] is None
+    await manager.close()
+
+
+@pytest.mark.asyncio
+async def test_each_session_gets_its_own_working_directory(tmp_path):
+    manager = make_manager(workspace_dir=str(tmp_path), workspace_kernel_dir="/home/jovyan/work/")
+    first, second = await manager.run_many(["0", "0"])
+    for session in (first, second):
+        assert session.agent.kwargs["workdir"] == f"/home/jovyan/work/{session.id}"
+        assert session.agent.kwargs["workspace"].root == str(tmp_path / session.id)
+    assert first.agent.kwargs["workdir"] != second.agent.kwargs["workdir"]
+    await manager.close()
@@ -0,0 +1,12 @@
+from benchmarks.startup_benchmark import main
+
+
+def test_agent_starts_without_heavy_dependencies(tmp_path):
+    output = tmp_path / "startup.json"
+    results = main(["--targets", "main", "agent", "--repeats", "1", "--json", str(output)])
+    assert [r["target"] for r in results] == ["main", "agent"]
+    for result in results:
+        # torch/sentence_transformers, faiss e openai só são carregados quando usados.
+        assert result["heavy_modules"] == []
+        assert result["seconds_median"] > 0 and result["top_imports"]
+    assert output.exists()
@@ -0,0 +1,76 @@
+import asyncio
+import json
+import urllib.request
+
+import pytest
+
+from agent_src.lru_cache import LRUCache
+from agent_src.telemetry import JsonlExporter, MetricsRegistry, PrometheusServer, Tracer
+
+
+@pytest.mark.asyncio
+async def test_spans_nest_per_task_and_are_exported_as_jsonl(tmp_path):
+    registry = MetricsRegistry()
+    tracer = Tracer(registry)
+    exporter = JsonlExporter(str(tmp_path / "spans.jsonl"))
+    tracer.exporters.append(exporter)
+
+    async def session(name):
+        with tracer.span("agent.run", session=name):
+            for turn in range(2):
+                with tracer.span("agent.turn", turn=turn):
+                    await asyncio.sleep(0.01)
+
+    await asyncio.gather(session("a"), session("b"))
+    with pytest.raises(ZeroDivisionError):
+        with tracer.span("kernel.execute"):
+            1 / 0
+    exporter.close()
+
+    spans = [json.loads(line) for line in (tmp_path / "spans.jsonl").read_text().splitlines()]
+    runs = {s["attributes"]["session"]: s for s in spans if s["name"] == "agent.run"}
+    turns = [s for s in spans if s["name"] == "agent.turn"]
+    assert len(turns) == 4
+    # Cada turno pertence ao `agent.run` da própria sessão, mesmo com as duas rodando em paralelo.
+    for run in runs.values():
+        children = [s for s in turns if s["parent_id"] == run["span_id"]]
+        assert len(children) == 2 and all(s["trace_id"] == run["trace_id"] for s in children)
+        assert run["duration"] >= sum(s["duration"] for s in children) * 0.9
+    failed = next(s for s in spans if s["name"] == "kernel.execute")
+    assert failed["status"] == "error" and failed["parent_id"] is None
+    assert registry.histogram("agent_span_duration_seconds", "").snapshot(span="agent.turn")["count"] == 4
+
+
+def test_prometheus_endpoint_serves_counters_histograms_and_cache_hits():
+    registry = MetricsRegistry()
+    tokens = registry.counter("agent_llm_tokens_total", "Tokens.")
+    tokens.inc(120, direction="prompt")
+    tokens.inc(30, direction="completion")
+    latency = registry.histogram("agent_turn_seconds", "Turnos.", buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 2.0):
+        latency.observe(value)
+
+    server = PrometheusServer(registry, port=0).start()
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.port}/metrics") as response:
+            body = response.read().decode()
+    finally:
+        server.stop()
+
+    assert "# TYPE agent_llm_tokens_total counter" in body
+    assert 'agent_llm_tokens_total{direction="prompt"} 120.0' in body
+    assert 'agent_turn_seconds_bucket{le="0.1"} 1' in body
+    assert 'agent_turn_seconds_bucket{le="1.0"} 2' in body
+    assert 'agent_turn_seconds_bucket{le="+Inf"} 3' in body
+    assert "agent_turn_seconds_count 3" in body
+
+    # Caches com nome somam acertos e erros na métrica global do processo.
+    from agent_src.telemetry import metrics
+    requests = metrics.counter("agent_cache_requests_total", "")
+    before = requests.value(cache="teste", result="hit")
+    cache = LRUCache(name="teste")
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("b")
+    assert requests.value(cache="teste", result="hit") == before + 1
+    assert requests.value(cache="teste", result="miss") >= 1
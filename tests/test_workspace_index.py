@@ -0,0 +1,71 @@
+import os
+
+import pytest
+
+from agent_src.context_manager import _split_observation
+from agent_src.main import format_observation
+from agent_src.workspace_index import CHANGES_HEADER, WorkspaceIndex
+
+
+def test_refresh_reports_added_modified_and_removed_files(tmp_path):
+    (tmp_path / "todo.md").write_text("- [ ] Passo 1\n- [ ] Passo 2\n", encoding="utf-8")
+    (tmp_path / "velho.txt").write_text("apagar", encoding="utf-8")
+    (tmp_path / ".outputs").mkdir()
+    index = WorkspaceIndex(str(tmp_path))
+    assert index.refresh() == []
+
+    (tmp_path / "todo.md").write_text("- [x] Passo 1\n- [ ] Passo 2\n", encoding="utf-8")
+    (tmp_path / "velho.txt").unlink()
+    (tmp_path / "dados").mkdir()
+    (tmp_path / "dados" / "tabela.bin").write_bytes(b"\xff" * 5000)
+    (tmp_path / ".outputs" / "stdout.txt").write_text("ignorado", encoding="utf-8")
+    changes = index.refresh()
+    assert [(c.path, c.kind) for c in changes] == [
+        ("dados/tabela.bin", "added"), ("todo.md", "modified"), ("velho.txt", "removed"),
+    ]
+    assert changes[1].diff == "-- [ ] Passo 1\n+- [x] Passo 1"
+
+    summary = index.summarize(changes)
+    assert summary.splitlines() == [
+        CHANGES_HEADER,
+        "+ dados/tabela.bin (novo, 4.9 KB)",
+        "~ todo.md (28 B -> 28 B)",
+        "    -- [ ] Passo 1",
+        "    +- [x] Passo 1",
+        "- velho.txt (apagado)",
+    ]
+    # Nada mudou desde a última verificação.
+    assert index.refresh() == []
+
+
+def test_rewrite_with_same_content_is_not_a_change(tmp_path):
+    path = tmp_path / "a.txt"
+    path.write_text("igual", encoding="utf-8")
+    index = WorkspaceIndex(str(tmp_path))
+    index.refresh()
+    path.write_text("igual", encoding="utf-8")
+    os.utime(path, ns=(0, 0))
+    assert index.refresh() == []
+
+
+def test_summary_is_bounded(tmp_path):
+    index = WorkspaceIndex(str(tmp_path), summary_max_lines=3)
+    index.refresh()
+    (tmp_path / "longo.txt").write_text("\n".join(str(i) for i in range(10)), encoding="utf-8")
+    summary = index.summarize(index.refresh())
+    assert summary.splitlines()[-1] == "(... 9 linhas omitidas)"
+    assert len(summary.splitlines()) == 4
+
+
+def test_read_range_reads_bytes_without_leaving_the_workspace(tmp_path):
+    (tmp_path / "saida.txt").write_text("0123456789", encoding="utf-8")
+    index = WorkspaceIndex(str(tmp_path))
+    assert index.read_range("saida.txt", 3, 4) == "3456"
+    assert index.read_range("saida.txt", 8) == "89"
+    with pytest.raises(ValueError):
+        index.read_range("../fora.txt")
+
+
+def test_changes_do_not_leak_into_the_stderr_of_an_observation():
+    observation = format_observation("ok", "Erro", changes=f"{CHANGES_HEADER}\n+ a.txt (novo, 1 B)")
+    assert _split_observation(observation) == ("ok", "Erro")